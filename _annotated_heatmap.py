@@ -1,13 +1,11 @@
 from __future__ import absolute_import, division
 
-from plotly import exceptions, optional_imports
+from plotly import exceptions
 import plotly.colors as clrs
 from plotly.figure_factory import utils
 from plotly.graph_objs import graph_objs
 from plotly.validators.heatmap import ColorscaleValidator
-
-# Optional imports, may be None for users that only use our core functionality.
-np = optional_imports.get_module("numpy")
+import numpy as np
 
 
 def validate_annotated_heatmap(z, x, y, annotation_text):
@@ -266,42 +264,65 @@ class _AnnotatedHeatmap(object):
             max_text_color = black
         return min_text_color, max_text_color
 
-    def get_z_mid(self):
+    def get_z_values(self):
+        """
+        Get the z matrix as floats, with NaN for empty (None) cells
+        :rtype (ndarray) z_values: 2D float array of z
+        """
+        return np.array(self.z, dtype=float)
+
+    def get_z_mid(self, z_values=None):
         """
         Get the mid value of z matrix
         :rtype (float) z_avg: average val from z matrix
         """
-        if np and isinstance(self.z, np.ndarray):
-            z_min = np.nanmin(self.z)
-            z_max = np.nanmax(self.z)
-        else:
-            z_min = min([v for row in self.z for v in row if v is not None])
-            z_max = max([v for row in self.z for v in row if v is not None])
-        z_mid = (z_max + z_min) / 2
+        if z_values is None:
+            z_values = _AnnotatedHeatmap.get_z_values(self)
+        z_mid = (np.nanmax(z_values) + np.nanmin(z_values)) / 2
         return z_mid
 
     def make_annotations(self):
         """
-        Get annotations for each cell of the heatmap with graph_objs.Annotation
+        Get annotations for each cell of the heatmap, as the dicts a
+        graph_objs.layout.Annotation would validate to. The text and font
+        color of every cell are worked out over the whole matrix at once,
+        with empty cells masked as NaN, rather than cell by cell.
 
         :rtype (list[dict]) annotations: list of annotations for each cell of
             the heatmap
         """
         min_text_color, max_text_color = _AnnotatedHeatmap.get_text_color(self)
-        z_mid = _AnnotatedHeatmap.get_z_mid(self)
-        annotations = []
-        for n, row in enumerate(self.z):
-            for m, val in enumerate(row):
-                font_color = min_text_color if (val is None or val < z_mid) else max_text_color
-                annotations.append(
-                    graph_objs.layout.Annotation(
-                        text=str(self.annotation_text[n][m]) if val is not None else "",
-                        x=self.x[m],
-                        y=self.y[n],
-                        xref="x1",
-                        yref="y1",
-                        font=dict(color=font_color),
-                        showarrow=False,
-                    )
-                )
-        return annotations
+        z_values = _AnnotatedHeatmap.get_z_values(self)
+        z_mid = _AnnotatedHeatmap.get_z_mid(self, z_values)
+        empty = np.isnan(z_values)
+
+        # NaN compares False, so empty cells get the min color
+        with np.errstate(invalid="ignore"):
+            font_colors = np.where(z_values >= z_mid, max_text_color, min_text_color)
+        # The text is each value's str(), like the values themselves, so ints
+        # aren't shown as floats
+        text = np.empty(z_values.shape, dtype=object)
+        text[...] = self.annotation_text
+        text = np.where(empty, "", text.astype(str))
+        xs = np.empty(len(self.x), dtype=object)
+        xs[:] = list(self.x)
+        ys = np.empty(len(self.y), dtype=object)
+        ys[:] = list(self.y)
+
+        return [
+            dict(
+                text=cell_text,
+                x=x,
+                y=y,
+                xref="x",
+                yref="y",
+                font=dict(color=font_color),
+                showarrow=False,
+            )
+            for cell_text, x, y, font_color in zip(
+                text.ravel().tolist(),
+                np.tile(xs, len(ys)).tolist(),
+                np.repeat(ys, len(xs)).tolist(),
+                font_colors.ravel().tolist(),
+            )
+        ]
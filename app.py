@@ -4,253 +4,168 @@ import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_table
-from dash.dependencies import Input, Output
-
-import plotly.graph_objs as go
-import plotly.figure_factory as ff
-import _annotated_heatmap
-
-import sqlite3
-import pandas
-from datetime import datetime
-
-
-class Streak:
-    """docstring for Streak."""
-
-    def __init__(self, start, end, count):
-        self.start = start
-        self.end = end
-        self.count = count
-
-    def __repr__(self):
-        return (self.start['show_month'] + "/" + self.start['show_year']
-                + " and " + self.end['show_month'] + "/"
-                + self.end['show_year'])
-
-
-def streak_continues(last_row, current_row):
-    ly = int(last_row['show_year'])
-    lm = int(last_row['show_month'])
-    ry = int(current_row['show_year'])
-    rm = int(current_row['show_month'])
-    return (lm == rm - 1) or (lm == 12 and rm == 1 and ly == ry - 1)
-
-
-def is_streak_ongoing(streak):
-    current_month = datetime.now().month
-    current_year = datetime.now().year
-    longest_month = int(streak.end['show_month'])
-    longest_year = int(streak.end['show_year'])
-    if longest_month == current_month and longest_year == current_year:
-        return True
-    elif longest_month == (current_month - 1) and longest_year == (current_year - 1):
-        return True
-    elif longest_month == 12 and current_month == 1 and longest_year == (current_year -1):
-        return True
-    else:
-        return False
-
-
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.UNITED])
-
-conn = sqlite3.connect('thedatabase.sqlite3', check_same_thread=False)
-c = conn.cursor()
-
-worker_count_query = "SELECT Count() FROM workers"
-c.execute(worker_count_query)
-worker_count = c.fetchone()[0]
-promotion_count_query = "SELECT Count() FROM promotions"
-c.execute(promotion_count_query)
-promotion_count = c.fetchone()[0]
-show_count_query = "SELECT Count() FROM shows WHERE shows.is_partial < 2"
-c.execute(show_count_query)
-show_count = c.fetchone()[0]
-excluded_show_count_query = "SELECT Count() FROM shows WHERE shows.is_partial = 2"
-c.execute(excluded_show_count_query)
-excluded_show_count = c.fetchone()[0]
-
-appearances_df = pandas.read_sql_query('SELECT name, count(appearances.worker_id) AS \'appearances\' FROM appearances INNER JOIN workers on workers.worker_id = appearances.worker_id GROUP by appearances.worker_id  ORDER BY appearances DESC', conn)
-shows_df = pandas.read_sql_query('SELECT promotions.name, count(shows.promotion) AS \'att_shows\' FROM shows INNER JOIN promotions on promotions.promotion_id = shows.promotion GROUP by shows.promotion', conn)
-year_counter_df = pandas.read_sql_query('SELECT strftime(\'%Y\', show_date) AS show_year, count(show_id) AS show_count FROM shows GROUP BY show_year', conn)
-split_year_counter_df = pandas.read_sql_query('SELECT strftime(\'%Y\', show_date) AS show_year, promotions.name FROM shows INNER JOIN promotions on promotions.promotion_id = shows.promotion', conn)
-year_name_count_df = pandas.read_sql_query('SELECT strftime(\'%Y\', shows.show_date) AS show_year, promotions.name, count(promotions.promotion_id) AS show_count FROM shows INNER JOIN promotions on promotions.promotion_id = shows.promotion GROUP BY show_year, promotions.name', conn)
-shows_heatmap_df = pandas.read_sql_query('SELECT strftime(\'%m\', shows.show_date) AS show_month, strftime(\'%Y\', shows.show_date) AS show_year, COUNT(*) AS show_number FROM shows GROUP BY show_year, show_month ORDER BY show_year ASC, show_month ASC', conn)
-
-shows_per_year_series = []
-grouped = year_name_count_df.groupby(['name'])
-for group_name, df_group in grouped:
-    shows_per_year_series.append(
-        go.Bar(x=df_group['show_year'],
-               y=df_group['show_count'],
-               name=group_name))
-
-streaks_df = pandas.read_sql_query('SELECT strftime(\'%Y\', shows.show_date) AS show_year, strftime(\'%m\', shows.show_date) AS show_month FROM shows GROUP BY show_year, show_month ORDER BY show_year ASC, show_month ASC', conn)
-last = None
-streak_start = None
-streak_end = None
-streak_count = 1
-longest_streak = None
-for index, row in streaks_df.iterrows():
-    if streak_start is None:
-        streak_start = row
-    else:
-        if streak_continues(last, row):
-            streak_count = streak_count + 1
-        else:
-            streak_end = last
-            if longest_streak is None:
-                longest_streak = Streak(streak_start, streak_end, streak_count)
-            else:
-                if streak_count >= longest_streak.count:
-                    longest_streak = Streak(streak_start, streak_end, streak_count)
-            streak_start = row
-            streak_count = 1
-    last = row
-
-latest_streak = Streak(streak_start, last, streak_count)
-if latest_streak.count >= longest_streak.count:
-    longest_streak = latest_streak
-current_streak = is_streak_ongoing(latest_streak)
-
-streak_string =""
-if current_streak:
-    streak_string = "You're on a " + str(latest_streak.count) + " month streak of at least one show per month!"
-
-longest_streak_string = "Your longest streak was " + str(longest_streak.count) + " months of at least one show per month, between " + str(longest_streak)
-
-excluded_shows_string = ""
-if excluded_show_count > 0:
-    excluded_shows_string = "(+" + str(excluded_show_count) + " partial shows excluded from count)"
-
-top_page_size = 10
-
-
-def shows_per_year_graph():
+from dash.dependencies import Input, Output, State
+import flask
+
+import figures
+import queries
+import snapshot
+import streaks
+
+
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.UNITED], suppress_callback_exceptions=True)
+
+store = queries.DataStore('thedatabase.sqlite3')
+
+
+def page_user(pathname):
+    """
+    The user whose dashboard is at a path, /<user>, or the default user at /.
+    """
+    return (pathname or '/').strip('/') or queries.DEFAULT_USER
+
+
+def load_snapshot(user):
+    """
+    Load the user's snapshot from graps.py --snapshot, if it's up to date, the first time they're asked for since the
+    database changed. Anything that isn't in it is queried as usual.
+    """
+    return store.memoize(('snapshot', user), lambda: snapshot.load_snapshot(store, user))
+
+
+def streak_strings(user):
+    latest_streak, longest_streak = [None if streak is None else streaks.Streak(*streak)
+                                     for streak in store.latest_and_longest_streaks(user)]
+    if longest_streak is None:
+        return "", ""
+
+    streak_string =""
+    if latest_streak.is_ongoing():
+        streak_string = "You're on a " + str(latest_streak.count) + " month streak of at least one show per month!"
+
+    longest_streak_string = "Your longest streak was " + str(longest_streak.count) + " months of at least one show per month, between " + str(longest_streak)
+    return streak_string, longest_streak_string
+
+
+def excluded_shows_string(user):
+    excluded_show_count = store.excluded_show_count(user)
+    if excluded_show_count > 0:
+        return "(+" + str(excluded_show_count) + " partial shows excluded from count)"
+    return ""
+
+
+top_page_size = queries.TABLE_PAGE_SIZE
+
+
+def shows_per_year_graph(user):
     return dcc.Graph(
         id='shows-per-year',
-        figure=go.Figure(
-            data=[go.Bar(x=year_counter_df['show_year'],
-                         y=year_counter_df['show_count'])],
-            layout=go.Layout(
-                title='Shows/year'
-            )
-        )
+        figure=figures.figure(store, 'shows-per-year', user)
     )
 
 
-def shows_per_year_stacked_graph():
+def shows_per_year_stacked_graph(user):
     return dcc.Graph(
         id='shows-per-year-stacked',
-        figure=go.Figure(
-            data=shows_per_year_series,
-            layout=go.Layout(
-                title='Shows/year', barmode='stack'
-            )
-        )
+        figure=figures.figure(store, 'shows-per-year-stacked', user)
     )
 
 
-def shows_pie_chart():
+def shows_pie_chart(user):
     return dcc.Graph(
         id='shows-pie',
-        figure=go.Figure(
-            data=[go.Pie(labels=shows_df['name'],
-                         values=shows_df['att_shows'],
-                         textinfo="none")],
-            layout=go.Layout(
-                margin=dict(t=50)
-            )
-        ),
+        figure=figures.figure(store, 'shows-pie', user),
         config={
             'displayModeBar': False
         }
     )
 
 
-def appearances_pie_chart():
+def appearances_pie_chart(user):
     return dcc.Graph(
         id='appearances-pie',
-        figure=go.Figure(
-            data=[go.Pie(labels=appearances_df['name'],
-                         values=appearances_df['appearances'])],
-            layout=go.Layout(
-                title='Appearances'
-            )
-        )
+        figure=figures.figure(store, 'appearances-pie', user)
     )
 
 
-def top_wrestlers_table():
+def paged_table(table_id, columns):
+    """
+    A DataTable that's paged, sorted and filtered in SQL, by update_table.
+    :param table_id: the table's ID, a key of queries.PAGED_TABLES
+    :param columns: (column, type) pairs, type being 'text' or 'numeric'
+    """
     return dash_table.DataTable(
-        id='top-wrestlers',
+        id=table_id,
         columns=[
-            {"name": i, "id": i} for i in appearances_df.columns
+            {"name": i, "id": i, "type": column_type} for i, column_type in columns
         ],
         page_current=0,
         page_size=top_page_size,
-        page_action='custom'
-)
+        page_action='custom',
+        sort_action='custom',
+        sort_mode='multi',
+        sort_by=[],
+        filter_action='custom',
+        filter_query=''
+    )
 
 
-def top_promotions_table():
-    return dash_table.DataTable(
-        id='top-promotions',
-        columns=[
-            {"name": i, "id": i} for i in sorted(year_name_count_df.columns)
-        ],
-        page_current=0,
-        page_size=top_page_size,
-        page_action='custom'
-    )
+def top_wrestlers_table():
+    return paged_table('top-wrestlers', [('name', 'text'), ('appearances', 'numeric')])
 
 
-def shows_heatmap():
-    months = ['January', 'February', 'March', 'April', 'May', 'June',
-              'July', 'August', 'September', 'October', 'November', 'December']
-    years = []
-    last_year = 0
-    shows = []
-    yr = [None] * 12
-    for i, r in shows_heatmap_df.iterrows():
-        if int(r['show_year']) == last_year or last_year == 0:
-            pass
-        else:
-            shows.append(yr)
-            years.append(last_year)
-            new_year = int(r['show_year'])
-            last_year += 1
-            while last_year < new_year:
-                years.append(last_year)
-                shows.append([None] * 12)
-                last_year += 1
-            yr = [None] * 12
-
-        show_m_int = int(r['show_month'])
-        yr[(show_m_int - 1)] = r['show_number']
-        last_year = int(r['show_year'])
-    shows.append(yr)
-    years.append(last_year)
-
-    fig = _annotated_heatmap.create_annotated_heatmap(z=shows,
-                             y=years,
-                             x=months,
-                             xgap=5,
-                             ygap=5,
-                             hoverinfo="none",
-                             connectgaps=False,
-                             colorscale='Viridis')
-    fig.layout.update(go.Layout(
-                title='Number of events per year and month',
-                yaxis=dict(autorange='reversed',
-                           tickmode='linear',
-                           showgrid=False),
-                xaxis=dict(showgrid=False)
-    ))
-    return dcc.Graph(
-        id='shows-heatmap',
-        figure=fig
-    )
+def top_promotions_table():
+    return paged_table('top-promotions', [('name', 'text'), ('show_count', 'numeric'), ('show_year', 'text')])
+
+
+@app.server.route('/figures/<user>/<name>.json')
+def serve_figure(user, name):
+    """
+    Serve a figure's JSON, for embedding or fetching outside the dashboard, which gets its figures through its
+    callbacks. The ETag changes with the figure, so a client revalidating an unchanged figure gets a 304, and the
+    figure is only serialized once per database version.
+    The heatmap takes ?promotion= and ?worker= filters.
+    """
+    if name not in figures.FIGURES:
+        flask.abort(404)
+    filters = ()
+    if name == 'shows-heatmap':
+        filters = (flask.request.args.get('promotion', type=int), flask.request.args.get('worker', type=int))
+    load_snapshot(user)
+    etag, body = figures.figure_payload(store, name, user, *filters)
+    response = flask.Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(flask.request)
+
+
+def shows_heatmap(user):
+    return html.Div([
+        dbc.Row(
+            [
+                dbc.Col(
+                    dcc.Dropdown(
+                        id='shows-heatmap-promotion',
+                        options=[{'label': name, 'value': promotion_id} for promotion_id, name in
+                                 store.promotion_names(user)],
+                        placeholder="All promotions"
+                    )
+                ),
+                dbc.Col(
+                    dcc.Dropdown(
+                        id='shows-heatmap-worker',
+                        options=[{'label': name, 'value': worker_id} for worker_id, name in
+                                 store.worker_names(user)],
+                        placeholder="All wrestlers"
+                    )
+                ),
+            ]
+        ),
+        # The figure is sent by update_heatmap, which runs as soon as the dropdowns are on the page
+        dcc.Graph(
+            id='shows-heatmap'
+        ),
+    ])
 
 
 navbar = dbc.NavbarSimple(
@@ -273,113 +188,158 @@ navbar = dbc.NavbarSimple(
     sticky="top",
 )
 
-body = dbc.Container(
-    [
-        dbc.Row(
-            [
-                dbc.Col(
-                    html.H2("You've seen", style={'text-align': 'center'}),
-                )
-            ]
-        ),
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        html.H2(str(worker_count), style={'text-align': 'center'}),
-                        html.H2("Wrestlers", style={'text-align': 'center'}),
-                    ],
-                ),
-                dbc.Col(
-                    [
-                        html.H2(str(show_count), style={'text-align': 'center'}),
-                        html.H2("shows!", style={'text-align': 'center'}),
-                        html.P(excluded_shows_string, style={'text-align': 'center', 'font-weight': 'bold'}),
-                    ],
-                ),
-                dbc.Col(
-                    [
-                        html.H2(str(promotion_count), style={'text-align': 'center'}),
-                        html.H2("promotions", style={'text-align': 'center'}),
-                    ],
-                ),
-            ]
-        ),
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        html.H4(streak_string, style={'text-align': 'center'}),
-                        html.H4(longest_streak_string, style={'text-align': 'center'}),
-                    ]
-                ),
-            ]
-        ),
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        html.H5("Top Wrestlers seen", style={'text-align': 'center'}),
-                        top_wrestlers_table(),
-                    ]
-                ),
-                dbc.Col(
-                    [
-                        html.H5("Top Promotions seen", style={'text-align': 'center'}),
-                        shows_pie_chart(),
-                    ]
-                ),
-            ]
-        ),
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        shows_heatmap(),
-                    ]
-                ),
-            ]
-        ),
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        top_promotions_table(),
-                    ]
-                ),
-                dbc.Col(
-                    [
-                        shows_per_year_graph(),
-                    ]
-                ),
-            ]
-        )
-    ],
-    className="mt-4",
-    fluid=True,
-)
+def serve_layout():
+    """
+    The page, with the dashboard of the user in the URL filled in by display_dashboard.
+    """
+    return html.Div([dcc.Location(id='url', refresh=False), navbar, html.Div(id='dashboard')])
+
+
+app.layout = serve_layout
+
+
+@app.callback(Output('dashboard', 'children'), [Input('url', 'pathname')])
+def display_dashboard(pathname):
+    """
+    Show a user's dashboard. This runs on every page load, so a reload shows a fresh ingest, but the dashboard is only
+    built again once the database has changed.
+    """
+    user = page_user(pathname)
+    load_snapshot(user)
+    return store.memoize(('dashboard', user), lambda: dashboard(user))
+
+
+def dashboard(user):
+    """
+    Build a user's dashboard from the current data.
+    """
+    streak_string, longest_streak_string = streak_strings(user)
+    body = dbc.Container(
+        [
+            dbc.Row(
+                [
+                    dbc.Col(
+                        html.H2("You've seen", style={'text-align': 'center'}),
+                    )
+                ]
+            ),
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            html.H2(str(store.worker_count(user)), style={'text-align': 'center'}),
+                            html.H2("Wrestlers", style={'text-align': 'center'}),
+                        ],
+                    ),
+                    dbc.Col(
+                        [
+                            html.H2(str(store.show_count(user)), style={'text-align': 'center'}),
+                            html.H2("shows!", style={'text-align': 'center'}),
+                            html.P(excluded_shows_string(user), style={'text-align': 'center', 'font-weight': 'bold'}),
+                        ],
+                    ),
+                    dbc.Col(
+                        [
+                            html.H2(str(store.promotion_count(user)), style={'text-align': 'center'}),
+                            html.H2("promotions", style={'text-align': 'center'}),
+                        ],
+                    ),
+                ]
+            ),
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            html.H4(streak_string, style={'text-align': 'center'}),
+                            html.H4(longest_streak_string, style={'text-align': 'center'}),
+                        ]
+                    ),
+                ]
+            ),
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            html.H5("Top Wrestlers seen", style={'text-align': 'center'}),
+                            top_wrestlers_table(),
+                        ]
+                    ),
+                    dbc.Col(
+                        [
+                            html.H5("Top Promotions seen", style={'text-align': 'center'}),
+                            shows_pie_chart(user),
+                        ]
+                    ),
+                ]
+            ),
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            shows_heatmap(user),
+                        ]
+                    ),
+                ]
+            ),
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            top_promotions_table(),
+                        ]
+                    ),
+                    dbc.Col(
+                        [
+                            shows_per_year_graph(user),
+                        ]
+                    ),
+                ]
+            )
+        ],
+        className="mt-4",
+        fluid=True,
+    )
+    return body
+
 
-app.layout = html.Div([navbar, body])
+def update_table(user, table_id, page_current, page_size, sort_by, filter_query):
+    sort_by = tuple((sort['column_id'], sort['direction']) for sort in sort_by or [])
+    page_count = -(-store.table_count(user, table_id, filter_query or '') // page_size)
+    return store.table_page(user, table_id, page_current, page_size, sort_by, filter_query or ''), \
+        max(page_count, 1)
 
 
 @app.callback(
-    Output('top-wrestlers', 'data'),
+    [Output('top-wrestlers', 'data'),
+     Output('top-wrestlers', 'page_count')],
     [Input('top-wrestlers', "page_current"),
-     Input('top-wrestlers', "page_size")])
-def update_table(page_current,page_size):
-    return appearances_df.iloc[
-        page_current*page_size:(page_current+ 1)*page_size
-    ].to_dict('records')
+     Input('top-wrestlers', "page_size"),
+     Input('top-wrestlers', "sort_by"),
+     Input('top-wrestlers', "filter_query")],
+    [State('url', 'pathname')])
+def update_top_wrestlers(page_current, page_size, sort_by, filter_query, pathname):
+    return update_table(page_user(pathname), 'top-wrestlers', page_current, page_size, sort_by, filter_query)
 
 
 @app.callback(
-    Output('top-promotions', 'data'),
+    [Output('top-promotions', 'data'),
+     Output('top-promotions', 'page_count')],
     [Input('top-promotions', "page_current"),
-     Input('top-promotions', "page_size")])
-def update_table(page_current,page_size):
-    return year_name_count_df.iloc[
-        page_current*page_size:(page_current+ 1)*page_size
-    ].to_dict('records')
+     Input('top-promotions', "page_size"),
+     Input('top-promotions', "sort_by"),
+     Input('top-promotions', "filter_query")],
+    [State('url', 'pathname')])
+def update_top_promotions(page_current, page_size, sort_by, filter_query, pathname):
+    return update_table(page_user(pathname), 'top-promotions', page_current, page_size, sort_by, filter_query)
+
+
+@app.callback(
+    Output('shows-heatmap', 'figure'),
+    [Input('shows-heatmap-promotion', 'value'),
+     Input('shows-heatmap-worker', 'value')],
+    [State('url', 'pathname')])
+def update_heatmap(promotion, worker, pathname):
+    return figures.figure(store, 'shows-heatmap', page_user(pathname), promotion, worker)
 
 
 if __name__ == '__main__':
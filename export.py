@@ -0,0 +1,234 @@
+"""
+Export the database graps.py writes to Parquet or Arrow files, for analysis outside the dashboard, and load an export
+back into a database. The shows, workers, promotions and appearances tables are written with proper date and integer
+types, along with appearance_facts, which has a row per appearance with the show, promotion and worker filled in. Rows
+are read and written in chunks, so memory doesn't grow with the size of the database.
+Needs pyarrow, which is in the Pipfile, but only imported here, so the rest of graplist.fm runs without it.
+
+Run with e.g.
+    python export.py -o export
+    python export.py -o export --format arrow
+    python export.py --import export -d thedatabase.sqlite3
+"""
+from datetime import date
+import argparse
+import os
+import sqlite3
+import sys
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+import graps
+
+FORMATS = ['parquet', 'arrow']
+
+# Rows read from the database, or written to it, at a time
+CHUNK_SIZE = 50000
+
+# Each exported table's query, and its columns with their Arrow types. The columns of the tables that can be imported
+# are in the order graps.py inserts them.
+EXPORT_TABLES = {
+    'promotions': ('SELECT promotion_id, name FROM promotions ORDER BY promotion_id',
+                   [('promotion_id', 'int64'), ('name', 'string')]),
+    'workers': ('SELECT worker_id, cagematch_id, plain_name, name FROM workers ORDER BY worker_id',
+                [('worker_id', 'int64'), ('cagematch_id', 'int64'), ('plain_name', 'string'), ('name', 'string')]),
+    'shows': ('''SELECT user_id, show_id, name, arena, show_date, promotion, url, is_partial FROM shows
+                 ORDER BY user_id, show_date, show_id''',
+              [('user_id', 'string'), ('show_id', 'string'), ('name', 'string'), ('arena', 'string'),
+               ('show_date', 'date32'), ('promotion', 'int64'), ('url', 'string'), ('is_partial', 'int8')]),
+    'appearances': ('SELECT user_id, worker_id, show_id FROM appearances ORDER BY user_id, show_id, worker_id',
+                    [('user_id', 'string'), ('worker_id', 'int64'), ('show_id', 'string')]),
+    'appearance_facts': ('''SELECT appearances.user_id, appearances.show_id, shows.show_date, shows.name, shows.arena,
+                            shows.is_partial, shows.promotion, promotions.name, appearances.worker_id,
+                            workers.cagematch_id, workers.name
+                            FROM appearances
+                            INNER JOIN shows ON shows.user_id = appearances.user_id
+                            AND shows.show_id = appearances.show_id
+                            LEFT JOIN promotions ON promotions.promotion_id = shows.promotion
+                            LEFT JOIN workers ON workers.worker_id = appearances.worker_id
+                            ORDER BY appearances.user_id, shows.show_date, appearances.show_id,
+                            appearances.worker_id''',
+                         [('user_id', 'string'), ('show_id', 'string'), ('show_date', 'date32'),
+                          ('show_name', 'string'), ('arena', 'string'), ('is_partial', 'int8'),
+                          ('promotion_id', 'int64'), ('promotion_name', 'string'), ('worker_id', 'int64'),
+                          ('cagematch_id', 'int64'), ('worker_name', 'string')]),
+}
+
+# The tables an export is loaded back from, in the order they're loaded, with the statement each row is inserted with.
+# A worker_id from the export can belong to a different worker in the database being loaded into, so workers are
+# loaded into imported_workers first, matched up with the workers table by their identity, and the appearances have
+# their worker_id looked up from there.
+IMPORT_TABLES = {
+    'promotions': graps.INSERT_PROMOTION,
+    'workers': '''INSERT INTO imported_workers(imported_id, cagematch_id, plain_name, name)
+                  VALUES(?,?,?,?)''',
+    'shows': graps.INSERT_SHOW,
+    'appearances': '''INSERT OR IGNORE INTO appearances(user_id, worker_id, show_id)
+                      VALUES(?, (SELECT worker_id FROM imported_workers WHERE imported_id = ?), ?)''',
+}
+CREATE_IMPORTED_WORKERS = '''
+    CREATE TEMP TABLE "imported_workers" (
+        "imported_id" INTEGER PRIMARY KEY,
+        "cagematch_id" INTEGER,
+        "plain_name" TEXT,
+        "name" TEXT,
+        "worker_id" INTEGER)'''
+MATCH_IMPORTED_WORKERS = ['''INSERT OR IGNORE INTO workers(cagematch_id, plain_name, name)
+                             SELECT cagematch_id, plain_name, name FROM imported_workers''',
+                          '''UPDATE imported_workers SET worker_id = coalesce(
+                             (SELECT worker_id FROM workers WHERE cagematch_id = imported_workers.cagematch_id),
+                             (SELECT worker_id FROM workers WHERE plain_name = imported_workers.plain_name))''']
+
+
+def schema(columns):
+    return pyarrow.schema([(name, pyarrow.type_for_alias(alias)) for name, alias in columns])
+
+
+def export_path(directory, table, file_format='parquet'):
+    return os.path.join(directory, '{0}.{1}'.format(table, file_format))
+
+
+def record_batch(rows, table_schema):
+    """
+    Turn rows read from SQLite into a record batch, parsing the dates, which SQLite stores as text.
+    """
+    arrays = []
+    for field, values in zip(table_schema, zip(*rows)):
+        if field.type == pyarrow.date32():
+            values = [None if value is None else date.fromisoformat(value) for value in values]
+        arrays.append(pyarrow.array(values, type=field.type))
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=table_schema)
+
+
+def open_writer(path, table_schema, file_format='parquet'):
+    """
+    Open a Parquet file, or an Arrow IPC file, to write record batches to.
+    """
+    if file_format == 'parquet':
+        return pyarrow.parquet.ParquetWriter(path, table_schema)
+    return pyarrow.ipc.new_file(path, table_schema)
+
+
+def read_batches(path, file_format='parquet', chunk_size=CHUNK_SIZE):
+    """
+    Read a Parquet or Arrow file a record batch at a time.
+    """
+    if file_format == 'parquet':
+        yield from pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunk_size)
+    else:
+        with pyarrow.memory_map(path) as source:
+            reader = pyarrow.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+
+
+def export_table(connection, table, path, file_format='parquet', chunk_size=CHUNK_SIZE):
+    """
+    Write one of the EXPORT_TABLES to a file, `chunk_size` rows at a time.
+    :return: the number of rows written
+    """
+    query, columns = EXPORT_TABLES[table]
+    table_schema = schema(columns)
+    cursor = connection.execute(query)
+    written = 0
+    writer = open_writer(path, table_schema, file_format)
+    try:
+        rows = cursor.fetchmany(chunk_size)
+        while rows:
+            writer.write_batch(record_batch(rows, table_schema))
+            written += len(rows)
+            rows = cursor.fetchmany(chunk_size)
+    finally:
+        writer.close()
+    return written
+
+
+def export_database(connection, directory, file_format='parquet', chunk_size=CHUNK_SIZE):
+    """
+    Export every one of the EXPORT_TABLES to a directory. They're all read in one transaction, so they agree with each
+    other even if graps.py is writing to the database at the same time.
+    :return: a dict of the number of rows written, by table
+    """
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    connection.execute('BEGIN')
+    try:
+        for table in EXPORT_TABLES:
+            counts[table] = export_table(connection, table, export_path(directory, table, file_format), file_format,
+                                         chunk_size)
+    finally:
+        connection.rollback()
+    return counts
+
+
+def import_database(connection, directory, file_format='parquet', chunk_size=CHUNK_SIZE):
+    """
+    Bulk load an export into a database, alongside anything that's already in it, in one transaction. The rollup
+    triggers are dropped while the rows go in, and the rollups rebuilt once at the end, rather than being updated for
+    every row.
+    :return: a dict of the number of rows read, by table
+    """
+    graps.conn = connection
+    graps.c = connection.cursor()
+    graps.create_tables()
+    counts = {}
+    connection.execute('BEGIN')
+    with connection:
+        for trigger in graps.ROLLUP_TRIGGERS:
+            connection.execute('DROP TRIGGER "{0}"'.format(trigger))
+        connection.execute(CREATE_IMPORTED_WORKERS)
+        for table, insert in IMPORT_TABLES.items():
+            counts[table] = 0
+            for batch in read_batches(export_path(directory, table, file_format), file_format, chunk_size):
+                # Dates go back in as the ISO text SQLite has them as
+                columns = [column.cast(pyarrow.string()) if column.type == pyarrow.date32() else column
+                           for column in batch.columns]
+                connection.executemany(insert, zip(*(column.to_pylist() for column in columns)))
+                counts[table] += batch.num_rows
+            if table == 'workers':
+                for statement in MATCH_IMPORTED_WORKERS:
+                    connection.execute(statement)
+        connection.execute('DROP TABLE "imported_workers"')
+        for statement in graps.REBUILD_ROLLUPS:
+            connection.execute(statement)
+        for trigger in graps.CREATE_ROLLUP_TRIGGERS:
+            connection.execute(trigger)
+    return counts
+
+
+def main(args):
+    if pyarrow is None:
+        sys.exit("Exporting needs pyarrow: pipenv install")
+    connection = sqlite3.connect(args.database)
+    try:
+        if args.import_dir is not None:
+            counts = import_database(connection, args.import_dir, args.format, args.chunk_size)
+            for table, count in counts.items():
+                print("Imported {0} {1} rows from {2}".format(count, table,
+                                                             export_path(args.import_dir, table, args.format)))
+        else:
+            counts = export_database(connection, args.output, args.format, args.chunk_size)
+            for table, count in counts.items():
+                print("Exported {0} {1} rows to {2}".format(count, table, export_path(args.output, table, args.format)))
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export the database to Parquet or Arrow files, or import an export')
+    parser.add_argument("-d", "--database", dest="database", default="thedatabase.sqlite3",
+                        help="the database to export, or to import into")
+    parser.add_argument("-o", "--output", dest="output", default="export",
+                        help="directory to write the files to")
+    parser.add_argument("--format", dest="format", choices=FORMATS, default='parquet',
+                        help="write Parquet files, or Arrow IPC (Feather v2) files")
+    parser.add_argument("--import", dest="import_dir", default=None, metavar="DIR",
+                        help="load the export in this directory into the database, rather than exporting")
+    parser.add_argument("-c", "--chunk-size", dest="chunk_size", type=int, default=CHUNK_SIZE,
+                        help="number of rows to read and write at a time")
+    main(parser.parse_args())
@@ -0,0 +1,126 @@
+"""
+The dashboard's figures. They're built from a DataStore's queries, with plotly but not Dash, so graps.py can build
+them for a snapshot without the web app.
+"""
+import hashlib
+import json
+
+import plotly.graph_objs as go
+from plotly.utils import PlotlyJSONEncoder
+
+
+def shows_per_year_series(store, user):
+    series = []
+    grouped = store.year_name_count_df(user).groupby('name')
+    for group_name, df_group in grouped:
+        series.append(
+            go.Bar(x=df_group['show_year'],
+                   y=df_group['show_count'],
+                   name=group_name))
+    return series
+
+
+def shows_per_year_figure(store, user):
+    return go.Figure(
+        data=[go.Bar(x=store.year_counter_df(user)['show_year'],
+                     y=store.year_counter_df(user)['show_count'])],
+        layout=go.Layout(
+            title='Shows/year'
+        )
+    )
+
+
+def shows_per_year_stacked_figure(store, user):
+    return go.Figure(
+        data=shows_per_year_series(store, user),
+        layout=go.Layout(
+            title='Shows/year', barmode='stack'
+        )
+    )
+
+
+def shows_pie_figure(store, user):
+    return go.Figure(
+        data=[go.Pie(labels=store.shows_df(user)['name'],
+                     values=store.shows_df(user)['att_shows'],
+                     textinfo="none")],
+        layout=go.Layout(
+            margin=dict(t=50)
+        )
+    )
+
+
+def appearances_pie_figure(store, user):
+    return go.Figure(
+        data=[go.Pie(labels=store.appearances_df(user)['name'],
+                     values=store.appearances_df(user)['appearances'])],
+        layout=go.Layout(
+            title='Appearances'
+        )
+    )
+
+
+def shows_heatmap_figure(store, user, promotion=None, worker=None):
+    # It pulls in plotly.figure_factory, which is slow to import
+    import _annotated_heatmap
+    months = ['January', 'February', 'March', 'April', 'May', 'June',
+              'July', 'August', 'September', 'October', 'November', 'December']
+    years, shows = store.shows_heatmap_grid(user, promotion, worker)
+    if not years:
+        return go.Figure(layout=go.Layout(title='Number of events per year and month'))
+
+    fig = _annotated_heatmap.create_annotated_heatmap(z=shows,
+                             y=years,
+                             x=months,
+                             xgap=5,
+                             ygap=5,
+                             hoverinfo="none",
+                             connectgaps=False,
+                             colorscale='Viridis')
+    fig.layout.update(go.Layout(
+                title='Number of events per year and month',
+                yaxis=dict(autorange='reversed',
+                           tickmode='linear',
+                           showgrid=False),
+                xaxis=dict(showgrid=False)
+    ))
+    return fig
+
+
+# The figures, by the ID of the graph they're shown in. Each is built once per user (and filter) until the database
+# changes, and kept as a plain dict, so it isn't validated by plotly again every time it's sent.
+FIGURES = {
+    'shows-per-year': shows_per_year_figure,
+    'shows-per-year-stacked': shows_per_year_stacked_figure,
+    'shows-pie': shows_pie_figure,
+    'appearances-pie': appearances_pie_figure,
+    'shows-heatmap': shows_heatmap_figure,
+}
+
+
+def figure(store, name, user, *filters):
+    """
+    A figure from FIGURES for a user, as a dict, memoized against the database version.
+    :param store: the DataStore
+    :param name: the figure's key in FIGURES
+    :param user: the user ID
+    :param filters: any further arguments to the figure function, like the heatmap's promotion and worker. If they're
+        all None, the figure is the same as the unfiltered one.
+    """
+    if all(value is None for value in filters):
+        filters = ()
+    return store.memoize(('figure', name, user) + filters,
+                         lambda: json.loads(json.dumps(FIGURES[name](store, user, *filters), cls=PlotlyJSONEncoder)))
+
+
+def figure_payload(store, name, user, *filters):
+    """
+    A figure serialized as JSON, and its ETag (etag, body), memoized like the figure itself.
+    """
+    if all(value is None for value in filters):
+        filters = ()
+
+    def serialize():
+        body = json.dumps(figure(store, name, user, *filters), cls=PlotlyJSONEncoder)
+        return hashlib.sha1(body.encode('utf-8')).hexdigest(), body
+    return store.memoize(('figure_payload', name, user) + filters, serialize)
@@ -3,22 +3,59 @@ Fetch cards from Cagematch and extract the wrestlers who were on that show
 """
 from dataclasses import dataclass
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+from bs4.builder import builder_registry
 from urllib.parse import urlparse
 from urllib.parse import parse_qs
-from url_loading import simple_get
+from url_loading import simple_get, PageFetcher, configure_cache, configure_session, print_failed_urls, SHOW_PAGES, \
+    URL_EXPIRY
+from parse_cache import ParseCache
+from metrics import ingest_metrics, FORMATS as METRICS_FORMATS
+import bs4
 import yaml
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from enum import IntEnum
+import multiprocessing
 import sqlite3
-from datetime import date
+from datetime import date, timedelta
 import argparse
+import hashlib
+import inspect
+import json
 import re
 import cProfile
+import pstats
+from functools import lru_cache
+import time
+import tracemalloc
 
 
 TYPE_FIELD = 'id'
 ID_FIELD = 'nr'
 
+# The only parts of a show page that get read, see make_soup
+SHOW_PAGE_REGION_CLASSES = ["InformationBoxTable", "Matches", "Comments Font9"]
+SHOW_PAGE_REGIONS = SoupStrainer("div", attrs={"class": SHOW_PAGE_REGION_CLASSES})
+TARGETED_PARSER = 'lxml' if builder_registry.lookup('lxml') is not None else 'html.parser'
+
+# The functions and classes that turn a fetched page into a Show and its Workers, and the parse cache entries back
+# into them. Their source makes up the parser version, see get_parser_version, so add any new parsing helper here.
+PARSER_SOURCES = ['ContentType', 'ShowType', 'Promotion', 'Show', 'Worker', 'parse_html', 'make_soup',
+                  'parse_show_info', 'get_show_information_dictionary', 'get_show_id', 'apply_translations',
+                  'parse_promotion_info', 'parse_worker_list', 'split_worker_list', 'extract_worker_id_name',
+                  'validate_worker', 'get_match_text', 'not_one_off', 'one_off_pattern', 'filter_excluded',
+                  'index_match_workers', 'parse_result_json', 'parse_result_from_json']
+
+parse_stats = []
+
+# The number of functions listed by --profile
+PROFILE_LINES = 40
+
+writer = None
+
+parse_cache = None
+
 
 class ContentType(IntEnum):
     WRESTLER = 2
@@ -56,46 +93,328 @@ class Worker:
     name: str
 
 
-def create_tables():
-    c.execute('''
-        CREATE TABLE "promotions" (
+DEFAULT_USER = 'default'
+
+# The version of the schema below, stored in PRAGMA user_version. Older databases are migrated by create_tables.
+#  1: shows, appearances, show entries and the rollups are partitioned by user_id
+#  2: workers have an INTEGER surrogate key, and are identified by their Cagematch ID or plain text name
+SCHEMA_VERSION = 2
+
+# Promotions and workers are shared between users, shows and appearances belong to the user who saw them.
+# A worker with a profile link is identified by their Cagematch ID, and one without by their plain text name. The
+# other one is NULL. Everything else refers to them by worker_id, so joins and grouping are on integers.
+CREATE_TABLES = {
+    'promotions': '''
+        CREATE TABLE IF NOT EXISTS "promotions" (
             "promotion_id" INTEGER PRIMARY KEY,
             "name" TEXT);
-              ''')
-    c.execute('''
-        CREATE TABLE "shows" (
-            "show_id" TEXT PRIMARY KEY,
+              ''',
+    'shows': '''
+        CREATE TABLE IF NOT EXISTS "shows" (
+            "user_id" TEXT NOT NULL,
+            "show_id" TEXT,
             "name" TEXT,
             "arena" TEXT,
             "show_date" TEXT,
             "promotion" INTEGER,
             "url" TEXT,
             "is_partial" INTEGER,
+            PRIMARY KEY ("user_id", "show_id"),
             FOREIGN KEY ("promotion") REFERENCES
                 "promotions" ("promotion_id"));
-              ''')
-    c.execute('''
-        CREATE TABLE "workers" (
-            "worker_id" TEXT PRIMARY KEY,
+              ''',
+    'workers': '''
+        CREATE TABLE IF NOT EXISTS "workers" (
+            "worker_id" INTEGER PRIMARY KEY,
+            "cagematch_id" INTEGER UNIQUE,
+            "plain_name" TEXT UNIQUE,
             "name" TEXT);
-              ''')
-    c.execute('''
-        CREATE TABLE "appearances" (
-            "worker_id" TEXT,
+              ''',
+    'appearances': '''
+        CREATE TABLE IF NOT EXISTS "appearances" (
+            "user_id" TEXT NOT NULL,
+            "worker_id" INTEGER,
             "show_id" TEXT,
             FOREIGN KEY ("worker_id") REFERENCES "workers" ("worker_id"),
-            FOREIGN KEY ("show_id") REFERENCES "shows" ("show_id"),
-            UNIQUE("worker_id", "show_id"));
-              ''')
+            FOREIGN KEY ("user_id", "show_id") REFERENCES "shows" ("user_id", "show_id"),
+            UNIQUE("user_id", "worker_id", "show_id"));
+              ''',
+    'show_entries': '''
+        CREATE TABLE IF NOT EXISTS "show_entries" (
+            "user_id" TEXT NOT NULL,
+            "show_id" TEXT,
+            "entry_hash" TEXT,
+            PRIMARY KEY ("user_id", "show_id"),
+            FOREIGN KEY ("user_id", "show_id") REFERENCES "shows" ("user_id", "show_id"));
+              ''',
+    'worker_appearances': '''
+        CREATE TABLE IF NOT EXISTS "worker_appearances" (
+            "user_id" TEXT NOT NULL,
+            "worker_id" INTEGER,
+            "appearances" INTEGER,
+            PRIMARY KEY ("user_id", "worker_id"));
+              ''',
+    'promotion_year_shows': '''
+        CREATE TABLE IF NOT EXISTS "promotion_year_shows" (
+            "user_id" TEXT NOT NULL,
+            "promotion_id" INTEGER,
+            "show_year" TEXT,
+            "show_count" INTEGER,
+            PRIMARY KEY ("user_id", "promotion_id", "show_year"));
+              ''',
+    'month_shows': '''
+        CREATE TABLE IF NOT EXISTS "month_shows" (
+            "user_id" TEXT NOT NULL,
+            "show_year" TEXT,
+            "show_month" TEXT,
+            "show_count" INTEGER,
+            PRIMARY KEY ("user_id", "show_year", "show_month"));
+              ''',
+    'user_generations': '''
+        CREATE TABLE IF NOT EXISTS "user_generations" (
+            "user_id" TEXT PRIMARY KEY,
+            "generation" INTEGER);
+              ''',
+}
+
+CREATE_INDEXES = ['CREATE INDEX IF NOT EXISTS "appearances_user_show" ON "appearances" ("user_id", "show_id")',
+                  'CREATE INDEX IF NOT EXISTS "shows_user_date" ON "shows" ("user_id", "show_date")',
+                  'CREATE INDEX IF NOT EXISTS "shows_user_promotion" ON "shows" ("user_id", "promotion")']
+
+# Aggregates the dashboard reads instead of grouping over every appearance and show: appearances per worker, shows per
+# promotion per year, and shows per year and month, for each user. Triggers keep them up to date as rows are inserted
+# and deleted.
+ROLLUP_TABLES = ['worker_appearances', 'promotion_year_shows', 'month_shows']
+ROLLUP_TRIGGERS = ['appearances_rollup_insert', 'appearances_rollup_delete', 'shows_rollup_insert',
+                   'shows_rollup_delete']
+CREATE_ROLLUP_TRIGGERS = ['''
+    CREATE TRIGGER IF NOT EXISTS "appearances_rollup_insert" AFTER INSERT ON "appearances" BEGIN
+        INSERT OR IGNORE INTO worker_appearances(user_id, worker_id, appearances)
+            VALUES (NEW.user_id, NEW.worker_id, 0);
+        UPDATE worker_appearances SET appearances = appearances + 1
+            WHERE user_id = NEW.user_id AND worker_id = NEW.worker_id;
+    END''', '''
+    CREATE TRIGGER IF NOT EXISTS "appearances_rollup_delete" AFTER DELETE ON "appearances" BEGIN
+        UPDATE worker_appearances SET appearances = appearances - 1
+            WHERE user_id = OLD.user_id AND worker_id = OLD.worker_id;
+        DELETE FROM worker_appearances
+            WHERE user_id = OLD.user_id AND worker_id = OLD.worker_id AND appearances <= 0;
+    END''', '''
+    CREATE TRIGGER IF NOT EXISTS "shows_rollup_insert" AFTER INSERT ON "shows" BEGIN
+        INSERT OR IGNORE INTO promotion_year_shows(user_id, promotion_id, show_year, show_count)
+            VALUES (NEW.user_id, NEW.promotion, strftime('%Y', NEW.show_date), 0);
+        UPDATE promotion_year_shows SET show_count = show_count + 1
+            WHERE user_id = NEW.user_id AND promotion_id = NEW.promotion
+            AND show_year = strftime('%Y', NEW.show_date);
+        INSERT OR IGNORE INTO month_shows(user_id, show_year, show_month, show_count)
+            VALUES (NEW.user_id, strftime('%Y', NEW.show_date), strftime('%m', NEW.show_date), 0);
+        UPDATE month_shows SET show_count = show_count + 1
+            WHERE user_id = NEW.user_id AND show_year = strftime('%Y', NEW.show_date)
+            AND show_month = strftime('%m', NEW.show_date);
+    END''', '''
+    CREATE TRIGGER IF NOT EXISTS "shows_rollup_delete" AFTER DELETE ON "shows" BEGIN
+        UPDATE promotion_year_shows SET show_count = show_count - 1
+            WHERE user_id = OLD.user_id AND promotion_id = OLD.promotion
+            AND show_year = strftime('%Y', OLD.show_date);
+        DELETE FROM promotion_year_shows
+            WHERE user_id = OLD.user_id AND promotion_id = OLD.promotion
+            AND show_year = strftime('%Y', OLD.show_date) AND show_count <= 0;
+        UPDATE month_shows SET show_count = show_count - 1
+            WHERE user_id = OLD.user_id AND show_year = strftime('%Y', OLD.show_date)
+            AND show_month = strftime('%m', OLD.show_date);
+        DELETE FROM month_shows
+            WHERE user_id = OLD.user_id AND show_year = strftime('%Y', OLD.show_date)
+            AND show_month = strftime('%m', OLD.show_date) AND show_count <= 0;
+    END''']
+# Each user's generation goes up whenever one of their shows is added or deleted, so a dashboard snapshot can tell if
+# it's still up to date
+CREATE_GENERATION_TRIGGERS = ['''
+    CREATE TRIGGER IF NOT EXISTS "shows_generation_insert" AFTER INSERT ON "shows" BEGIN
+        INSERT OR IGNORE INTO user_generations(user_id, generation) VALUES (NEW.user_id, 0);
+        UPDATE user_generations SET generation = generation + 1 WHERE user_id = NEW.user_id;
+    END''', '''
+    CREATE TRIGGER IF NOT EXISTS "shows_generation_delete" AFTER DELETE ON "shows" BEGIN
+        UPDATE user_generations SET generation = generation + 1 WHERE user_id = OLD.user_id;
+    END''']
+REBUILD_ROLLUPS = ['DELETE FROM worker_appearances',
+                   'DELETE FROM promotion_year_shows',
+                   'DELETE FROM month_shows',
+                   '''INSERT INTO worker_appearances(user_id, worker_id, appearances)
+                      SELECT user_id, worker_id, count(*) FROM appearances GROUP BY user_id, worker_id''',
+                   '''INSERT INTO promotion_year_shows(user_id, promotion_id, show_year, show_count)
+                      SELECT user_id, promotion, strftime('%Y', show_date) AS show_year, count(*) FROM shows
+                      GROUP BY user_id, promotion, show_year''',
+                   '''INSERT INTO month_shows(user_id, show_year, show_month, show_count)
+                      SELECT user_id, strftime('%Y', show_date) AS show_year, strftime('%m', show_date) AS show_month,
+                      count(*) FROM shows GROUP BY user_id, show_year, show_month''']
+
+# Version 0 tables had no user_id, their rows are copied into the DEFAULT_USER partition
+MIGRATE_TO_USERS = {
+    'shows': '''INSERT INTO shows(user_id, show_id, name, arena, show_date, promotion, url, is_partial)
+                SELECT ?, show_id, name, arena, show_date, promotion, url, is_partial FROM shows_v0''',
+    'appearances': '''INSERT INTO appearances(user_id, worker_id, show_id)
+                      SELECT ?, worker_id, show_id FROM appearances_v0''',
+    'show_entries': '''INSERT INTO show_entries(user_id, show_id, entry_hash)
+                       SELECT ?, show_id, entry_hash FROM show_entries_v0''',
+}
+
+# Version 1 workers were keyed by their Cagematch ID or plain text name, as TEXT. Each keeps its old rowid as its
+# worker_id, and IDs that are all digits become its cagematch_id.
+MIGRATE_WORKER_KEYS = ['''INSERT INTO workers(worker_id, cagematch_id, plain_name, name)
+                          SELECT rowid,
+                          CASE WHEN CAST(worker_id AS INTEGER) || '' = worker_id THEN CAST(worker_id AS INTEGER) END,
+                          CASE WHEN CAST(worker_id AS INTEGER) || '' = worker_id THEN NULL ELSE worker_id END,
+                          name FROM workers_v1''',
+                       '''INSERT INTO appearances(user_id, worker_id, show_id)
+                          SELECT appearances_v1.user_id, workers_v1.rowid, appearances_v1.show_id FROM appearances_v1
+                          INNER JOIN workers_v1 ON workers_v1.worker_id = CAST(appearances_v1.worker_id AS TEXT)''']
+
+
+def create_tables():
+    """
+    Create any tables, indexes and triggers that don't exist yet, migrating the database from an older schema first
+    if it needs it. The rollup tables are built from scratch if they're new.
+    """
+    schema_version = get_schema_version() if table_exists('shows') else SCHEMA_VERSION
+    if schema_version < 1:
+        migrate_to_users()
+    if schema_version < 2:
+        migrate_worker_keys()
+    rollups_exist = all(table_exists(table) for table in ROLLUP_TABLES)
+    for table in CREATE_TABLES.values():
+        c.execute(table)
+    for index in CREATE_INDEXES:
+        c.execute(index)
+    for trigger in CREATE_ROLLUP_TRIGGERS + CREATE_GENERATION_TRIGGERS:
+        c.execute(trigger)
+    c.execute('PRAGMA user_version = {0}'.format(SCHEMA_VERSION))
     conn.commit()
+    if not rollups_exist:
+        rebuild_rollups()
+
+
+def table_exists(table):
+    c.execute("SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return c.fetchone()[0] > 0
+
+
+def get_schema_version():
+    c.execute('PRAGMA user_version')
+    return c.fetchone()[0]
+
+
+def migrate_to_users():
+    """
+    Migrate a database from before shows were partitioned by user. SQLite can't change a primary key, so the shows,
+    appearances and show_entries tables are renamed, re-created with a user_id, and their rows copied into the
+    DEFAULT_USER partition. The rollups are dropped, to be rebuilt by create_tables.
+    """
+    print("Migrating the database to schema version 1")
+    with conn:
+        for trigger in ROLLUP_TRIGGERS:
+            conn.execute('DROP TRIGGER IF EXISTS "{0}"'.format(trigger))
+        for table in ROLLUP_TABLES:
+            conn.execute('DROP TABLE IF EXISTS "{0}"'.format(table))
+        for table, migrate in MIGRATE_TO_USERS.items():
+            if table_exists(table):
+                conn.execute('ALTER TABLE "{0}" RENAME TO "{0}_v0"'.format(table))
+                conn.execute(CREATE_TABLES[table])
+                conn.execute(migrate, (DEFAULT_USER,))
+                conn.execute('DROP TABLE "{0}_v0"'.format(table))
+
+
+def migrate_worker_keys():
+    """
+    Migrate a database from before workers had a surrogate key. The workers and appearances tables are renamed,
+    re-created, and their rows copied across, with each appearance pointed at its worker's new worker_id. The
+    worker_appearances rollup is dropped, to be rebuilt by create_tables, and every user's generation is bumped, so
+    snapshots holding the old worker IDs aren't loaded.
+    """
+    print("Migrating the database to schema version 2")
+    with conn:
+        for trigger in ROLLUP_TRIGGERS:
+            conn.execute('DROP TRIGGER IF EXISTS "{0}"'.format(trigger))
+        conn.execute('DROP TABLE IF EXISTS "worker_appearances"')
+        conn.execute('ALTER TABLE "appearances" RENAME TO "appearances_v1"')
+        conn.execute('ALTER TABLE "workers" RENAME TO "workers_v1"')
+        conn.execute(CREATE_TABLES['workers'])
+        conn.execute(CREATE_TABLES['appearances'])
+        for statement in MIGRATE_WORKER_KEYS:
+            conn.execute(statement)
+        conn.execute('DROP TABLE "appearances_v1"')
+        conn.execute('DROP TABLE "workers_v1"')
+        if table_exists('user_generations'):
+            conn.execute('UPDATE user_generations SET generation = generation + 1')
+
+
+def rebuild_rollups():
+    """
+    Recompute the rollup tables from scratch, from the shows and appearances tables. They're kept up to date by
+    triggers as shows are added and deleted, so this is only needed if they've been created on an existing database,
+    or have somehow drifted.
+    """
+    with conn:
+        for statement in REBUILD_ROLLUPS:
+            conn.execute(statement)
+
+
+INSERT_PROMOTION = '''INSERT OR IGNORE INTO promotions(promotion_id, name)
+                      VALUES(?,?)'''
+INSERT_SHOW = '''INSERT OR IGNORE INTO shows(user_id, show_id, name, arena, show_date, promotion, url, is_partial)
+                 VALUES(?,?,?,?,?,?,?,?)'''
+INSERT_WORKER = '''INSERT OR IGNORE INTO workers(cagematch_id, plain_name, name)
+                   VALUES(?,?,?)'''
+# The worker is looked up by their identity, see worker_identity
+INSERT_APPEARANCE = '''INSERT OR IGNORE INTO appearances(user_id, worker_id, show_id)
+                       VALUES(?, coalesce((SELECT worker_id FROM workers WHERE cagematch_id = ?),
+                                          (SELECT worker_id FROM workers WHERE plain_name = ?)), ?)'''
+INSERT_SHOW_ENTRY = '''INSERT OR REPLACE INTO show_entries(user_id, show_id, entry_hash)
+                       VALUES(?,?,?)'''
+DELETE_SHOW = ['DELETE FROM appearances WHERE user_id = ? AND show_id = ?',
+               'DELETE FROM show_entries WHERE user_id = ? AND show_id = ?',
+               'DELETE FROM shows WHERE user_id = ? AND show_id = ?']
+DELETE_ORPHANS = ['DELETE FROM workers WHERE worker_id NOT IN (SELECT worker_id FROM appearances)',
+                  'DELETE FROM promotions WHERE promotion_id NOT IN (SELECT promotion FROM shows)']
+
+failed_entries = []
+
+
+def promotion_row(promotion):
+    return promotion.id, promotion.name
+
+
+def show_row(show):
+    return args.user, show.show_id, show.show_name, show.arena, show.date, show.promotion.id, show.url, show.is_partial
+
+
+def worker_identity(worker):
+    """
+    The columns a worker is identified by in the workers table: their Cagematch ID if they have a profile link, or
+    their plain text name if they don't.
+    :return: the (cagematch_id, plain_name) pair, one of which is None
+    """
+    if isinstance(worker.id, int):
+        return worker.id, None
+    return None, worker.id
+
+
+def worker_row(worker):
+    return worker_identity(worker) + (worker.name,)
+
+
+def appearance_row(worker, show):
+    return (args.user,) + worker_identity(worker) + (show.show_id,)
+
+
+def show_key(show_id):
+    return args.user, show_id
 
 
 def add_promotion(promotion):
     """
     Inserts the specified promotion into the promotion table.
     """
-    c.execute('''INSERT OR IGNORE INTO promotions(promotion_id, name)
-                 VALUES(?,?)''', (promotion.id, promotion.name))
+    c.execute(INSERT_PROMOTION, promotion_row(promotion))
     conn.commit()
 
 
@@ -103,9 +422,7 @@ def add_show(show):
     """
     Inserts the specified show into the shows table.
     """
-    c.execute('''INSERT OR IGNORE INTO shows(show_id, name, arena, show_date, promotion, url, is_partial)
-                 VALUES(?,?,?,?,?,?,?)''',
-              (show.show_id, show.show_name, show.arena, show.date, show.promotion.id, show.url, show.is_partial))
+    c.execute(INSERT_SHOW, show_row(show))
     conn.commit()
 
 
@@ -113,8 +430,7 @@ def add_worker(worker):
     """
     Inserts the specified worker into the workers table.
     """
-    c.execute('''INSERT OR IGNORE INTO workers(worker_id, name)
-                 VALUES(?,?)''', (worker.id, worker.name))
+    c.execute(INSERT_WORKER, worker_row(worker))
     conn.commit()
 
 
@@ -122,131 +438,378 @@ def add_appearance(worker, show):
     """
     Inserts the specified worker and show pair into the appearances table.
     """
-    c.execute('''INSERT OR IGNORE INTO appearances(worker_id, show_id)
-                 VALUES(?,?)''', (worker.id, show.show_id))
+    c.execute(INSERT_APPEARANCE, appearance_row(worker, show))
+    conn.commit()
+
+
+def add_show_entry(show, entry_hash):
+    """
+    Records the hash of the YAML entry the specified show was parsed from, so incremental runs can spot changes.
+    """
+    c.execute(INSERT_SHOW_ENTRY, show_key(show.show_id) + (entry_hash,))
     conn.commit()
 
 
-def validate_worker(worker_name, bs_html):
+class BatchWriter(object):
+    """
+    Buffers the promotion, show, worker and appearance rows for parsed shows, and writes them with executemany inside
+    a single transaction once `batch_size` shows are waiting, rather than committing after every row.
+    """
+
+    def __init__(self, connection, batch_size=1):
+        self.conn = connection
+        self.batch_size = batch_size
+        self.pending_shows = 0
+        self.promotions = []
+        self.shows = []
+        self.workers = []
+        self.appearances = []
+        self.show_entries = []
+        self.replaced = []
+
+    def add_show(self, show, workers, entry_hash=None, replace=False):
+        """
+        Queue a show and the workers who appeared on it, flushing if the batch is full.
+        :param show: the Show object
+        :param workers: the list of Worker objects for the show
+        :param entry_hash: hash of the YAML entry the show was parsed from, if known
+        :param replace: whether an older copy of the show is in the database, to be deleted when this one is written
+        """
+        if replace:
+            self.replaced.append(show_key(show.show_id))
+        self.promotions.append(promotion_row(show.promotion))
+        self.shows.append(show_row(show))
+        for worker in workers:
+            self.workers.append(worker_row(worker))
+            self.appearances.append(appearance_row(worker, show))
+        if entry_hash is not None:
+            self.show_entries.append(show_key(show.show_id) + (entry_hash,))
+        self.pending_shows += 1
+        if self.pending_shows >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write every queued row in one transaction. Older copies of replaced shows are deleted in the same transaction,
+        so a show is never missing from the database.
+        """
+        if not self.pending_shows:
+            return
+        with ingest_metrics.timed('db_write'), self.conn:
+            for statement in DELETE_SHOW:
+                self.conn.executemany(statement, self.replaced)
+            self.conn.executemany(INSERT_PROMOTION, self.promotions)
+            self.conn.executemany(INSERT_SHOW, self.shows)
+            self.conn.executemany(INSERT_WORKER, self.workers)
+            self.conn.executemany(INSERT_APPEARANCE, self.appearances)
+            self.conn.executemany(INSERT_SHOW_ENTRY, self.show_entries)
+            if self.replaced:
+                for statement in DELETE_ORPHANS:
+                    self.conn.execute(statement)
+        self.pending_shows = 0
+        self.promotions = []
+        self.shows = []
+        self.workers = []
+        self.appearances = []
+        self.show_entries = []
+        self.replaced = []
+
+
+def store_show(show, workers, entry_hash=None, replace=False):
     """
-    Perform checks against a plain text worker name by iterating over the MatchResults and performing tests on each
-    result entry.
+    Add a parsed show, its promotion, its workers, and their appearances to the database. Rows are queued on the
+    batch writer, or inserted and committed one at a time if there isn't one (--commit-per-row).
+    :param show: the Show object
+    :param workers: the list of Worker objects for the show
+    :param entry_hash: hash of the YAML entry the show was parsed from, if known
+    :param replace: whether an older copy of the show is in the database, to be deleted as this one is added
+    """
+    if writer is None:
+        with ingest_metrics.timed('db_write'):
+            store_show_per_row(show, workers, entry_hash, replace)
+    else:
+        writer.add_show(show, workers, entry_hash, replace)
+
+
+def store_show_per_row(show, workers, entry_hash=None, replace=False):
+    """
+    Insert and commit a show's rows one at a time, as store_show does without a batch writer.
+    """
+    add_promotion(show.promotion)
+    if replace:
+        # Committed along with the new show row by add_show
+        for statement in DELETE_SHOW:
+            c.execute(statement, show_key(show.show_id))
+    add_show(show)
+    for worker in workers:
+        add_worker(worker)
+        add_appearance(worker, show)
+    if entry_hash is not None:
+        add_show_entry(show, entry_hash)
+    if replace:
+        with conn:
+            for statement in DELETE_ORPHANS:
+                conn.execute(statement)
+
+
+def delete_shows(show_ids):
+    """
+    Remove the specified shows of the current user and their appearances from the database, along with any workers and
+    promotions that are no longer linked to anyone's show.
+    :param show_ids: the show IDs to delete
+    """
+    show_id_rows = [show_key(show_id) for show_id in show_ids]
+    with conn:
+        for statement in DELETE_SHOW:
+            conn.executemany(statement, show_id_rows)
+        for statement in DELETE_ORPHANS:
+            conn.execute(statement)
+
+
+def get_entry_hash(url):
+    """
+    Hash a show entry from the YAML, so that edits to it (e.g. a changed exclude list) can be detected.
+    :param url: the show URL or dictionary
+    :return: a hex digest str
+    """
+    return hashlib.sha1(json.dumps(url, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def get_entry_show_id(url):
+    """
+    Work out the show ID a show entry will be stored under without fetching it: the Cagematch ID for a single page,
+    or the 'm' prefixed list of IDs that parse_workers builds for merged shows.
+    :param url: the show URL or dictionary
+    :return: the show ID str
+    """
+    show_ids = [get_show_id(page_url) for page_url in get_page_urls(url)]
+    if len(show_ids) > 1:
+        return "m" + ','.join(show_ids)
+    return show_ids[0]
+
+
+def get_wanted_entries(shows):
+    """
+    Key the show entries from the YAML by the show ID each will be stored under. Only the first of any entries for the
+    same show is kept, as the rest would be ignored when stored.
+    :param shows: the list of show entries loaded from the YAML
+    :return: a dict of show ID to (entry hash, entry), in YAML order
+    """
+    wanted = {}
+    for show in shows:
+        show_id = get_entry_show_id(show)
+        if show_id not in wanted:
+            wanted[show_id] = (get_entry_hash(show), show)
+    return wanted
+
+
+def get_stored_entry_hashes():
+    """
+    :return: a dict of the current user's show IDs in the database to the hash of the entry each was parsed from, or
+        None if it wasn't recorded
+    """
+    return dict(c.execute('''SELECT shows.show_id, show_entries.entry_hash FROM shows
+                             LEFT JOIN show_entries ON show_entries.user_id = shows.user_id
+                             AND show_entries.show_id = shows.show_id
+                             WHERE shows.user_id = ?''', (args.user,)))
+
+
+def select_changed_entries(shows):
+    """
+    Compare the show entries from the YAML with the user's shows already in the database. Shows whose entries have
+    been removed from the YAML are deleted. Shows whose entries have changed are left in place until their replacement
+    has been parsed, see store_show.
+    :param shows: the list of show entries loaded from the YAML
+    :return: the entries that are new or have changed, and so need to be fetched and parsed, in YAML order, and the
+        set of show IDs whose entries have changed (entries, changed)
+    """
+    wanted = get_wanted_entries(shows)
+    existing = get_stored_entry_hashes()
+    removed = [show_id for show_id in existing if show_id not in wanted]
+    changed = [show_id for show_id, entry_hash in existing.items()
+               if show_id in wanted and wanted[show_id][0] != entry_hash]
+    delete_shows(removed)
+
+    print("Incremental ingest: {0} new, {1} changed, {2} removed, {3} unchanged".format(
+        len(wanted.keys() - existing.keys()), len(changed), len(removed), len(existing) - len(removed) - len(changed)))
+    entries = [show for show_id, (entry_hash, show) in wanted.items()
+               if show_id not in existing or show_id in changed]
+    return entries, set(changed)
+
+
+def select_replaced_entries(shows):
+    """
+    For a full run, which parses every show entry in the YAML again. Shows already in the database are kept as they
+    are, except those whose entries have changed, which are replaced once parsed as in an incremental run, so a show's
+    rows always match the entry hash stored for it.
+    :param shows: the list of show entries loaded from the YAML
+    :return: the entries to fetch and parse, in YAML order, and the set of show IDs whose entries have changed
+        (entries, changed)
+    """
+    wanted = get_wanted_entries(shows)
+    existing = get_stored_entry_hashes()
+    changed = set(show_id for show_id, (entry_hash, show) in wanted.items()
+                  if show_id in existing and existing[show_id] != entry_hash)
+    return [show for entry_hash, show in wanted.values()], changed
+
+
+def configure_connection(connection, wal=False):
+    """
+    Optionally switch the database to write-ahead logging. Along with synchronous=NORMAL, this means commits no longer
+    wait on an fsync of the main database file.
+    """
+    if wal:
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+
+
+def validate_worker(worker_name, match_text):
+    """
+    Perform checks against a plain text worker name by searching the MatchResults text. The worker is valid if they
+    appear at least once in a way that doesn't match the one off pattern.
     :param worker_name: the plain text name under test
-    :param bs_html: the HTML as passed through BeautifulSoup
+    :param match_text: the MatchResults text for the show, as returned by get_match_text
     :return: True if the worker is valid, False if it should be rejected
     """
-    result = False
+    return not_one_off(worker_name, match_text)
+
+
+def get_match_text(bs_html):
+    """
+    Extract the text of every entry in the MatchResults, one match per line, so that it only has to be done once per
+    show however many plain text names need checking.
+    :param bs_html: the HTML as passed through BeautifulSoup
+    :return: the match results text str
+    """
+    texts = []
     divs = bs_html.find("div", {"class": "Matches"})
     for div in divs:
         result = div.find("div", {"class": "MatchResults"})
-        if not_one_off(worker_name, result.text.strip()):
-            result = True
-    return result
+        texts.append(result.text.strip())
+    return "\n".join(texts)
 
 
 def filter_excluded(workers, exclude, bs_html):
     """
     Exclude wrestlers who only appear in matches that have been marked for exclusion from the parsed
     list of workers.
+    The matches are indexed once with index_match_workers, then the workers only in excluded matches are found with
+    set differences.
     :param workers: the list of worker objects parsed from the All Workers section
     :param exclude: the indexes of matches to exclude
     :param bs_html: the HTML as passed through BeautifulSoup
     :return: the workers list with wrestlers only in excluded matches removed
     """
-    exclude_matches = []
-    include_matches = []
-    divs = bs_html.find("div", {"class": "Matches"})
-    i = 1
-    for div in divs:
-        result = div.find("div", {"class": "MatchResults"})
+    exclude_ids = set()
+    exclude_text = set()
+    include_ids = set()
+    include_text = set()
+    for i, (worker_ids, plain_text) in enumerate(index_match_workers(bs_html), 1):
         if i in exclude:
-            exclude_matches.append(result)
+            exclude_ids.update(worker_ids)
+            exclude_text.update(plain_text)
         else:
-            include_matches.append(result)
-        i = i + 1
+            include_ids.update(worker_ids)
+            include_text.update(plain_text)
 
     if args.verbose:
-        print("Excluding matches: {0}, Including matches: {1}".format(exclude_matches, include_matches))
+        print("Excluding matches: {0}".format(sorted(exclude)))
 
+    excluded_ids = exclude_ids - include_ids
+    excluded_text = exclude_text - include_text
     newlist = []
     for worker in workers:
         if isinstance(worker.id, int):
-            found_exclude = False
-            for result in exclude_matches:
-                for profile_link in result.find_all('a'):
-                    if profile_link is not None:
-                        worker_id, worker_name = extract_worker_id_name(profile_link)
-                        if worker_id == worker.id:
-                            found_exclude = True
-            if found_exclude:
-                found_include = False
-                for result in include_matches:
-                    for profile_link in result.find_all('a'):
-                        if profile_link is not None:
-                            worker_id, worker_name = extract_worker_id_name(profile_link)
-                            if worker_id == worker.id:
-                                found_include = True
-            if found_exclude and not found_include:
-                if args.verbose:
-                    print("Excluding wrestler {0}".format(worker))
-            else:
-                newlist.append(worker)
-        elif any(worker.name in s for s in exclude_matches) and not any(worker.name in s for s in include_matches):
+            is_excluded = worker.id in excluded_ids
+        else:
+            is_excluded = worker.name in excluded_text
+        if is_excluded:
             if args.verbose:
                 print("Excluding wrestler {0}".format(worker))
         else:
             newlist.append(worker)
-        
+
     return newlist
 
 
+def index_match_workers(bs_html):
+    """
+    Parse each entry in the MatchResults once, collecting the IDs of the wrestlers linked in it, and its plain text
+    nodes. A plain text worker counts as being in a match if one of the match's text nodes is exactly their name.
+    :param bs_html: the HTML as passed through BeautifulSoup
+    :return: a list with a (worker_ids, plain_text) pair of sets for each match, in card order
+    """
+    matches = []
+    divs = bs_html.find("div", {"class": "Matches"})
+    for div in divs:
+        result = div.find("div", {"class": "MatchResults"})
+        worker_ids = set()
+        for profile_link in result.find_all('a'):
+            worker_id, worker_name = extract_worker_id_name(profile_link)
+            if worker_id is not None:
+                worker_ids.add(worker_id)
+        plain_text = set(str(node) for node in result.contents if not isinstance(node, Tag))
+        matches.append((worker_ids, plain_text))
+    return matches
+
+
 def not_one_off(worker_name, search):
     """
     Checks whether the name does not match the one off pattern: i.e. is not followed by a bracketed name
+    (other than (c), (w/...) or the match time). A name followed by a comma, as in a list of team members, is not a
+    one off.
     :param worker_name: the plain text name under test
     :param search: the match result to match against
     :return: True if the regex matches, in other words does not match the one off pattern
     """
-    return bool(re.search(worker_name + "(( \\(([c\\)]|[w\\/]))|( [^(])|$|\\))", search))
+    return one_off_pattern(worker_name).search(search) is not None
 
 
-def parse_workers(url):
+@lru_cache(maxsize=1024)
+def one_off_pattern(worker_name):
+    """
+    Compile the pattern used by not_one_off for a name. The name is escaped, so punctuation in it is matched
+    literally. Multiline mode lets the pattern run over a whole card's match results at once, one match per line.
+    :param worker_name: the plain text name under test
+    :return: the compiled pattern
+    """
+    return re.compile(re.escape(worker_name) + "(( \\(([c\\)0-9]|[w\\/]))|( [^(])|$|\\)|,)", re.MULTILINE)
+
+
+def parse_workers(url, fetch=simple_get, replace=False, parse=None):
     """
     From a URL, fetches the page, and passes it through BeautifulSoup. Then parses the show info, promotion info, and
     worker info from the page.
-    All these are added to the database
+    All these are added to the database. If any of the pages for the entry can't be fetched, nothing is added, and the
+    entry is recorded in failed_entries.
     :param url: the show URL or dictionary
+    :param fetch: function used to get the raw HTML for a page URL, defaults to simple_get
+    :param replace: whether an older copy of the show is in the database, to be replaced
+    :param parse: function used to parse a fetched page, as parse_page (the default) does
+    :return: True if the show was added, False if it was skipped
     """
-    urls = get_urls(url)
+    if parse is None:
+        parse = parse_page
+    entry = url
+    entry_hash = get_entry_hash(url)
+    pages = get_pages(url)
 
     shows = []
     all_workers = []
-    for url in urls:
-        url, is_partial = check_is_partial(url)
-        if is_partial:
-            exclude = url['exclude']
-            exclude_from_count = url.get('exclude_from_count') or False
-            if exclude_from_count:
-                show_type = ShowType.PARTIAL_EXCLUDED
-            else:
-                show_type = ShowType.PARTIAL
-            url = url['url']
-        else:
-            show_type = ShowType.NORMAL
-        raw_html = simple_get(url)
+    for url, show_type, exclude in pages:
+        with ingest_metrics.timed('fetch_wait'):
+            raw_html = fetch(url)
         if raw_html is not None:
-            html = BeautifulSoup(raw_html, 'html.parser')
-
-            show = parse_show_info(html, url, show_type)
+            show, workers = parse(raw_html, url, show_type, exclude)
             shows.append(show)
-            if args.verbose:
-                print("Parsed show info {0}".format(show))
-
-            workers = parse_worker_list(html)
-            if show_type > 0:
-                workers = filter_excluded(workers, exclude, html)
             all_workers.extend(workers)
 
+    if len(shows) < len(pages):
+        print("Skipping {0}: {1} of {2} pages could not be fetched".format(entry, len(pages) - len(shows), len(pages)))
+        failed_entries.append(entry)
+        ingest_metrics.count('entries_skipped')
+        return False
+
     if len(shows) > 1:
         if args.verbose:
             print("Merging {0} shows".format(len(shows)))
@@ -264,11 +827,314 @@ def parse_workers(url):
     else:
         the_show = shows[0]
 
-    add_promotion(the_show.promotion)
-    add_show(the_show)
-    for worker in all_workers:
-        add_worker(worker)
-        add_appearance(worker, the_show)
+    ingest_metrics.observe('workers_per_show', len(all_workers))
+    store_show(the_show, all_workers, entry_hash, replace)
+    ingest_metrics.count('shows_stored')
+    return True
+
+
+def parse_page(raw_html, url, show_type=ShowType.NORMAL, exclude=None):
+    """
+    Pass a fetched show page through BeautifulSoup, then parse the show info and the list of workers from it. Partial
+    shows have the workers from their excluded matches filtered out. With --parse-stats or --parse-memory, the time (and
+    peak memory) taken is recorded in parse_stats.
+    If the parse cache is open and this copy of the page has already been parsed, the cached result is returned instead.
+    :param raw_html: the page content, as returned by simple_get
+    :param url: the show URL
+    :param show_type: whether the show is a partial show
+    :param exclude: the indexes of matches to exclude, for partial shows
+    :return: the Show object and list of Worker objects (show, workers)
+    """
+    if parse_cache is not None:
+        options = parse_options(show_type, exclude)
+        cached = parse_cache.get(url, raw_html, options)
+        ingest_metrics.count('parse_cache_misses' if cached is None else 'parse_cache_hits')
+        if cached is not None:
+            show, workers = parse_result_from_json(cached)
+            if args.verbose:
+                print("Parsed show info {0} (cached)".format(show))
+            return show, workers
+
+    start = time.perf_counter()
+    show, workers = parse_html(raw_html, url, show_type, exclude)
+    elapsed = time.perf_counter() - start
+    if parse_cache is not None:
+        parse_cache.put(url, raw_html, parse_result_json(show, workers), options)
+
+    if args.parse_stats or args.parse_memory:
+        peak = None
+        if args.parse_memory:
+            # Parse the page again under tracemalloc, so that tracing doesn't slow down the timed pass
+            tracemalloc.start()
+            with ingest_metrics.paused():
+                parse_html(raw_html, url, show_type, exclude)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print("Parsed {0} in {1:.1f} ms, peak memory {2:.0f} KiB".format(url, elapsed * 1000, peak / 1024))
+        else:
+            print("Parsed {0} in {1:.1f} ms".format(url, elapsed * 1000))
+        parse_stats.append((elapsed, peak))
+    if args.verbose:
+        print("Parsed show info {0}".format(show))
+    return show, workers
+
+
+def parse_html(raw_html, url, show_type=ShowType.NORMAL, exclude=None):
+    """
+    Parse the show info and the list of workers from the raw HTML of a show page, filtering out the workers from the
+    excluded matches of partial shows.
+    :param raw_html: the page content
+    :param url: the show URL
+    :param show_type: whether the show is a partial show
+    :param exclude: the indexes of matches to exclude, for partial shows
+    :return: the Show object and list of Worker objects (show, workers)
+    """
+    with ingest_metrics.timed('soup'):
+        html = make_soup(raw_html, args.parse_mode)
+    with ingest_metrics.timed('show_info'):
+        show = parse_show_info(html, url, show_type)
+    with ingest_metrics.timed('worker_list'):
+        workers = parse_worker_list(html)
+    if show_type > 0:
+        with ingest_metrics.timed('filter_excluded'):
+            workers = filter_excluded(workers, exclude, html)
+    return show, workers
+
+
+@dataclass
+class QueuedPage:
+    """
+    A page a ParsePool has queued: the Future for its content, and once that has arrived, its cached result or the
+    Future for it being parsed.
+    """
+    page: tuple
+    fetched: Future
+    raw_html: bytes = None
+    result: object = None
+    submitted: bool = False
+
+
+class ParsePool(object):
+    """
+    Parses show pages on a pool of processes, so parsing isn't held to a single core. It's given the pages of every
+    show entry in the order parse_workers will ask for them, and keeps up to `lookahead` pages ahead of the one being
+    consumed queued. Each page is sent to the pool as soon as it has been fetched, so fetching and parsing overlap. A
+    process parses the page with parse_html and sends back its parse_result_json, which is turned back into Show and
+    Worker objects here, so the database is still only written from the main process. Pages in the parse cache aren't
+    sent to the pool.
+    `fetch` and `parse` stand in for the fetch function and parse_page in parse_workers. Given a PageFetcher as
+    `fetcher`, pages are taken from its downloads as they finish, otherwise they're fetched one at a time with `fetch`
+    as they're queued.
+    """
+
+    def __init__(self, pages, fetch=simple_get, processes=2, lookahead=None, fetcher=None):
+        self.fetcher = fetcher
+        self.fetch_page = fetch if fetcher is None else fetcher.get
+        # Spawned rather than forked, so the processes don't inherit locks held by the fetch threads
+        self.executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=init_parse_process, initargs=(args,))
+        self.lookahead = lookahead or processes * 4
+        self.pending = deque(pages)
+        self.queued = deque()
+        self.current = None
+
+    def fill(self):
+        """
+        Queue pages from the list until `lookahead` are being fetched, parsed or waiting to be consumed.
+        """
+        while self.pending and len(self.queued) < self.lookahead:
+            url, show_type, exclude = self.pending.popleft()
+            self.queued.append(QueuedPage((url, show_type, exclude), self.fetch_future(url)))
+
+    def fetch_future(self, url):
+        if self.fetcher is not None:
+            return self.fetcher.future(url)
+        future = Future()
+        future.set_result(self.fetch_page(url))
+        return future
+
+    def submit(self, queued):
+        """
+        Send a page that has been fetched to the pool, unless it couldn't be fetched or its result is in the parse
+        cache.
+        """
+        url, show_type, exclude = queued.page
+        queued.submitted = True
+        queued.raw_html = queued.fetched.result()
+        if queued.raw_html is not None and parse_cache is not None:
+            queued.result = parse_cache.get(url, queued.raw_html, parse_options(show_type, exclude))
+            ingest_metrics.count('parse_cache_misses' if queued.result is None else 'parse_cache_hits')
+        if queued.raw_html is not None and queued.result is None:
+            queued.result = self.executor.submit(parse_page_in_process, queued.raw_html, url, show_type, exclude)
+
+    def submit_fetched(self):
+        for queued in self.queued:
+            if not queued.submitted and queued.fetched.done():
+                self.submit(queued)
+
+    def wait_for(self, future):
+        """
+        Wait for `future`, sending the queued pages to the pool as they arrive in the meantime, so it's kept busy.
+        :return: the result of the future
+        """
+        while True:
+            self.submit_fetched()
+            if future.done():
+                return future.result()
+            arriving = [queued.fetched for queued in self.queued if not queued.submitted]
+            wait([future] + arriving, return_when=FIRST_COMPLETED)
+
+    def fetch(self, url):
+        """
+        Return the content of the next queued page, as the fetch function would, if it's `url`. Pages that aren't next
+        in the queue are fetched on demand.
+        """
+        self.fill()
+        if self.queued and self.queued[0].page[0] == url:
+            self.current = self.queued.popleft()
+            self.fill()
+            self.wait_for(self.current.fetched)
+            if not self.current.submitted:
+                self.submit(self.current)
+            return self.current.raw_html
+        self.current = None
+        return self.fetch_page(url)
+
+    def parse(self, raw_html, url, show_type=ShowType.NORMAL, exclude=None):
+        """
+        Return the result for the page that was just fetched, as parse_page would, waiting for the pool to parse it if
+        it hasn't yet. A page that wasn't queued is parsed in this process.
+        """
+        current, self.current = self.current, None
+        if current is None or current.page != (url, show_type, exclude):
+            return parse_page(raw_html, url, show_type, exclude)
+        result = current.result
+        if isinstance(result, Future):
+            with ingest_metrics.timed('parse_wait'):
+                result, elapsed, stages = self.wait_for(result)
+            ingest_metrics.merge_stages(stages)
+            if parse_cache is not None:
+                parse_cache.put(url, raw_html, result, parse_options(show_type, exclude))
+            if args.parse_stats:
+                print("Parsed {0} in {1:.1f} ms".format(url, elapsed * 1000))
+                parse_stats.append((elapsed, None))
+        show, workers = parse_result_from_json(result)
+        if args.verbose:
+            print("Parsed show info {0}".format(show))
+        return show, workers
+
+    def close(self):
+        self.pending.clear()
+        for queued in self.queued:
+            queued.fetched.cancel()
+            if isinstance(queued.result, Future):
+                queued.result.cancel()
+        self.queued.clear()
+        self.current = None
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def init_parse_process(parse_args):
+    """
+    Set up a ParsePool process with the command line options the parser reads.
+    """
+    global args
+    args = parse_args
+
+
+def parse_page_in_process(raw_html, url, show_type, exclude):
+    """
+    Parse a show page in a ParsePool process.
+    :return: the parse_result_json of the show and its workers, the time taken to parse it, and the stage timings to
+        be merged into the main process's metrics (result, elapsed, stages)
+    """
+    ingest_metrics.reset()
+    start = time.perf_counter()
+    show, workers = parse_html(raw_html, url, show_type, exclude)
+    elapsed = time.perf_counter() - start
+    return parse_result_json(show, workers), elapsed, ingest_metrics.stages
+
+
+def get_parser_version():
+    """
+    The version stored with parse cache entries. It's a hash of the source of the PARSER_SOURCES, the page regions and
+    link fields they read, and the BeautifulSoup version and tree builder, so any change to the parser invalidates the
+    cached results without having to remember to bump it, while changes to the rest of the module don't.
+    :return: the version str
+    """
+    version = hashlib.sha1()
+    for name in PARSER_SOURCES:
+        version.update(inspect.getsource(globals()[name]).encode('utf-8'))
+    version.update(json.dumps([SHOW_PAGE_REGION_CLASSES, TYPE_FIELD, ID_FIELD, bs4.__version__, TARGETED_PARSER])
+                   .encode('utf-8'))
+    return version.hexdigest()
+
+
+def parse_options(show_type, exclude):
+    """
+    The options that change the result of parsing a page, as a str for the parse cache key.
+    """
+    return json.dumps([args.parse_mode, args.dntranslate, int(show_type), exclude])
+
+
+def parse_result_json(show, workers):
+    """
+    Serialise a parsed show and its workers for the parse cache.
+    """
+    promotion = None if show.promotion is None else [show.promotion.id, show.promotion.name]
+    return json.dumps({'show': [show.show_id, show.arena, show.date.isoformat(), show.show_name, promotion, show.url,
+                                int(show.is_partial)],
+                       'workers': [[worker.id, worker.name] for worker in workers]})
+
+
+def parse_result_from_json(result):
+    """
+    Rebuild the Show and Worker objects from a parse cache entry.
+    :return: the Show object and list of Worker objects (show, workers)
+    """
+    result = json.loads(result)
+    show_id, arena, date_str, show_name, promotion, url, is_partial = result['show']
+    if promotion is not None:
+        promotion = Promotion(*promotion)
+    show = Show(show_id, arena, date.fromisoformat(date_str), show_name, promotion, url, ShowType(is_partial))
+    return show, [Worker(worker_id, name) for worker_id, name in result['workers']]
+
+
+def make_soup(raw_html, parse_mode='targeted'):
+    """
+    Pass the raw HTML of a show page through BeautifulSoup.
+    In 'targeted' mode, only the regions the parser reads (the information box, the match results, and the All
+    Workers list) are built into the tree, using lxml to tokenize the page if it's installed, and html.parser if not.
+    In 'full' mode the whole page is parsed with html.parser.
+    :param raw_html: the page content
+    :param parse_mode: 'targeted' or 'full'
+    :return: the HTML as passed through BeautifulSoup
+    """
+    if parse_mode == 'targeted':
+        return BeautifulSoup(raw_html, TARGETED_PARSER, parse_only=SHOW_PAGE_REGIONS)
+    return BeautifulSoup(raw_html, 'html.parser')
+
+
+def print_parse_stats():
+    """
+    Print a summary of the time taken to parse each page, and the peak memory if it was measured.
+    """
+    if not parse_stats:
+        return
+    times = [elapsed for elapsed, peak in parse_stats]
+    print("Parsed {0} pages ({1} mode, {2}) in {3:.2f} s: mean {4:.1f} ms/page, max {5:.1f} ms".format(
+        len(parse_stats), args.parse_mode, TARGETED_PARSER if args.parse_mode == 'targeted' else 'html.parser',
+        sum(times), sum(times) / len(times) * 1000, max(times) * 1000))
+    peaks = [peak for elapsed, peak in parse_stats if peak is not None]
+    if peaks:
+        print("Peak parse memory: mean {0:.0f} KiB, max {1:.0f} KiB".format(sum(peaks) / len(peaks) / 1024,
+                                                                           max(peaks) / 1024))
 
 
 def get_urls(url):
@@ -285,6 +1151,40 @@ def get_urls(url):
     return urls
 
 
+def get_page_urls(url):
+    """
+    List every Cagematch page URL needed for a show entry, unwrapping merged and partial entries.
+    :param url: A URL str or a dict of URLs
+    :return: a list of page url strs
+    """
+    return [page_url for page_url, show_type, exclude in get_pages(url)]
+
+
+def get_pages(url):
+    """
+    List every page of a show entry, with how it's to be parsed, unwrapping merged and partial entries.
+    :param url: A URL str or a dict of URLs
+    :return: a list of (page url, show type, indexes of matches to exclude) tuples, exclude being None if the page
+        isn't a partial show
+    """
+    pages = []
+    for sub_url in get_urls(url):
+        sub_url, is_partial = check_is_partial(sub_url)
+        if is_partial:
+            exclude = sub_url['exclude']
+            exclude_from_count = sub_url.get('exclude_from_count') or False
+            if exclude_from_count:
+                show_type = ShowType.PARTIAL_EXCLUDED
+            else:
+                show_type = ShowType.PARTIAL
+            sub_url = sub_url['url']
+        else:
+            exclude = None
+            show_type = ShowType.NORMAL
+        pages.append((sub_url, show_type, exclude))
+    return pages
+
+
 def check_is_partial(url):
     """
     Check if the URL is a dict. If so, and the dict is named 'partial', return the sub-items, and True to indicate
@@ -304,27 +1204,30 @@ def parse_worker_list(html):
     """
     Tries to extract wrestler info by parsing the 'Comments Font9' div
     (All Workers).
-    The content is split on commas, and then the ID is fetched from each item
-    if present.
+    The div's contents are split on commas in a single pass, and then the ID
+    is fetched from each item if it has a profile link.
+    Items without a link are kept as plain text names if they pass
+    validate_worker.
     :param html: the HTML as passed through BeautifulSoup
     """
     all_workers = html.find("div", {"class": "Comments Font9"})
-    worker_list = (u''.join(str(item) for item in all_workers)).split(",")
+    match_text = None
     ret = []
-    for worker in worker_list:
+    for profile_link, worker in split_worker_list(all_workers):
         if args.verbose:
             print("Scraped worker being parsed: \'" + worker + "\'")
         worker_id = None
         worker_name = None
-        worker_soup = BeautifulSoup(worker, 'html.parser')
-        profile_link = worker_soup.find('a')
         if profile_link is not None:
             worker_id, worker_name = extract_worker_id_name(profile_link)
         else:
             plain_text_name = worker.strip()
-            if validate_worker(plain_text_name, html):
-                worker_id = plain_text_name
-                worker_name = plain_text_name
+            if plain_text_name:
+                if match_text is None:
+                    match_text = get_match_text(html)
+                if validate_worker(plain_text_name, match_text):
+                    worker_id = plain_text_name
+                    worker_name = plain_text_name
 
         if worker_id is not None:
             if args.verbose:
@@ -334,6 +1237,32 @@ def parse_worker_list(html):
     return ret
 
 
+def split_worker_list(all_workers):
+    """
+    Walk the child nodes of the All Workers div once, splitting the text nodes on commas. Tags are never split, so a
+    comma inside a link's text stays part of that worker.
+    :param all_workers: the 'Comments Font9' div, as parsed through BeautifulSoup
+    :return: a generator of (profile_link, text) pairs, one per comma separated item. profile_link is the first 'a'
+        tag in the item, or None if the item is plain text
+    """
+    profile_link = None
+    text = []
+    for node in all_workers.children:
+        if isinstance(node, Tag):
+            if profile_link is None:
+                profile_link = node if node.name == 'a' else node.find('a')
+            text.append(node.get_text())
+        else:
+            parts = str(node).split(",")
+            for part in parts[:-1]:
+                text.append(part)
+                yield profile_link, ''.join(text)
+                profile_link = None
+                text = []
+            text.append(parts[-1])
+    yield profile_link, ''.join(text)
+
+
 def extract_worker_id_name(profile_link):
     """
     From a discovered 'a' tag, check type field to verify ContentType.WRESTLER, then extract ID and Name
@@ -359,8 +1288,7 @@ def parse_show_info(html, url, show_type):
     :return: a Show object
     """
     dictionary = get_show_information_dictionary(html)
-    query_parts = parse_qs(urlparse(url).query)
-    show_id = query_parts.get(ID_FIELD)[0]
+    show_id = get_show_id(url)
     arena = dictionary["Arena:"].get_text()
     date_str = dictionary["Date:"].get_text()
     dd, mm, yy = date_str.split(".")
@@ -371,6 +1299,16 @@ def parse_show_info(html, url, show_type):
     return Show(show_id, arena, date_obj, show_name, promotion, url, show_type)
 
 
+def get_show_id(url):
+    """
+    Extract the Cagematch show ID from a show page URL.
+    :param url: the show URL
+    :return: the show ID str
+    """
+    query_parts = parse_qs(urlparse(url).query)
+    return query_parts.get(ID_FIELD)[0]
+
+
 def apply_translations(show_name, dntranslate=False):
     """
     Apply the following translations to strings:
@@ -420,11 +1358,66 @@ def get_show_information_dictionary(html):
 
 
 def main():
+    global parse_cache
     with open(args.filename, 'r') as yamlfile:
-        shows = yaml.safe_load(yamlfile)
+        shows = yaml.load(yamlfile, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
 
-    for show in shows:
-        parse_workers(show)
+    if args.incremental:
+        shows, changed = select_changed_entries(shows)
+    else:
+        shows, changed = select_replaced_entries(shows)
+
+    configure_session(args.pool_size, args.retries, args.backoff)
+    if args.cache_days is not None:
+        urls_expire_after = dict(URL_EXPIRY)
+        urls_expire_after[SHOW_PAGES] = -1 if args.cache_days < 0 else timedelta(days=args.cache_days)
+        configure_cache(urls_expire_after=urls_expire_after)
+
+    if not args.no_parse_cache:
+        parse_cache = ParseCache('parse_cache.sqlite', get_parser_version(), args.batch_size)
+        parse_cache.clear_stale()
+
+    fetcher = None
+    fetch = simple_get
+    if args.jobs > 1:
+        page_urls = [page_url for show in shows for page_url in get_page_urls(show)]
+        fetcher = PageFetcher(page_urls, max_workers=args.jobs, rate=args.rate)
+        fetch = fetcher.get
+    pool = None
+    parse = parse_page
+    if args.parse_processes > 1:
+        pool = ParsePool([page for show in shows for page in get_pages(show)], fetch, args.parse_processes,
+                         fetcher=fetcher)
+        fetch = pool.fetch
+        parse = pool.parse
+    try:
+        with ingest_metrics.timed('run'):
+            for show in shows:
+                parse_workers(show, fetch, bool(changed) and get_entry_show_id(show) in changed, parse)
+            if writer is not None:
+                writer.flush()
+    finally:
+        if pool is not None:
+            pool.close()
+        if fetcher is not None:
+            fetcher.close()
+        if writer is not None:
+            writer.flush()
+        if parse_cache is not None:
+            print("Parse cache: {0} pages reused, {1} parsed".format(parse_cache.hits, parse_cache.misses))
+            parse_cache.close()
+            parse_cache = None
+
+    print_failed_urls()
+    if failed_entries:
+        print("{0} show entries were skipped because pages could not be fetched:".format(len(failed_entries)))
+        for entry in failed_entries:
+            print("  {0}".format(entry))
+
+    if args.parse_stats or args.parse_memory:
+        print_parse_stats()
+    if args.metrics is not None:
+        ingest_metrics.write(args.metrics, args.metrics_file)
 
 
 if __name__ == "__main__":
@@ -432,6 +1425,9 @@ if __name__ == "__main__":
     parser.add_argument("-f", "--file", dest="filename",
                         help="file to be loaded", metavar="FILE",
                         default="shows.yaml")
+    parser.add_argument("-u", "--user", dest="user",
+                        help="the user whose show list is being loaded, each user's shows are kept separately",
+                        default=DEFAULT_USER)
     parser.add_argument("-v", "--verbose", dest="verbose",
                         help="output more info about what's being parsed",
                         action="store_true")
@@ -439,17 +1435,97 @@ if __name__ == "__main__":
                         help="don't perform translations, e.g Tag -> Day in show names",
                         action="store_true")
     parser.add_argument("-p", "--profile", dest="profiler",
-                        help="run profiling",
+                        help="run profiling, and print the functions that took the most cumulative time",
+                        action="store_true")
+    parser.add_argument("--metrics", dest="metrics",
+                        help="at the end of the run, output the time spent fetching, parsing and writing, and "
+                             "counters like cache hits, bytes downloaded and workers per show",
+                        choices=METRICS_FORMATS, default=None)
+    parser.add_argument("--metrics-file", dest="metrics_file",
+                        help="file to write the --metrics summary to, rather than printing it", metavar="FILE",
+                        default=None)
+    parser.add_argument("-j", "--jobs", dest="jobs",
+                        help="number of pages to fetch concurrently, 1 fetches each page as it is parsed",
+                        type=int, default=4)
+    parser.add_argument("-r", "--rate", dest="rate",
+                        help="maximum uncached requests per second to any one host",
+                        type=float, default=2.0)
+    parser.add_argument("--pool-size", dest="pool_size",
+                        help="number of connections to keep open to each host",
+                        type=int, default=10)
+    parser.add_argument("--retries", dest="retries",
+                        help="number of times to retry a page after a connection error or a 429/5xx response",
+                        type=int, default=3)
+    parser.add_argument("--backoff", dest="backoff",
+                        help="backoff factor in seconds between retries, doubled for each retry, unless Cagematch "
+                             "sends a Retry-After",
+                        type=float, default=1.0)
+    parser.add_argument("-b", "--batch-size", dest="batch_size",
+                        help="number of shows to write to the database in each transaction",
+                        type=int, default=50)
+    parser.add_argument("--commit-per-row", dest="commit_per_row",
+                        help="insert and commit each row on its own, rather than batching writes",
+                        action="store_true")
+    parser.add_argument("--wal", dest="wal",
+                        help="use write-ahead logging with synchronous=NORMAL for the database",
+                        action="store_true")
+    parser.add_argument("-i", "--incremental", dest="incremental",
+                        help="only fetch and parse shows that are new or changed since the last run, and delete "
+                             "shows that have been removed from the file",
+                        action="store_true")
+    parser.add_argument("--parse-mode", dest="parse_mode",
+                        help="'targeted' only builds the parts of each page that are read, using lxml if installed; "
+                             "'full' parses the whole page with html.parser",
+                        choices=['targeted', 'full'], default='targeted')
+    parser.add_argument("--parse-processes", dest="parse_processes",
+                        help="number of processes to parse pages on, while the main process fetches pages and writes "
+                             "to the database; 1 parses each page in the main process. Only helps when parsing is "
+                             "the bottleneck, like a re-ingest of cached pages with cores to spare",
+                        type=int, default=1)
+    parser.add_argument("--parse-stats", dest="parse_stats",
+                        help="report the parse time for each page, and a summary at the end",
+                        action="store_true")
+    parser.add_argument("--parse-memory", dest="parse_memory",
+                        help="also report the peak memory used to parse each page, by parsing it again under "
+                             "tracemalloc; fetches and parses pages one at a time so that other threads aren't traced",
+                        action="store_true")
+    parser.add_argument("--cache-days", dest="cache_days",
+                        help="days before a cached show page is revalidated with Cagematch, -1 to never revalidate",
+                        type=float, default=None)
+    parser.add_argument("--rebuild-rollups", dest="rebuild_rollups",
+                        help="recompute the rollup tables the dashboard reads from the shows and appearances, "
+                             "instead of loading shows",
+                        action="store_true")
+    parser.add_argument("--snapshot", dest="snapshot",
+                        help="at the end of the run, write a snapshot of the user's dashboard for app.py to start "
+                             "from, to the snapshots directory",
+                        action="store_true")
+    parser.add_argument("--no-parse-cache", dest="no_parse_cache",
+                        help="parse every page, rather than reusing the results for pages that haven't changed since "
+                             "they were last parsed",
                         action="store_true")
     args = parser.parse_args()
+    if args.parse_memory:
+        args.jobs = 1
+        args.parse_processes = 1
 
     conn = sqlite3.connect('thedatabase.sqlite3', check_same_thread=False)
     c = conn.cursor()
+    configure_connection(conn, args.wal)
+    if not args.commit_per_row:
+        writer = BatchWriter(conn, args.batch_size)
     if args.profiler:
         pr = cProfile.Profile()
         pr.enable()
     create_tables()
-    main()
+    if args.rebuild_rollups:
+        rebuild_rollups()
+    else:
+        main()
+    if args.snapshot:
+        # Imported here as it needs pandas and plotly, which the ingest doesn't otherwise
+        import snapshot
+        print("Wrote dashboard snapshot {0}".format(snapshot.write_snapshot('thedatabase.sqlite3', args.user)))
     if args.profiler:
         pr.disable()
-        pr.print_stats()
+        pstats.Stats(pr).sort_stats('cumulative').print_stats(PROFILE_LINES)
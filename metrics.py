@@ -0,0 +1,156 @@
+"""
+Timings and counters for an ingest run, so throughput can be tracked from run to run and a slow stage picked out.
+Each stage's calls and time are totalled, along with counters like cache hits and bytes downloaded, and observed values
+like the number of workers on each show. The summary can be written as JSON, or in the Prometheus text format.
+"""
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+FORMATS = ['json', 'prometheus']
+
+
+class Metrics(object):
+    """
+    Stage timings, counters and observed values, safe to record from the fetch threads.
+    Stages that run on more than one thread at once (like fetching) can add up to more than the run's wall time.
+    """
+
+    def __init__(self, prefix='graps'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.enabled = True
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.counters = {}
+            self.observations = {}
+
+    def add_time(self, stage, elapsed):
+        """
+        Record a call to a stage that took `elapsed` seconds.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            calls, total, longest = self.stages.get(stage, (0, 0.0, 0.0))
+            self.stages[stage] = (calls + 1, total + elapsed, max(longest, elapsed))
+
+    def merge_stages(self, stages):
+        """
+        Add stage timings recorded elsewhere, like another process's `stages`, to these.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            for stage, (calls, total, longest) in stages.items():
+                own_calls, own_total, own_longest = self.stages.get(stage, (0, 0.0, 0.0))
+                self.stages[stage] = (own_calls + calls, own_total + total, max(own_longest, longest))
+
+    @contextmanager
+    def timed(self, stage):
+        """
+        Time the block as a call to a stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    @contextmanager
+    def paused(self):
+        """
+        Don't record anything in the block, for work that's repeated, like the parse under tracemalloc.
+        """
+        self.enabled = False
+        try:
+            yield
+        finally:
+            self.enabled = True
+
+    def count(self, counter, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def observe(self, name, value):
+        """
+        Record a value, like the number of workers on a show, to be summarised by its count, sum, min and max.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            count, total, smallest, largest = self.observations.get(name, (0, 0, value, value))
+            self.observations[name] = (count + 1, total + value, min(smallest, value), max(largest, value))
+
+    def summary(self):
+        """
+        :return: a dict of the stages, counters and observations, sorted by name
+        """
+        with self.lock:
+            return {
+                'stages': {stage: {'calls': calls, 'seconds': total, 'max_seconds': longest,
+                                   'mean_ms': total / calls * 1000}
+                           for stage, (calls, total, longest) in sorted(self.stages.items())},
+                'counters': dict(sorted(self.counters.items())),
+                'observations': {name: {'count': count, 'sum': total, 'min': smallest, 'max': largest,
+                                        'mean': total / count}
+                                 for name, (count, total, smallest, largest) in sorted(self.observations.items())},
+            }
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self):
+        """
+        The summary in the Prometheus text exposition format, for a textfile collector or a push gateway.
+        """
+        summary = self.summary()
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            name = '{0}_{1}'.format(self.prefix, name)
+            lines.append('# HELP {0} {1}'.format(name, help_text))
+            lines.append('# TYPE {0} {1}'.format(name, metric_type))
+            for suffix, labels, value in samples:
+                lines.append('{0}{1}{2} {3}'.format(name, suffix, labels, value))
+
+        if summary['stages']:
+            stages = summary['stages'].items()
+            metric('stage_seconds_total', 'counter', 'Time spent in each stage.',
+                   [('', '{{stage="{0}"}}'.format(stage), repr(stats['seconds'])) for stage, stats in stages])
+            metric('stage_calls_total', 'counter', 'Calls to each stage.',
+                   [('', '{{stage="{0}"}}'.format(stage), stats['calls']) for stage, stats in stages])
+            metric('stage_max_seconds', 'gauge', 'Longest call to each stage.',
+                   [('', '{{stage="{0}"}}'.format(stage), repr(stats['max_seconds'])) for stage, stats in stages])
+        for counter, value in summary['counters'].items():
+            metric(counter + '_total', 'counter', 'Total {0}.'.format(counter.replace('_', ' ')), [('', '', value)])
+        for name, stats in summary['observations'].items():
+            metric(name, 'summary', 'Observed {0}.'.format(name.replace('_', ' ')),
+                   [('_count', '', stats['count']), ('_sum', '', stats['sum'])])
+            metric(name + '_max', 'gauge', 'Largest observed {0}.'.format(name.replace('_', ' ')),
+                   [('', '', stats['max'])])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, metrics_format='json', path=None):
+        """
+        Write the summary to a file, or print it if there's no path.
+        :param metrics_format: 'json' or 'prometheus'
+        :param path: the file to write, or None
+        """
+        text = self.to_prometheus() if metrics_format == 'prometheus' else self.to_json() + '\n'
+        if path is None:
+            print(text, end='')
+        else:
+            with open(path, 'w') as metrics_file:
+                metrics_file.write(text)
+
+
+# What the ingest records into, from graps.py and url_loading.py. Pages parsed on a ParsePool are timed in the pool's
+# processes, and their stages merged in here.
+ingest_metrics = Metrics()
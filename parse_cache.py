@@ -0,0 +1,81 @@
+"""
+A cache of parsed show pages, so pages that haven't changed since the last run don't have to go through BeautifulSoup
+again. Entries are keyed on the URL, a hash of the raw page, the parser version and the parse options, so an edited
+page, a changed parser, or different options all miss the cache rather than returning a stale result.
+"""
+import hashlib
+import sqlite3
+
+
+class ParseCache(object):
+    """
+    Parsed results stored in a SQLite database, as a JSON str per page. What goes in the JSON is up to the caller.
+    Writes are committed every `batch_size` pages, and when the cache is closed.
+    """
+
+    def __init__(self, path='parse_cache.sqlite', parser_version='', batch_size=50):
+        self.conn = sqlite3.connect(path)
+        self.parser_version = parser_version
+        self.batch_size = batch_size
+        self.uncommitted = 0
+        self.hits = 0
+        self.misses = 0
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS parsed_pages (url TEXT NOT NULL, content_hash TEXT NOT NULL,
+                             parser_version TEXT NOT NULL, options TEXT NOT NULL, result TEXT NOT NULL,
+                             PRIMARY KEY (url, options))''')
+        self.conn.commit()
+
+    @staticmethod
+    def content_hash(raw_html):
+        """
+        Hash the raw page, as bytes or str.
+        """
+        if isinstance(raw_html, str):
+            raw_html = raw_html.encode('utf-8')
+        return hashlib.sha1(raw_html).hexdigest()
+
+    def get(self, url, raw_html, options=''):
+        """
+        Return the cached result for the page, or None if this copy of the page hasn't been parsed with this parser
+        version and these options.
+        :param url: the page URL
+        :param raw_html: the page content
+        :param options: a str of anything else that changes the parse result
+        :return: the result str or None
+        """
+        row = self.conn.execute('''SELECT result FROM parsed_pages
+                                   WHERE url = ? AND options = ? AND content_hash = ? AND parser_version = ?''',
+                                (url, options, self.content_hash(raw_html), self.parser_version)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, url, raw_html, result, options=''):
+        """
+        Store the result of parsing a page, replacing any result for an older copy of it.
+        """
+        self.conn.execute('INSERT OR REPLACE INTO parsed_pages VALUES (?, ?, ?, ?, ?)',
+                          (url, self.content_hash(raw_html), self.parser_version, options, result))
+        self.uncommitted += 1
+        if self.uncommitted >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self.uncommitted = 0
+
+    def clear_stale(self):
+        """
+        Delete the entries written by other parser versions.
+        :return: the number of entries deleted
+        """
+        deleted = self.conn.execute('DELETE FROM parsed_pages WHERE parser_version != ?',
+                                    (self.parser_version,)).rowcount
+        self.commit()
+        return deleted
+
+    def close(self):
+        self.commit()
+        self.conn.close()
@@ -0,0 +1,300 @@
+"""
+The queries behind the dashboard. Each one is run the first time it's needed, and the result is kept until the
+database changes, so the dashboard picks up a new ingest without restarting, and without re-running every query on
+every callback.
+pandas and numpy are only imported once a query needs them, so a dashboard started from a snapshot never loads them.
+"""
+from functools import wraps
+import os
+import re
+import sqlite3
+import threading
+
+MONTHS = 12
+
+# Rows on each page of the dashboard tables
+TABLE_PAGE_SIZE = 10
+
+# The user graps.py ingests into when it isn't given one
+DEFAULT_USER = 'default'
+
+# The tables the dashboard pages through in SQL. For each, the query for all its rows, the columns that can be sorted
+# and filtered on, and the order the rows come in when they aren't sorted, which also breaks ties when they are.
+PAGED_TABLES = {
+    'top-wrestlers': ('SELECT workers.name AS name, worker_appearances.appearances AS appearances FROM worker_appearances INNER JOIN workers on workers.worker_id = worker_appearances.worker_id WHERE worker_appearances.user_id = ?',
+                      ['name', 'appearances'], 'appearances DESC, name ASC'),
+    'top-promotions': ('SELECT promotion_year_shows.show_year AS show_year, promotions.name AS name, sum(promotion_year_shows.show_count) AS show_count FROM promotion_year_shows INNER JOIN promotions on promotions.promotion_id = promotion_year_shows.promotion_id WHERE promotion_year_shows.user_id = ? GROUP BY show_year, promotions.name',
+                       ['name', 'show_count', 'show_year'], 'show_year ASC, name ASC'),
+}
+
+# DataTable filter operators, as they appear in a filter_query, and the SQL they become
+FILTER_OPERATORS = [('>=', '>='), ('<=', '<='), ('!=', '!='), ('>', '>'), ('<', '<'), ('=', '='),
+                    ('ge', '>='), ('le', '<='), ('ne', '!='), ('gt', '>'), ('lt', '<'), ('eq', '='),
+                    ('contains', 'LIKE'), ('datestartswith', 'LIKE')]
+
+
+def memoized(query):
+    """
+    Decorator for DataStore methods, which keeps each result until the database changes.
+    """
+    @wraps(query)
+    def wrapper(self, *args):
+        return self.memoize((query.__name__,) + args, lambda: query(self, *args))
+    return wrapper
+
+
+class DataStore(object):
+    """
+    Runs the dashboard queries against the database at `path`, and memoizes the results. Queries are for one user's
+    shows, passed as the first argument.
+    Before a result is reused, the database is checked for changes, with `PRAGMA data_version` (which changes when
+    another connection commits) and the file's modification time, size and inode (which change if the file is
+    replaced). Any change throws away every result.
+    """
+
+    def __init__(self, path='thedatabase.sqlite3'):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = None
+        self.inode = None
+        self.version = None
+        self.results = {}
+
+    def connect(self):
+        if self.conn is not None:
+            self.conn.close()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.inode = os.stat(self.path).st_ino
+
+    def data_version(self):
+        """
+        A value that changes whenever the data in the database does.
+        """
+        stat = os.stat(self.path)
+        if self.conn is None or stat.st_ino != self.inode:
+            # The file has been replaced, the old connection would still be reading the old one
+            self.connect()
+        data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        return data_version, stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def memoize(self, key, compute):
+        """
+        Return the result stored under `key`, or compute and store it if there isn't one for the current data.
+        :param key: a hashable key for the result
+        :param compute: function returning the result
+        """
+        with self.lock:
+            version = self.data_version()
+            if version != self.version:
+                self.results = {}
+                self.version = version
+            if key not in self.results:
+                self.results[key] = compute()
+            return self.results[key]
+
+    def preload(self, results, version):
+        """
+        Store results computed elsewhere, like a snapshot's, if the data is still at `version`.
+        :param results: a dict of results by key
+        :param version: the data version the results were checked against, from `self.version`
+        :return: True if the results were stored
+        """
+        with self.lock:
+            if version is None or self.data_version() != version or self.version != version:
+                return False
+            self.results.update(results)
+            return True
+
+    def scalar(self, query, params=()):
+        return self.conn.execute(query, params).fetchone()[0]
+
+    def read_df(self, query, params=()):
+        import pandas
+        return pandas.read_sql_query(query, self.conn, params=params)
+
+    @memoized
+    def worker_count(self, user):
+        return self.scalar("SELECT Count() FROM worker_appearances WHERE user_id = ?", (user,))
+
+    @memoized
+    def promotion_count(self, user):
+        return self.scalar("SELECT Count(DISTINCT promotion_id) FROM promotion_year_shows WHERE user_id = ?", (user,))
+
+    @memoized
+    def show_count(self, user):
+        return self.scalar("SELECT Count() FROM shows WHERE shows.user_id = ? AND shows.is_partial < 2", (user,))
+
+    @memoized
+    def excluded_show_count(self, user):
+        return self.scalar("SELECT Count() FROM shows WHERE shows.user_id = ? AND shows.is_partial = 2", (user,))
+
+    @memoized
+    def appearances_df(self, user):
+        return self.read_df('SELECT name, worker_appearances.appearances AS \'appearances\' FROM worker_appearances INNER JOIN workers on workers.worker_id = worker_appearances.worker_id WHERE worker_appearances.user_id = ? ORDER BY appearances DESC', (user,))
+
+    @memoized
+    def shows_df(self, user):
+        return self.read_df('SELECT promotions.name, sum(promotion_year_shows.show_count) AS \'att_shows\' FROM promotion_year_shows INNER JOIN promotions on promotions.promotion_id = promotion_year_shows.promotion_id WHERE promotion_year_shows.user_id = ? GROUP by promotion_year_shows.promotion_id', (user,))
+
+    @memoized
+    def year_counter_df(self, user):
+        return self.read_df('SELECT show_year, sum(show_count) AS show_count FROM month_shows WHERE user_id = ? GROUP BY show_year', (user,))
+
+    @memoized
+    def year_name_count_df(self, user):
+        return self.read_df('SELECT promotion_year_shows.show_year, promotions.name, sum(promotion_year_shows.show_count) AS show_count FROM promotion_year_shows INNER JOIN promotions on promotions.promotion_id = promotion_year_shows.promotion_id WHERE promotion_year_shows.user_id = ? GROUP BY promotion_year_shows.show_year, promotions.name', (user,))
+
+    @memoized
+    def promotions_df(self, user):
+        return self.read_df('SELECT DISTINCT promotions.promotion_id, promotions.name FROM promotion_year_shows INNER JOIN promotions on promotions.promotion_id = promotion_year_shows.promotion_id WHERE promotion_year_shows.user_id = ? ORDER BY promotions.name', (user,))
+
+    @memoized
+    def workers_df(self, user):
+        return self.read_df('SELECT workers.worker_id, workers.name FROM worker_appearances INNER JOIN workers on workers.worker_id = worker_appearances.worker_id WHERE worker_appearances.user_id = ? ORDER BY workers.name', (user,))
+
+    @memoized
+    def shows_heatmap_df(self, user, promotion=None, worker=None):
+        """
+        The number of shows the user saw in each month that had any, optionally only counting the shows of one
+        promotion, or the shows one worker was on. Unfiltered counts come straight from the month_shows rollup.
+        """
+        if promotion is None and worker is None:
+            return self.read_df('SELECT show_month, show_year, show_count AS show_number FROM month_shows WHERE user_id = ? ORDER BY show_year ASC, show_month ASC', (user,))
+        return self.read_df('SELECT strftime(\'%m\', shows.show_date) AS show_month, strftime(\'%Y\', shows.show_date) AS show_year, COUNT(*) AS show_number FROM shows '
+                            'WHERE shows.user_id = :user '
+                            'AND (:promotion IS NULL OR shows.promotion = :promotion) '
+                            'AND (:worker IS NULL OR shows.show_id IN (SELECT show_id FROM appearances WHERE user_id = :user AND worker_id = :worker)) '
+                            'GROUP BY show_year, show_month ORDER BY show_year ASC, show_month ASC',
+                            {'user': user, 'promotion': promotion, 'worker': worker})
+
+    @memoized
+    def shows_heatmap_grid(self, user, promotion=None, worker=None):
+        return year_month_grid(self.shows_heatmap_df(user, promotion, worker))
+
+    @memoized
+    def table_page(self, user, table, page_current, page_size, sort_by=(), filter_query=''):
+        """
+        Fetch one page of a PAGED_TABLES table for a user, sorted and filtered in SQL, so only the rows on the page are
+        loaded.
+        :param user: the user ID
+        :param table: the table ID
+        :param page_current: the page number, from 0
+        :param page_size: the number of rows on a page
+        :param sort_by: (column, direction) pairs, direction being 'asc' or 'desc'
+        :param filter_query: a DataTable filter query, like '{name} contains Walter && {appearances} > 5'
+        :return: the rows as a list of dicts
+        """
+        query, columns, default_order = PAGED_TABLES[table]
+        where, params = filter_sql(filter_query, columns)
+        order = ', '.join('{0} {1}'.format(column, 'DESC' if direction == 'desc' else 'ASC')
+                          for column, direction in sort_by if column in columns)
+        order = order + ', ' + default_order if order else default_order
+        return self.read_df('SELECT * FROM ({0}) {1} ORDER BY {2} LIMIT ? OFFSET ?'.format(query, where, order),
+                            [user] + params + [page_size, page_current * page_size]).to_dict('records')
+
+    @memoized
+    def table_count(self, user, table, filter_query=''):
+        """
+        The number of rows in a PAGED_TABLES table for a user, after filtering.
+        """
+        query, columns, default_order = PAGED_TABLES[table]
+        where, params = filter_sql(filter_query, columns)
+        return self.scalar('SELECT count(*) FROM ({0}) {1}'.format(query, where), [user] + params)
+
+    @memoized
+    def streaks_df(self, user):
+        return self.read_df('SELECT show_year, show_month FROM month_shows WHERE user_id = ? ORDER BY show_year ASC, show_month ASC', (user,))
+
+    @memoized
+    def latest_and_longest_streaks(self, user):
+        """
+        The user's latest and longest streaks, see streaks.latest_and_longest, as [start, end, count] lists.
+        """
+        import streaks
+        streaks_df = self.streaks_df(user)
+        return [None if streak is None else [streak.start, streak.end, streak.count] for streak in
+                streaks.latest_and_longest(streaks.find_streaks(streaks_df['show_year'], streaks_df['show_month']))]
+
+    @memoized
+    def promotion_names(self, user):
+        return self.promotions_df(user).values.tolist()
+
+    @memoized
+    def worker_names(self, user):
+        return self.workers_df(user).values.tolist()
+
+    @memoized
+    def generation(self, user):
+        """
+        A number that goes up whenever the user's shows change.
+        """
+        row = self.conn.execute('SELECT generation FROM user_generations WHERE user_id = ?', (user,)).fetchone()
+        return 0 if row is None else row[0]
+
+    @memoized
+    def users(self):
+        return [user for (user,) in self.conn.execute('SELECT DISTINCT user_id FROM shows ORDER BY user_id')]
+
+
+def year_month_grid(heatmap_df):
+    """
+    Lay the monthly show counts out as a grid, with a row for every year from the first show to the last (including
+    years without any shows) and a column for each month. The counts are scattered into the grid in one go, by their
+    year and month offsets.
+    :param heatmap_df: the show_year, show_month and show_number columns from shows_heatmap_df
+    :return: the years and the grid rows (years, rows), with None for months without shows
+    """
+    if heatmap_df.empty:
+        return [], []
+    import numpy
+    years = heatmap_df['show_year'].to_numpy(dtype=int)
+    first_year = years.min()
+    grid = numpy.full((years.max() - first_year + 1, MONTHS), None, dtype=object)
+    grid[years - first_year, heatmap_df['show_month'].to_numpy(dtype=int) - 1] = heatmap_df['show_number'].tolist()
+    return list(range(int(first_year), int(years.max()) + 1)), grid.tolist()
+
+
+def filter_sql(filter_query, columns):
+    """
+    Turn a DataTable filter query into a SQL WHERE clause. Only the given columns can be filtered on, and values are
+    passed as parameters, so nothing from the query is put in the SQL as is. Parts that can't be parsed are ignored.
+    :param filter_query: the filter query, parts joined with ' && '
+    :param columns: the columns that can be filtered on
+    :return: the WHERE clause (or '') and its parameters (where, params)
+    """
+    conditions = []
+    params = []
+    for part in (filter_query or '').split(' && '):
+        match = re.match(r'\s*\{(\w+)\}\s*(\S+)\s+(.*?)\s*$', part)
+        if match is None or match.group(1) not in columns:
+            continue
+        column, operator, value = match.groups()
+        sql_operator = dict(FILTER_OPERATORS).get(operator)
+        if sql_operator is None:
+            continue
+        value = filter_value(value)
+        if operator == 'contains':
+            conditions.append("{0} LIKE '%' || ? || '%'".format(column))
+        elif operator == 'datestartswith':
+            conditions.append("{0} LIKE ? || '%'".format(column))
+        else:
+            conditions.append('{0} {1} ?'.format(column, sql_operator))
+        params.append(value)
+    if not conditions:
+        return '', []
+    return 'WHERE ' + ' AND '.join(conditions), params
+
+
+def filter_value(value):
+    """
+    Unquote a filter value, and turn it into a number if it looks like one, so it compares with numeric columns.
+    """
+    if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'`':
+        return value[1:-1]
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
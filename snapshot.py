@@ -0,0 +1,96 @@
+"""
+Snapshots of a user's dashboard, written by graps.py at the end of an ingest, so the dashboard can start without
+running its queries or building its figures. A snapshot holds the DataStore results the dashboard reads first: the
+counts, the streaks, the first page of each table, the heatmap dropdowns, and the figures, already serialized.
+It's stamped with the user's generation (see graps.CREATE_GENERATION_TRIGGERS), and only loaded while that still
+matches the database, so it's never stale.
+"""
+import json
+import os
+from urllib.parse import quote
+
+from plotly.utils import PlotlyJSONEncoder
+
+import figures
+import queries
+
+SNAPSHOT_DIR = 'snapshots'
+
+# Bumped when what's in a snapshot changes, so old snapshots are ignored
+SNAPSHOT_FORMAT = 1
+
+# The counts at the top of the dashboard
+COUNTS = ['worker_count', 'show_count', 'promotion_count', 'excluded_show_count']
+
+
+def snapshot_path(user, snapshot_dir=SNAPSHOT_DIR):
+    """
+    The user's snapshot file. The user ID is quoted, so a user from a URL can't point outside the directory.
+    """
+    return os.path.join(snapshot_dir, quote(user, safe='') + '.json')
+
+
+def compute_results(store, user):
+    """
+    Run everything the dashboard needs on a page load, so it's all in the store's results.
+    """
+    for count in COUNTS:
+        getattr(store, count)(user)
+    store.latest_and_longest_streaks(user)
+    store.promotion_names(user)
+    store.worker_names(user)
+    for table in queries.PAGED_TABLES:
+        store.table_page(user, table, 0, queries.TABLE_PAGE_SIZE, (), '')
+        store.table_count(user, table, '')
+    for name in figures.FIGURES:
+        figures.figure(store, name, user)
+
+
+def write_snapshot(database, user, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Write a snapshot of a user's dashboard.
+    :param database: the database path
+    :param user: the user ID
+    :param snapshot_dir: the directory to write it to
+    :return: the snapshot's path
+    """
+    store = queries.DataStore(database)
+    compute_results(store, user)
+    # A fresh store only holds this user's results, the DataFrames they were worked out from aren't needed
+    results = [[list(key), value] for key, value in store.results.items()
+               if not key[0].endswith('_df') and key[0] != 'shows_heatmap_grid']
+    generation = store.generation(user)
+    path = snapshot_path(user, snapshot_dir)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with open(path + '.tmp', 'w') as snapshot_file:
+        json.dump({'format': SNAPSHOT_FORMAT, 'user': user, 'generation': generation, 'results': results},
+                  snapshot_file, cls=PlotlyJSONEncoder, separators=(',', ':'))
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def as_key(key):
+    """
+    Turn a key read back from JSON into the tuple the DataStore uses, with its lists (like sort_by) as tuples too.
+    """
+    return tuple(as_key(part) if isinstance(part, list) else part for part in key)
+
+
+def load_snapshot(store, user, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Preload the store with a user's snapshot, if there's one and it's up to date with the database.
+    :return: True if the snapshot was loaded
+    """
+    try:
+        with open(snapshot_path(user, snapshot_dir), 'r') as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except (OSError, ValueError):
+        return False
+    if snapshot.get('format') != SNAPSHOT_FORMAT or snapshot.get('user') != user:
+        return False
+    results = {as_key(key): value for key, value in snapshot['results']}
+    with store.lock:
+        if snapshot.get('generation') != store.generation(user):
+            return False
+        # Not loaded if the database changes between checking the generation and loading
+        return store.preload(results, store.version)
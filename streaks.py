@@ -0,0 +1,78 @@
+"""
+Find streaks of consecutive months with at least one show. Works on any year and month columns, so it can be used
+outside the dashboard. numpy and pandas are imported when streaks are looked for, so the Streak class can be used
+without them.
+"""
+from datetime import date
+
+
+class Streak:
+    """A run of consecutive months with at least one show, from start to end inclusive, as (year, month) pairs."""
+
+    def __init__(self, start, end, count):
+        self.start = start
+        self.end = end
+        self.count = count
+
+    def __repr__(self):
+        return "{0[1]:02d}/{0[0]} and {1[1]:02d}/{1[0]}".format(self.start, self.end)
+
+    def __eq__(self, other):
+        return isinstance(other, Streak) and (self.start, self.end, self.count) == (other.start, other.end, other.count)
+
+    def is_ongoing(self, today=None):
+        """
+        Whether the streak is still going, meaning its last month is this month or last month.
+        """
+        today = today or date.today()
+        return month_ordinal(today.year, today.month) - month_ordinal(*self.end) <= 1
+
+
+def month_ordinal(year, month):
+    """
+    Number months consecutively, so that December of one year is followed by January of the next.
+    Works on ints or numpy arrays.
+    """
+    return year * 12 + (month - 1)
+
+
+def find_streaks(years, months):
+    """
+    Find every streak of consecutive months in a list of months with shows.
+    The months are converted to ordinals, then a new streak starts wherever the gap to the previous month isn't 1,
+    so numbering the streaks is a cumulative sum of those breaks.
+    :param years: the year of each month with a show, as ints or numeric strs
+    :param months: the month number of each month with a show, in the same order
+    :return: a DataFrame of the streaks in date order, with start_year, start_month, end_year, end_month and length
+    columns
+    """
+    import numpy
+    import pandas
+    ordinals = numpy.unique(month_ordinal(numpy.asarray(years, dtype=int), numpy.asarray(months, dtype=int)))
+    if len(ordinals) == 0:
+        return pandas.DataFrame({column: numpy.array([], dtype=int) for column in
+                                 ['start_year', 'start_month', 'end_year', 'end_month', 'length']})
+    breaks = numpy.diff(ordinals, prepend=ordinals[0] - 2) != 1
+    starts = ordinals[breaks]
+    ends = numpy.append(ordinals[numpy.flatnonzero(breaks)[1:] - 1], ordinals[-1])
+    return pandas.DataFrame({'start_year': starts // 12, 'start_month': starts % 12 + 1,
+                             'end_year': ends // 12, 'end_month': ends % 12 + 1,
+                             'length': ends - starts + 1})
+
+
+def to_streak(row):
+    return Streak((int(row.start_year), int(row.start_month)), (int(row.end_year), int(row.end_month)),
+                  int(row.length))
+
+
+def latest_and_longest(streaks):
+    """
+    Pick out the latest streak, and the longest one. If more than one streak is the longest, it's the most recent.
+    :param streaks: the DataFrame from find_streaks
+    :return: the latest and longest Streaks (latest, longest), or (None, None) if there are no streaks
+    """
+    if streaks.empty:
+        return None, None
+    import numpy
+    longest = numpy.flatnonzero(streaks['length'].to_numpy() == streaks['length'].max())[-1]
+    return to_streak(streaks.iloc[-1]), to_streak(streaks.iloc[longest])
@@ -0,0 +1,37 @@
+import numpy
+import pytest
+
+# The vendored heatmap needs plotly's validators, which plotly 6 moved
+_annotated_heatmap = pytest.importorskip('_annotated_heatmap')
+
+
+def annotation(text, x, y, color):
+    return {'text': text, 'x': x, 'y': y, 'xref': 'x', 'yref': 'y', 'font': {'color': color}, 'showarrow': False}
+
+
+def test_annotations_and_font_colors():
+    heatmap = _annotated_heatmap._AnnotatedHeatmap([[1, None, 3], [2, 5, None]], ['Jan', 'Feb', 'Mar'], [2018, 2019],
+                                                   None, 'Viridis', [], False)
+    white, black = '#FFFFFF', '#000000'
+    assert heatmap.make_annotations() == [
+        annotation('1', 'Jan', 2018, white), annotation('', 'Feb', 2018, white), annotation('3', 'Mar', 2018, black),
+        annotation('2', 'Jan', 2019, white), annotation('5', 'Feb', 2019, black), annotation('', 'Mar', 2019, white),
+    ]
+
+
+def test_nan_cells_are_empty_like_none():
+    z = [[1.5, None], [None, 4.0]]
+    from_list = _annotated_heatmap._AnnotatedHeatmap(z, None, None, None, 'Viridis', [], False)
+    from_array = _annotated_heatmap._AnnotatedHeatmap(numpy.array(z, dtype=float), None, None, None, 'Viridis', [],
+                                                      False)
+    assert from_list.make_annotations() == from_array.make_annotations()
+    assert [a['text'] for a in from_array.make_annotations()] == ['1.5', '', '', '4.0']
+
+
+def test_figure_is_validated_as_before():
+    font_colors = ['#111111', '#EEEEEE']
+    figure = _annotated_heatmap.create_annotated_heatmap(z=[[1, None], [3, 4]], x=['Jan', 'Feb'], y=[2018, 2019],
+                                                         font_colors=font_colors)
+    assert [a.to_plotly_json() for a in figure.layout.annotations] == \
+        _annotated_heatmap._AnnotatedHeatmap([[1, None], [3, 4]], ['Jan', 'Feb'], [2018, 2019], None, 'Plasma',
+                                             font_colors, False).make_annotations()
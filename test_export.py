@@ -0,0 +1,63 @@
+import datetime
+import sqlite3
+
+import pytest
+
+pyarrow = pytest.importorskip('pyarrow')
+import pyarrow.compute
+
+import export
+import graps
+from test_offline import ingest_offline, worker_rows
+
+TABLES = ['promotions', 'shows', 'promotion_year_shows', 'month_shows']
+
+
+def table_rows(conn, tables):
+    return [sorted(conn.execute('SELECT * FROM ' + table), key=str) for table in tables]
+
+
+@pytest.mark.parametrize('file_format', export.FORMATS)
+def test_export_types_and_facts(tmp_path, file_format):
+    conn = ingest_offline()
+    counts = export.export_database(conn, str(tmp_path), file_format, chunk_size=50)
+    assert counts['shows'] == 5
+    assert counts['appearance_facts'] == counts['appearances'] == \
+        conn.execute('SELECT count(*) FROM appearances').fetchone()[0]
+
+    path = export.export_path(str(tmp_path), 'appearance_facts', file_format)
+    batches = list(export.read_batches(path, file_format))
+    if file_format == 'parquet':
+        assert pyarrow.parquet.ParquetFile(path).num_row_groups > 1, "Written in chunks"
+    else:
+        assert len(batches) > 1, "Written in chunks"
+    facts = pyarrow.Table.from_batches(batches)
+    assert facts.schema.field('show_date').type == pyarrow.date32()
+    assert facts.schema.field('promotion_id').type == pyarrow.int64()
+    normal = facts.filter(pyarrow.compute.equal(facts['show_id'], '900001')).to_pylist()
+    assert len(normal) == 13
+    assert {row['show_date'] for row in normal} == {datetime.date(2019, 4, 21)}
+    assert {row['promotion_id'] for row in normal} == {1005}
+    assert 'Hektor Invictus' in {row['worker_name'] for row in normal}
+    assert facts.schema.field('cagematch_id').type == pyarrow.int64()
+    assert None in {row['cagematch_id'] for row in facts.to_pylist()}, "Plain text workers have no Cagematch ID"
+
+
+@pytest.mark.parametrize('file_format', export.FORMATS)
+def test_import_loads_an_export(tmp_path, file_format):
+    exported = ingest_offline()
+    expected = table_rows(exported, TABLES), worker_rows(exported)
+    export.export_database(exported, str(tmp_path / 'export'), file_format)
+
+    conn = sqlite3.connect(str(tmp_path / 'thedatabase.sqlite3'))
+    graps.conn = conn
+    graps.c = conn.cursor()
+    graps.create_tables()
+    with conn:
+        # So the workers' IDs in this database aren't the ones in the export
+        conn.execute("INSERT INTO workers(plain_name, name) VALUES ('Someone Else', 'Someone Else')")
+    counts = export.import_database(conn, str(tmp_path / 'export'), file_format, chunk_size=50)
+    assert counts['shows'] == 5
+    assert (table_rows(conn, TABLES), worker_rows(conn)) == expected
+    triggers = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    assert set(graps.ROLLUP_TRIGGERS) <= triggers, "The rollup triggers are put back"
@@ -0,0 +1,82 @@
+import itertools
+
+import graps
+from graps import extract_worker_id_name, filter_excluded, parse_worker_list
+from tests import corpus
+
+graps.args = corpus.graps_args()
+
+
+def legacy_filter_excluded(workers, exclude, bs_html):
+    """
+    The original implementation, which re-parses every link in the excluded and included matches for each worker.
+    """
+    exclude_matches = []
+    include_matches = []
+    divs = bs_html.find("div", {"class": "Matches"})
+    i = 1
+    for div in divs:
+        result = div.find("div", {"class": "MatchResults"})
+        if i in exclude:
+            exclude_matches.append(result)
+        else:
+            include_matches.append(result)
+        i = i + 1
+
+    newlist = []
+    for worker in workers:
+        if isinstance(worker.id, int):
+            found_exclude = False
+            for result in exclude_matches:
+                for profile_link in result.find_all('a'):
+                    if profile_link is not None:
+                        worker_id, worker_name = extract_worker_id_name(profile_link)
+                        if worker_id == worker.id:
+                            found_exclude = True
+            if found_exclude:
+                found_include = False
+                for result in include_matches:
+                    for profile_link in result.find_all('a'):
+                        if profile_link is not None:
+                            worker_id, worker_name = extract_worker_id_name(profile_link)
+                            if worker_id == worker.id:
+                                found_include = True
+            if found_exclude and not found_include:
+                pass
+            else:
+                newlist.append(worker)
+        elif any(worker.name in s for s in exclude_matches) and not any(worker.name in s for s in include_matches):
+            pass
+        else:
+            newlist.append(worker)
+
+    return newlist
+
+
+def test_filter_excluded_parity():
+    for path in corpus.PAGES:
+        html = corpus.load_page(path)
+        workers = parse_worker_list(html)
+        match_count = len(html.find("div", {"class": "Matches"}).contents)
+        indexes = range(1, match_count + 1)
+        for exclude in itertools.chain(itertools.combinations(indexes, 1), itertools.combinations(indexes, 2)):
+            exclude = list(exclude)
+            assert filter_excluded(workers, exclude, html) == legacy_filter_excluded(workers, exclude, html), \
+                "{0} excluding {1}".format(path, exclude)
+
+
+def test_filter_excluded_similar_names():
+    html = corpus.load_page("partial.html")
+    names = [worker.name for worker in filter_excluded(parse_worker_list(html), [5], html)]
+    assert "KAI" not in names
+    assert "LA Park" not in names
+    assert "Kaito Ishida" in names
+    assert "El Hijo de LA Park" in names
+    assert "LA Park Jr." in names
+    assert "Shota" in names, "Shota is also in match 1, so shouldn't be excluded"
+
+
+if __name__ == "__main__":
+    test_filter_excluded_parity()
+    test_filter_excluded_similar_names()
+    print("Everything passed")
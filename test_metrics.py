@@ -0,0 +1,72 @@
+import json
+
+from metrics import Metrics, ingest_metrics
+from test_offline import ingest_offline
+
+
+def test_stages_counters_and_observations():
+    metrics = Metrics()
+    with metrics.timed('parse'):
+        pass
+    metrics.add_time('parse', 0.5)
+    metrics.count('http_cache_hits')
+    metrics.count('bytes_downloaded', 1024)
+    metrics.count('bytes_downloaded', 1024)
+    for workers in [3, 10, 5]:
+        metrics.observe('workers_per_show', workers)
+    with metrics.paused():
+        metrics.count('http_cache_hits')
+        metrics.add_time('parse', 10)
+
+    summary = metrics.summary()
+    assert summary['stages']['parse']['calls'] == 2
+    assert 0.5 <= summary['stages']['parse']['seconds'] < 1
+    assert summary['stages']['parse']['max_seconds'] == 0.5
+    assert summary['counters'] == {'bytes_downloaded': 2048, 'http_cache_hits': 1}
+    assert summary['observations']['workers_per_show'] == {'count': 3, 'sum': 18, 'min': 3, 'max': 10, 'mean': 6}
+    assert json.loads(metrics.to_json()) == summary
+
+
+def test_stages_are_merged():
+    metrics = Metrics()
+    metrics.add_time('soup', 0.5)
+    other = Metrics()
+    other.add_time('soup', 1.0)
+    other.add_time('soup', 0.25)
+    other.add_time('worker_list', 0.125)
+    metrics.merge_stages(other.stages)
+    assert metrics.stages == {'soup': (3, 1.75, 1.0), 'worker_list': (1, 0.125, 0.125)}
+
+
+def test_prometheus_text():
+    metrics = Metrics()
+    metrics.add_time('fetch', 0.25)
+    metrics.count('http_cache_misses', 2)
+    metrics.observe('workers_per_show', 7)
+    lines = metrics.to_prometheus().splitlines()
+    assert '# TYPE graps_stage_seconds_total counter' in lines
+    assert 'graps_stage_seconds_total{stage="fetch"} 0.25' in lines
+    assert 'graps_stage_calls_total{stage="fetch"} 1' in lines
+    assert 'graps_http_cache_misses_total 2' in lines
+    assert 'graps_workers_per_show_count 1' in lines
+    assert 'graps_workers_per_show_sum 7' in lines
+
+
+def test_offline_ingest_is_measured():
+    ingest_metrics.reset()
+    ingest_offline()
+    summary = ingest_metrics.summary()
+    assert {'fetch_wait', 'soup', 'show_info', 'worker_list', 'filter_excluded', 'db_write'} <= set(summary['stages'])
+    assert summary['stages']['soup']['calls'] == 6, "One parse per page, the taping has two"
+    assert summary['stages']['filter_excluded']['calls'] == 2, "Only the two partial pages are filtered"
+    assert summary['counters']['shows_stored'] == 5
+    assert summary['observations']['workers_per_show']['count'] == 5
+
+
+def test_pages_parsed_on_processes_are_measured():
+    ingest_metrics.reset()
+    ingest_offline(parse_processes=2)
+    summary = ingest_metrics.summary()
+    assert summary['stages']['soup']['calls'] == 6, "The parse processes' stages are merged in"
+    assert summary['stages']['parse_wait']['calls'] == 6
+    assert summary['counters']['shows_stored'] == 5
@@ -0,0 +1,302 @@
+import sqlite3
+import time
+
+import graps
+from tests import corpus
+
+
+def ingest_offline(commit_per_row=False, path=':memory:', user='default', parse_processes=1, jobs=1):
+    """
+    Run every entry in tests/test_offline.yaml through parse_workers into a user's partition of a database, in memory
+    by default. With more than one parse process, pages are parsed on a ParsePool, and with more than one job, they're
+    fetched on a PageFetcher.
+    """
+    graps.args = corpus.graps_args(user=user)
+    graps.conn = sqlite3.connect(path)
+    graps.c = graps.conn.cursor()
+    graps.writer = None if commit_per_row else graps.BatchWriter(graps.conn, 2)
+    graps.create_tables()
+    shows = corpus.load_offline_shows()
+    fetcher = None
+    if jobs > 1:
+        fetcher = corpus.CorpusFetcher([url for show in shows for url in graps.get_page_urls(show)],
+                                       max_workers=jobs, rate=0)
+    if parse_processes > 1:
+        with graps.ParsePool([page for show in shows for page in graps.get_pages(show)], corpus.fetch,
+                             parse_processes, fetcher=fetcher) as pool:
+            for show in shows:
+                graps.parse_workers(show, pool.fetch, parse=pool.parse)
+    else:
+        for show in shows:
+            graps.parse_workers(show, corpus.fetch if fetcher is None else fetcher.get)
+    if fetcher is not None:
+        fetcher.close()
+    if graps.writer is not None:
+        graps.writer.flush()
+        graps.writer = None
+    return graps.conn
+
+
+def appearances(conn, show_id):
+    return set(name for (name,) in conn.execute('''SELECT workers.name FROM appearances
+                                                   INNER JOIN workers ON workers.worker_id = appearances.worker_id
+                                                   WHERE appearances.show_id = ?''', (show_id,)))
+
+
+def test_offline_ingest():
+    conn = ingest_offline()
+    shows = dict(conn.execute('SELECT show_id, name FROM shows'))
+    assert shows == {
+        '900001': 'PROGRESS Chapter 88: Fast Cars, Fast Women, Fast Kids - Day 1',
+        '900002': 'Riptide Brighton Brawl',
+        '900003': 'WRESTLE-1 Tour 2019 Symbol - Day 3',
+        'm900004,900005': 'PROGRESS Chapter 89: Fiesta! - Show 1/PROGRESS Chapter 89: Fiesta! - Show 2 Taping',
+        '900006': 'Synthetic Show - 120 matches',
+    }
+    assert conn.execute("SELECT show_date, promotion, arena FROM shows WHERE show_id = '900001'").fetchone() == \
+        ('2019-04-21', 1005, 'Electric Ballroom')
+
+    normal = appearances(conn, '900001')
+    assert len(normal) == 13
+    assert 'Hektor Invictus' in normal
+
+    partial = appearances(conn, '900003')
+    assert 'KAI' not in partial and 'LA Park' not in partial
+    assert {'Kaito Ishida', 'El Hijo de LA Park', 'LA Park Jr.', 'Kenji Plain'} <= partial
+
+    merged = appearances(conn, 'm900004,900005')
+    assert 'Martin Kirby' in merged, "Martin Kirby is on the second show of the taping"
+    assert 'Chris Ridgeway' in merged
+    assert 'Masked Jobber' in merged
+
+    huge = conn.execute("SELECT count(*) FROM appearances WHERE show_id = '900006'").fetchone()[0]
+    assert huge > 200
+
+
+def test_offline_ingest_commit_per_row_matches_batched():
+    tables = ['promotions', 'shows', 'workers', 'appearances', 'show_entries']
+    batched = ingest_offline()
+    expected = [sorted(batched.execute('SELECT * FROM ' + table), key=str) for table in tables]
+    per_row = ingest_offline(commit_per_row=True)
+    assert [sorted(per_row.execute('SELECT * FROM ' + table), key=str) for table in tables] == expected
+
+
+def test_offline_ingest_on_parse_processes_matches_in_process():
+    tables = ['promotions', 'shows', 'workers', 'appearances', 'show_entries']
+    in_process = ingest_offline()
+    expected = [sorted(in_process.execute('SELECT * FROM ' + table), key=str) for table in tables]
+    on_processes = ingest_offline(parse_processes=2)
+    assert [sorted(on_processes.execute('SELECT * FROM ' + table), key=str) for table in tables] == expected
+    fetched_alongside = ingest_offline(parse_processes=2, jobs=3)
+    assert [sorted(fetched_alongside.execute('SELECT * FROM ' + table), key=str) for table in tables] == expected
+
+
+def test_parse_pool_sends_pages_on_as_they_arrive():
+    graps.args = corpus.graps_args()
+    urls = [corpus.corpus_url(show_id) for show_id in ['900001', '900002', '900003']]
+
+    def slow_first_page(url):
+        if url == urls[0]:
+            time.sleep(0.5)
+        return corpus.fetch(url)
+    with corpus.CorpusFetcher(urls, slow_first_page, max_workers=3, rate=0) as fetcher, \
+            graps.ParsePool([(url, graps.ShowType.NORMAL, None) for url in urls], processes=2,
+                            fetcher=fetcher) as pool:
+        assert pool.fetch(urls[0]) == corpus.fetch(urls[0])
+        assert all(queued.submitted for queued in pool.queued), \
+            "The pages that arrived while waiting for the first should already be parsing"
+        for url in urls:
+            if url != urls[0]:
+                pool.fetch(url)
+            assert pool.parse(corpus.fetch(url), url) == graps.parse_page(corpus.fetch(url), url)
+
+
+def rollups(conn):
+    return [sorted(conn.execute('SELECT * FROM ' + table)) for table in graps.ROLLUP_TABLES]
+
+
+def test_rollups_are_maintained_on_insert_and_delete():
+    conn = ingest_offline()
+    maintained = rollups(conn)
+    assert dict(conn.execute('SELECT show_year || show_month, show_count FROM month_shows'))['201905'] == 2
+    graps.rebuild_rollups()
+    assert rollups(conn) == maintained
+
+    graps.delete_shows(['900001', 'm900004,900005'])
+    maintained = rollups(conn)
+    graps.rebuild_rollups()
+    assert rollups(conn) == maintained
+    assert (1005,) not in set(conn.execute('SELECT promotion_id FROM promotion_year_shows'))
+
+    indexes = set(name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'"))
+    assert {'appearances_user_show', 'shows_user_date', 'shows_user_promotion'} <= indexes
+
+
+def reingest(conn, shows, incremental=False):
+    """
+    Run a later graps.py run over `shows` against an ingested database, as main does, incremental (-i) or full.
+    :return: the entries that were parsed, and the show IDs that were replaced (entries, changed)
+    """
+    graps.writer = graps.BatchWriter(conn, 2)
+    select = graps.select_changed_entries if incremental else graps.select_replaced_entries
+    entries, changed = select(shows)
+    for show in entries:
+        graps.parse_workers(show, corpus.fetch, graps.get_entry_show_id(show) in changed)
+    graps.writer.flush()
+    graps.writer = None
+    return entries, changed
+
+
+def with_partial_exclude(shows, exclude):
+    """
+    A copy of the offline show entries, with the exclude list of the partial show 900003 replaced.
+    """
+    shows = list(shows)
+    shows[2] = {'partial': dict(shows[2]['partial'], exclude=exclude)}
+    return shows
+
+
+def assert_rollups_consistent(conn):
+    maintained = rollups(conn)
+    graps.rebuild_rollups()
+    assert rollups(conn) == maintained
+
+
+def test_incremental_run_replaces_changed_and_deletes_removed_entries():
+    conn = ingest_offline()
+    shows = with_partial_exclude(corpus.load_offline_shows(), [])[1:]
+    entries, changed = reingest(conn, shows, incremental=True)
+    assert entries == [shows[1]]
+    assert changed == {'900003'}
+
+    assert conn.execute("SELECT count(*) FROM shows WHERE show_id = '900001'").fetchone()[0] == 0
+    assert conn.execute("SELECT count(*) FROM appearances WHERE show_id = '900001'").fetchone()[0] == 0
+    assert conn.execute("SELECT count(*) FROM show_entries WHERE show_id = '900001'").fetchone()[0] == 0
+    assert {'KAI', 'LA Park'} <= appearances(conn, '900003')
+    assert dict(conn.execute('SELECT show_id, entry_hash FROM show_entries'))['900003'] == \
+        graps.get_entry_hash(shows[1])
+    assert conn.execute('SELECT count(*) FROM workers WHERE worker_id NOT IN (SELECT worker_id FROM appearances)'
+                        ).fetchone()[0] == 0
+    assert_rollups_consistent(conn)
+
+    assert reingest(conn, shows, incremental=True) == ([], set())
+
+
+def test_full_run_replaces_changed_entries():
+    conn = ingest_offline()
+    shows = corpus.load_offline_shows()
+    edited = with_partial_exclude(shows, [])
+    entries, changed = reingest(conn, edited)
+    assert entries == edited
+    assert changed == {'900003'}
+    assert {'KAI', 'LA Park'} <= appearances(conn, '900003')
+    assert_rollups_consistent(conn)
+
+    # Excluding the match again takes them back off the show, and the next incremental run has nothing to do
+    assert reingest(conn, shows)[1] == {'900003'}
+    partial = appearances(conn, '900003')
+    assert 'KAI' not in partial and 'LA Park' not in partial
+    assert_rollups_consistent(conn)
+    assert reingest(conn, shows, incremental=True) == ([], set())
+
+
+def test_users_have_separate_partitions(tmp_path):
+    path = str(tmp_path / "thedatabase.sqlite3")
+    ingest_offline(path=path, user='alice').close()
+    conn = ingest_offline(path=path, user='bob')
+    shows = dict(conn.execute('SELECT user_id, count(*) FROM shows GROUP BY user_id'))
+    assert shows == {'alice': 5, 'bob': 5}
+    workers = conn.execute('SELECT count(*) FROM workers').fetchone()[0]
+    assert workers == conn.execute('SELECT count(DISTINCT worker_id) FROM appearances').fetchone()[0], \
+        "Workers are shared, not stored once per user"
+
+    graps.delete_shows(['900001'])
+    shows = dict(conn.execute('SELECT user_id, count(*) FROM shows GROUP BY user_id'))
+    assert shows == {'alice': 5, 'bob': 4}
+    assert appearances(conn, '900001'), "Alice's appearances on the show are kept"
+    maintained = rollups(conn)
+    graps.rebuild_rollups()
+    assert rollups(conn) == maintained
+
+
+def test_unpartitioned_database_is_migrated(tmp_path):
+    path = str(tmp_path / "thedatabase.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE promotions (promotion_id INTEGER PRIMARY KEY, name TEXT)')
+        conn.execute('CREATE TABLE shows (show_id TEXT PRIMARY KEY, name TEXT, arena TEXT, show_date TEXT, '
+                     'promotion INTEGER, url TEXT, is_partial INTEGER)')
+        conn.execute('CREATE TABLE workers (worker_id TEXT PRIMARY KEY, name TEXT)')
+        conn.execute('CREATE TABLE appearances (worker_id TEXT, show_id TEXT, UNIQUE(worker_id, show_id))')
+        conn.execute("INSERT INTO promotions VALUES (1005, 'PROGRESS')")
+        conn.execute("INSERT INTO shows VALUES ('900001', 'Chapter 88', 'Electric Ballroom', '2019-04-21', 1005, "
+                     "'https://www.cagematch.net/?id=1&nr=900001', 0)")
+        conn.execute("INSERT INTO workers VALUES ('1', 'WALTER')")
+        conn.execute("INSERT INTO workers VALUES ('Kenji Plain', 'Kenji Plain')")
+        conn.execute("INSERT INTO appearances VALUES ('1', '900001')")
+        conn.execute("INSERT INTO appearances VALUES ('Kenji Plain', '900001')")
+    conn.close()
+
+    graps.args = corpus.graps_args()
+    graps.conn = sqlite3.connect(path)
+    graps.c = graps.conn.cursor()
+    graps.create_tables()
+    conn = graps.conn
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == graps.SCHEMA_VERSION
+    assert list(conn.execute('SELECT user_id, show_id FROM shows')) == [('default', '900001')]
+    assert list(conn.execute('SELECT * FROM workers ORDER BY worker_id')) == \
+        [(1, 1, None, 'WALTER'), (2, None, 'Kenji Plain', 'Kenji Plain')]
+    assert sorted(conn.execute('SELECT * FROM appearances')) == [('default', 1, '900001'), ('default', 2, '900001')]
+    assert sorted(conn.execute('SELECT * FROM worker_appearances')) == [('default', 1, 1), ('default', 2, 1)]
+    conn.close()
+
+
+def worker_rows(conn):
+    """
+    The appearances and worker_appearances rows, with workers by their Cagematch ID or name rather than worker_id.
+    """
+    identity = "coalesce(workers.cagematch_id || '', workers.plain_name), workers.name"
+    return [sorted(conn.execute('SELECT user_id, show_id, {0} FROM appearances '
+                                'INNER JOIN workers ON workers.worker_id = appearances.worker_id'.format(identity))),
+            sorted(conn.execute('SELECT user_id, appearances, {0} FROM worker_appearances '
+                                'INNER JOIN workers ON workers.worker_id = worker_appearances.worker_id'
+                                .format(identity)))]
+
+
+def downgrade_worker_keys(conn):
+    """
+    Put the workers back as they were in schema version 1, keyed by their Cagematch ID or name as TEXT.
+    """
+    with conn:
+        conn.execute('ALTER TABLE appearances RENAME TO appearances_v2')
+        conn.execute('ALTER TABLE workers RENAME TO workers_v2')
+        conn.execute('CREATE TABLE workers (worker_id TEXT PRIMARY KEY, name TEXT)')
+        conn.execute('CREATE TABLE appearances (user_id TEXT NOT NULL, worker_id TEXT, show_id TEXT, '
+                     'UNIQUE(user_id, worker_id, show_id))')
+        conn.execute('INSERT INTO workers SELECT coalesce(cagematch_id, plain_name), name FROM workers_v2')
+        conn.execute('INSERT INTO appearances SELECT user_id, coalesce(cagematch_id, plain_name), show_id '
+                     'FROM appearances_v2 INNER JOIN workers_v2 ON workers_v2.worker_id = appearances_v2.worker_id')
+        conn.execute('DROP TABLE appearances_v2')
+        conn.execute('DROP TABLE workers_v2')
+        conn.execute('PRAGMA user_version = 1')
+
+
+def test_text_worker_keys_are_migrated(tmp_path):
+    path = str(tmp_path / "thedatabase.sqlite3")
+    conn = ingest_offline(path=path)
+    expected = worker_rows(conn)
+    downgrade_worker_keys(conn)
+    assert conn.execute("SELECT count(*) FROM workers WHERE worker_id GLOB '[0-9]*'").fetchone()[0] > 0
+
+    graps.create_tables()
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == graps.SCHEMA_VERSION
+    assert worker_rows(conn) == expected
+    assert conn.execute('SELECT count(*) FROM workers WHERE plain_name IS NOT NULL').fetchone()[0] > 0
+    assert conn.execute('SELECT count(*) FROM appearances WHERE worker_id IS NULL').fetchone()[0] == 0
+    conn.close()
+
+
+if __name__ == "__main__":
+    test_offline_ingest()
+    test_offline_ingest_commit_per_row_matches_batched()
+    test_rollups_are_maintained_on_insert_and_delete()
+    print("Everything passed")
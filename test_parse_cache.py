@@ -0,0 +1,66 @@
+import graps
+from graps import ShowType, get_parser_version, parse_page
+from parse_cache import ParseCache
+from tests import corpus
+
+graps.args = corpus.graps_args()
+
+URL = corpus.corpus_url("900003")
+
+
+def parse_cached(cache, raw_html, exclude=None):
+    graps.parse_cache = cache
+    try:
+        return parse_page(raw_html, URL, ShowType.PARTIAL if exclude else ShowType.NORMAL, exclude)
+    finally:
+        graps.parse_cache = None
+
+
+def test_unchanged_page_skips_the_parser(monkeypatch):
+    cache = ParseCache(':memory:', get_parser_version())
+    raw_html = corpus.read_page("partial.html")
+    parsed = parse_cached(cache, raw_html, [5])
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    def no_soup(*args):
+        raise AssertionError("The page should have come from the cache")
+    monkeypatch.setattr(graps, "make_soup", no_soup)
+    assert parse_cached(cache, raw_html, [5]) == parsed
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_changed_page_options_or_parser_miss():
+    cache = ParseCache(':memory:', 'v1')
+    raw_html = corpus.read_page("partial.html")
+    parsed = parse_cached(cache, raw_html, [5])
+
+    edited = raw_html.replace(b"Kenji Plain", b"Kenji Plane")
+    assert parse_cached(cache, edited, [5]) != parsed
+    assert parse_cached(cache, edited, [4]) != parse_cached(cache, edited, [5])
+    assert cache.hits == 1
+
+    cache.parser_version = 'v2'
+    assert parse_cached(cache, edited, [5]) == parse_page(edited, URL, ShowType.PARTIAL, [5])
+    assert cache.hits == 1
+    assert cache.clear_stale() == 1, "Only the exclude [4] entry is left from v1"
+
+
+def test_parser_version_only_covers_the_parser(monkeypatch):
+    version = get_parser_version()
+    assert get_parser_version() == version
+
+    def main():
+        pass
+    monkeypatch.setattr(graps, "main", main)
+    monkeypatch.setattr(graps, "select_changed_entries", main)
+    assert get_parser_version() == version, "Changes outside the parser keep the cached results"
+
+    def parse_worker_list(html):
+        return []
+    monkeypatch.setattr(graps, "parse_worker_list", parse_worker_list)
+    assert get_parser_version() != version
+
+
+if __name__ == "__main__":
+    test_changed_page_options_or_parser_miss()
+    print("Everything passed")
@@ -0,0 +1,149 @@
+import os
+import sqlite3
+
+import pandas
+
+from queries import DataStore, filter_sql, year_month_grid
+from test_offline import ingest_offline
+
+
+def test_results_are_memoized_until_the_database_changes(tmp_path):
+    path = str(tmp_path / "thedatabase.sqlite3")
+    ingest_offline(path=path).close()
+    store = DataStore(path)
+    assert store.show_count('default') == 5
+    appearances = store.appearances_df('default')
+
+    statements = []
+    # Python 3.7 keeps the callback in a dict, so it has to be hashable, which a list's bound append isn't
+    store.conn.set_trace_callback(lambda statement: statements.append(statement))
+    assert store.show_count('default') == 5
+    assert store.appearances_df('default') is appearances
+    assert all(statement.startswith('PRAGMA data_version') for statement in statements), statements
+
+    with sqlite3.connect(path) as other:
+        other.execute("DELETE FROM shows WHERE show_id = '900001'")
+    assert store.show_count('default') == 4
+    assert store.appearances_df('default') is not appearances
+
+
+def test_replaced_database_is_reopened(tmp_path):
+    path = str(tmp_path / "thedatabase.sqlite3")
+    ingest_offline(path=path).close()
+    store = DataStore(path)
+    assert store.worker_count('default') > 0
+
+    empty = str(tmp_path / "empty.sqlite3")
+    with sqlite3.connect(empty) as conn:
+        conn.execute("CREATE TABLE worker_appearances (user_id TEXT, worker_id INTEGER, appearances INTEGER)")
+    os.replace(empty, path)
+    assert store.worker_count('default') == 0
+
+
+def legacy_heatmap_grid(shows_heatmap_df):
+    """
+    The original loop from app.py's shows_heatmap.
+    """
+    years = []
+    last_year = 0
+    shows = []
+    yr = [None] * 12
+    for i, r in shows_heatmap_df.iterrows():
+        if int(r['show_year']) == last_year or last_year == 0:
+            pass
+        else:
+            shows.append(yr)
+            years.append(last_year)
+            new_year = int(r['show_year'])
+            last_year += 1
+            while last_year < new_year:
+                years.append(last_year)
+                shows.append([None] * 12)
+                last_year += 1
+            yr = [None] * 12
+
+        show_m_int = int(r['show_month'])
+        yr[(show_m_int - 1)] = r['show_number']
+        last_year = int(r['show_year'])
+    shows.append(yr)
+    years.append(last_year)
+    return years, shows
+
+
+def test_year_month_grid_matches_legacy():
+    heatmap_df = pandas.DataFrame({'show_month': ['03', '12', '01', '07'],
+                                   'show_year': ['2015', '2015', '2018', '2018'],
+                                   'show_number': [2, 1, 5, 3]})
+    years, rows = year_month_grid(heatmap_df)
+    assert (years, rows) == legacy_heatmap_grid(heatmap_df)
+    assert years == [2015, 2016, 2017, 2018]
+    assert rows[1] == [None] * 12
+    assert year_month_grid(heatmap_df.iloc[:0]) == ([], [])
+
+
+def test_heatmap_filters(tmp_path):
+    path = str(tmp_path / "thedatabase.sqlite3")
+    ingest_offline(path=path).close()
+    store = DataStore(path)
+    years, rows = store.shows_heatmap_grid('default')
+    assert sum(count or 0 for row in rows for count in row) == 5
+
+    years, rows = store.shows_heatmap_grid('default', 1005)
+    assert sum(count or 0 for row in rows for count in row) == 2, "The PROGRESS chapters"
+
+    walter = store.scalar("SELECT worker_id FROM workers WHERE name = 'WALTER'")
+    years, rows = store.shows_heatmap_grid('default', None, walter)
+    assert sum(count or 0 for row in rows for count in row) == \
+        store.scalar("SELECT count(*) FROM appearances WHERE worker_id = ?", (walter,))
+
+
+def test_filter_sql():
+    columns = ['name', 'appearances']
+    assert filter_sql('{name} contains "Walter" && {appearances} > 5', columns) == \
+        ("WHERE name LIKE '%' || ? || '%' AND appearances > ?", ['Walter', 5])
+    assert filter_sql('{appearances} ge 2.5', columns) == ('WHERE appearances >= ?', [2.5])
+    assert filter_sql('{password} = 1 && {name} drop table', columns) == ('', []), \
+        "Unknown columns and operators should be ignored"
+    assert filter_sql('', columns) == ('', [])
+
+
+def test_table_paging_in_sql(tmp_path):
+    path = str(tmp_path / "thedatabase.sqlite3")
+    ingest_offline(path=path).close()
+    store = DataStore(path)
+    everyone = store.appearances_df('default')
+    total = store.table_count('default', 'top-wrestlers')
+    assert total == len(everyone)
+
+    pages = [store.table_page('default', 'top-wrestlers', page, 10) for page in range(-(-total // 10))]
+    rows = [row for page in pages for row in page]
+    assert len(rows) == total and len(pages[0]) == 10
+    assert [row['appearances'] for row in rows] == sorted(everyone['appearances'], reverse=True)
+
+    by_name = store.table_page('default', 'top-wrestlers', 0, 5, (('name', 'desc'),))
+    assert [row['name'] for row in by_name] == sorted(everyone['name'], reverse=True)[:5]
+
+    assert store.table_count('default', 'top-wrestlers', '{name} contains "Park"') == \
+        everyone['name'].str.contains('Park', case=False).sum()
+
+
+def test_queries_are_scoped_to_the_user(tmp_path):
+    path = str(tmp_path / "thedatabase.sqlite3")
+    ingest_offline(path=path, user='alice').close()
+    ingest_offline(path=path, user='bob').close()
+    store = DataStore(path)
+    assert store.users() == ['alice', 'bob']
+    assert store.show_count('alice') == store.show_count('bob') == 5
+    assert store.show_count('nobody') == 0
+
+    with sqlite3.connect(path) as other:
+        other.execute("DELETE FROM appearances WHERE user_id = 'bob' AND show_id = '900006'")
+        other.execute("DELETE FROM shows WHERE user_id = 'bob' AND show_id = '900006'")
+    assert store.show_count('alice') == 5 and store.show_count('bob') == 4
+    assert store.table_count('alice', 'top-wrestlers') > store.table_count('bob', 'top-wrestlers')
+    years, rows = store.shows_heatmap_grid('bob')
+    assert sum(count or 0 for row in rows for count in row) == 4
+
+    plan = store.conn.execute("EXPLAIN QUERY PLAN SELECT Count() FROM shows "
+                              "WHERE shows.user_id = 'bob' AND shows.is_partial < 2").fetchone()[-1]
+    assert plan.startswith('SEARCH shows USING'), "Per-user queries shouldn't scan every user's shows"
@@ -1,3 +1,6 @@
+import re
+import timeit
+
 from graps import not_one_off, apply_translations
 
 
@@ -15,6 +18,22 @@ def test_one_off_regex():
     assert not_one_off("El Motho", "Darrell Allen & Jordon Breaks defeat El Motho & Charlie Carter") is True, "Should match"
     assert not_one_off("El Motho", "Darrell Allen & El Motho defeat Charlie Carter & Jordon Breaks") is True, "Should match"
     assert not_one_off("El Motho", "El Motho & Jordon Breaks defeat Charlie Carter & Darrell Allen") is True, "Should match"
+    assert not_one_off("El Motho", "El Motho, Martina & Darrell Allen defeat Charlie Carter") is True, "Should match"
+    assert not_one_off("El Motho", "Gabriel Kidd defeats El Motho (11:03)") is True, "Should match"
+
+
+def test_one_off_regex_escaping():
+    assert not_one_off("Mr. Pogo", "Mr. Pogo defeats Jason the Terrible") is True, "Should match"
+    assert not_one_off("Mr. Pogo", "Mrs Pogo defeats Jason the Terrible") is False, "'.' should not be a wildcard"
+    assert not_one_off("Kid Lykos (II)", "Kid Lykos (II) defeats Cara Noir") is True, "Should match"
+    assert not_one_off("A+", "AA defeats B") is False, "'+' should not be a quantifier"
+
+
+def test_one_off_regex_multiline():
+    card = "The NIC (Charlie Carter & Oisin Delaney) defeat El Motho (Martina)\nEl Motho defeats Gabriel Kidd"
+    assert not_one_off("El Motho", card) is True, "Should match on the second line"
+    assert not_one_off("Martina", "El Motho (Martina)\nGabriel Kidd defeats Martina") is True, "Should match"
+    assert not_one_off("The NIC", card) is False, "Should not match"
 
 
 def test_translation():
@@ -27,7 +46,34 @@ def test_translation():
     assert apply_translations("BJW Dai Nippon Pro-Wrestling Ueno Convention - Day 3 Part 1 BJW Shuffle Tag Tournament") == "BJW Dai Nippon Pro-Wrestling Ueno Convention - Day 3 Part 1 BJW Shuffle Tag Tournament"
 
 
+def benchmark_one_off_regex(names=50, matches=12, number=20):
+    """
+    Compare checking every plain text name on a card the original way, compiling a new pattern for each name and
+    searching each match result separately, against the cached, escaped patterns run over the whole card at once.
+    """
+    worker_names = ["Plain Worker {0}".format(i) for i in range(names)]
+    results = ["{0} & {1} defeat {2} (w/Manager) ({3}:00)".format(worker_names[i % names], worker_names[(i + 1) % names],
+                                                                   worker_names[(i + 2) % names], i)
+               for i in range(matches)]
+    card = "\n".join(results)
+
+    def original():
+        for name in worker_names:
+            any(re.search(name + "(( \\(([c\\)]|[w\\/]))|( [^(])|$|\\))", result) for result in results)
+
+    def cached():
+        for name in worker_names:
+            not_one_off(name, card)
+
+    for label, check in [("per match, compiled per call", original), ("whole card, cached pattern", cached)]:
+        seconds = timeit.timeit(check, number=number)
+        print("{0}: {1:.0f} names/s".format(label, names * number / seconds))
+
+
 if __name__ == "__main__":
     test_one_off_regex()
+    test_one_off_regex_escaping()
+    test_one_off_regex_multiline()
     test_translation()
     print("Everything passed")
+    benchmark_one_off_regex()
@@ -0,0 +1,65 @@
+import sqlite3
+
+import pytest
+
+# The vendored heatmap needs plotly's validators, which plotly 6 moved
+pytest.importorskip('_annotated_heatmap')
+
+import figures
+import graps
+import snapshot
+from queries import DataStore
+from test_offline import downgrade_worker_keys, ingest_offline
+
+
+def test_snapshot_is_loaded_in_place_of_queries(tmp_path):
+    path = str(tmp_path / "thedatabase.sqlite3")
+    ingest_offline(path=path).close()
+    snapshot.write_snapshot(path, 'default', str(tmp_path))
+
+    live = DataStore(path)
+    snapshot.compute_results(live, 'default')
+    store = DataStore(path)
+    assert snapshot.load_snapshot(store, 'default', str(tmp_path))
+
+    statements = []
+    store.conn.set_trace_callback(lambda statement: statements.append(statement))
+    assert store.show_count('default') == live.show_count('default') == 5
+    assert store.latest_and_longest_streaks('default') == \
+        [[list(start), list(end), count] for start, end, count in live.latest_and_longest_streaks('default')]
+    assert store.table_page('default', 'top-wrestlers', 0, 10, (), '') == \
+        live.table_page('default', 'top-wrestlers', 0, 10, (), '')
+    for name in figures.FIGURES:
+        assert figures.figure(store, name, 'default') == figures.figure(live, name, 'default')
+    assert all(statement.startswith('PRAGMA data_version') for statement in statements), statements
+
+
+def test_stale_snapshot_is_ignored(tmp_path):
+    path = str(tmp_path / "thedatabase.sqlite3")
+    ingest_offline(path=path, user='alice').close()
+    ingest_offline(path=path, user='bob').close()
+    snapshot.write_snapshot(path, 'alice', str(tmp_path))
+    snapshot.write_snapshot(path, 'bob', str(tmp_path))
+
+    with sqlite3.connect(path) as other:
+        other.execute("DELETE FROM shows WHERE user_id = 'bob' AND show_id = '900001'")
+    assert not snapshot.load_snapshot(DataStore(path), 'bob', str(tmp_path))
+    assert snapshot.load_snapshot(DataStore(path), 'alice', str(tmp_path)), "Only Bob's shows have changed"
+    assert not snapshot.load_snapshot(DataStore(path), 'nobody', str(tmp_path))
+
+
+def test_snapshot_from_before_worker_key_migration_is_ignored(tmp_path):
+    path = str(tmp_path / "thedatabase.sqlite3")
+    conn = ingest_offline(path=path)
+    downgrade_worker_keys(conn)
+    snapshot.write_snapshot(path, 'default', str(tmp_path))
+    assert snapshot.load_snapshot(DataStore(path), 'default', str(tmp_path))
+
+    graps.create_tables()
+    conn.close()
+    assert not snapshot.load_snapshot(DataStore(path), 'default', str(tmp_path)), \
+        "The snapshot's worker IDs are from before the migration"
+
+
+def test_snapshot_path_stays_in_its_directory():
+    assert snapshot.snapshot_path('../../etc/passwd', 'snapshots') == 'snapshots/..%2F..%2Fetc%2Fpasswd.json'
@@ -0,0 +1,41 @@
+from datetime import date
+
+from streaks import Streak, find_streaks, latest_and_longest
+
+
+def streaks_of(months):
+    years = [month[0] for month in months]
+    return latest_and_longest(find_streaks(years, [month[1] for month in months]))
+
+
+def test_single_streak():
+    latest, longest = streaks_of([("2019", "01"), ("2019", "02"), ("2019", "03")])
+    assert latest == longest == Streak((2019, 1), (2019, 3), 3)
+    assert repr(longest) == "01/2019 and 03/2019"
+
+
+def test_streak_across_year_end_and_gaps():
+    streaks = find_streaks([2017, 2018, 2018, 2018, 2018, 2019], [12, 1, 2, 5, 12, 1])
+    assert streaks.values.tolist() == [[2017, 12, 2018, 2, 3], [2018, 5, 2018, 5, 1], [2018, 12, 2019, 1, 2]]
+
+
+def test_longest_tie_is_most_recent():
+    latest, longest = streaks_of([(2018, 1), (2018, 2), (2018, 6), (2018, 7), (2018, 10)])
+    assert longest == Streak((2018, 6), (2018, 7), 2)
+    assert latest == Streak((2018, 10), (2018, 10), 1)
+
+
+def test_unsorted_and_duplicate_months():
+    streaks = find_streaks([2019, 2018, 2019, 2019], [2, 12, 1, 1])
+    assert streaks.values.tolist() == [[2018, 12, 2019, 2, 3]]
+
+
+def test_no_shows():
+    assert streaks_of([]) == (None, None)
+
+
+def test_ongoing():
+    streak = Streak((2018, 11), (2018, 12), 2)
+    assert streak.is_ongoing(date(2018, 12, 31))
+    assert streak.is_ongoing(date(2019, 1, 15))
+    assert not streak.is_ongoing(date(2019, 2, 1))
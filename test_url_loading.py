@@ -0,0 +1,215 @@
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests_cache
+
+import url_loading
+from url_loading import configure_cache, configure_session, prune_cache, simple_get
+
+PAGE = b"<html><body><div class='Matches'>A show</div></body></html>"
+
+
+def page_for(path):
+    return "<html><body>{0}</body></html>".format(path).encode('utf-8')
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves the same page at every path, with an ETag, and answers conditional requests for it with a 304.
+    Paths starting /busy answer 503 with a Retry-After until `busy` runs out, /flaky does the same without the
+    Retry-After, and /broken always answers 500. Paths starting /page serve a page of their own, after a delay of
+    `/page/<name>?delay=<seconds>` if asked.
+    Counts the full and conditional responses it sends, and logs the path and time of every request.
+    """
+    etag = '"{0}"'.format(hashlib.sha1(PAGE).hexdigest())
+    full = 0
+    not_modified = 0
+    busy = 0
+    requests = []
+
+    def do_GET(self):
+        StandInHandler.requests.append((self.path, time.monotonic()))
+        if self.path.startswith('/broken') or (self.path.startswith(('/busy', '/flaky')) and StandInHandler.busy > 0):
+            StandInHandler.busy -= 1
+            self.send_response(500 if self.path.startswith('/broken') else 503)
+            if not self.path.startswith('/flaky'):
+                self.send_header('Retry-After', '1')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path.startswith('/page'):
+            path, _, delay = self.path.partition('?delay=')
+            time.sleep(float(delay or 0))
+            self.send_page(page_for(path))
+            return
+        if self.headers.get('If-None-Match') == self.etag:
+            StandInHandler.not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', self.etag)
+            self.end_headers()
+            return
+        self.send_page(PAGE, self.etag)
+
+    def send_page(self, page, etag=None):
+        StandInHandler.full += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(page)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(page)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    StandInHandler.full = StandInHandler.not_modified = StandInHandler.busy = 0
+    StandInHandler.requests = []
+    yield "http://127.0.0.1:{0}".format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def cache_name(tmp_path):
+    yield str(tmp_path / "test_cache")
+    requests_cache.uninstall_cache()
+    configure_cache()
+    configure_session()
+    url_loading.failed_urls.clear()
+
+
+def test_expired_page_is_revalidated(server, cache_name):
+    configure_cache(cache_name, expire_after=requests_cache.EXPIRE_IMMEDIATELY, urls_expire_after={})
+    assert simple_get(server + "/?id=1&nr=1") == PAGE
+    assert simple_get(server + "/?id=1&nr=1") == PAGE
+    assert (StandInHandler.full, StandInHandler.not_modified) == (1, 1)
+
+
+def test_expiry_by_url_class(server, cache_name):
+    configure_cache(cache_name, expire_after=requests_cache.EXPIRE_IMMEDIATELY,
+                    urls_expire_after={'127.0.0.1:*/?id=1&nr=': 3600})
+    for _ in range(3):
+        assert simple_get(server + "/?id=1&nr=1") == PAGE
+        assert simple_get(server + "/?id=2&nr=1") == PAGE
+    assert StandInHandler.full == 2, "Each page is downloaded once"
+    assert StandInHandler.not_modified == 2, "Only the page that expires immediately is revalidated"
+
+
+def test_prune_removes_only_expired_pages(server, cache_name):
+    configure_cache(cache_name, expire_after=requests_cache.EXPIRE_IMMEDIATELY,
+                    urls_expire_after={'127.0.0.1:*/?id=1&nr=': 3600})
+    simple_get(server + "/?id=1&nr=1")
+    simple_get(server + "/?id=2&nr=1")
+    assert prune_cache(vacuum=True) == 1
+    assert [response.url for response in requests_cache.get_cache().responses.values()] == [server + "/?id=1&nr=1"]
+
+
+def test_session_pages_use_installed_cache(server, cache_name):
+    configure_cache(cache_name, expire_after=3600)
+    with url_loading.PageFetcher([server + "/?id=1&nr=1"], max_workers=1, rate=0) as fetcher:
+        assert fetcher.get(server + "/?id=1&nr=1") == PAGE
+    assert simple_get(server + "/?id=1&nr=1") == PAGE
+    assert StandInHandler.full == 1
+
+
+def test_retry_honours_retry_after(server, cache_name):
+    configure_cache(cache_name)
+    configure_session(retries=2, backoff=0)
+    StandInHandler.busy = 1
+    start = time.monotonic()
+    assert simple_get(server + "/busy") == PAGE
+    assert time.monotonic() - start >= 1, "The retry should wait for the Retry-After"
+    assert server + "/busy" not in url_loading.failed_urls
+
+
+def test_failed_urls_are_recorded(server, cache_name):
+    configure_cache(cache_name)
+    configure_session(retries=1, backoff=0)
+    url_loading.failed_urls.clear()
+    assert simple_get(server + "/broken") is None
+    assert simple_get("http://127.0.0.1:1/closed") is None
+    assert url_loading.failed_urls[server + "/broken"].startswith("HTTP 500")
+    assert "http://127.0.0.1:1/closed" in url_loading.failed_urls
+
+
+def test_fetcher_returns_pages_in_order_once_each(server, cache_name):
+    requests_cache.uninstall_cache()
+    # The first page is the slowest, so the others arrive before it
+    urls = [server + "/page/a?delay=0.3", server + "/page/b", server + "/page/a?delay=0.3", server + "/page/c"]
+    with url_loading.PageFetcher(urls, max_workers=3, rate=0) as fetcher:
+        assert [fetcher.get(url) for url in urls[:2] + urls[3:]] == [page_for("/page/a"), page_for("/page/b"),
+                                                                     page_for("/page/c")]
+    assert sorted(path for path, _ in StandInHandler.requests) == ["/page/a?delay=0.3", "/page/b", "/page/c"]
+
+
+def test_fetcher_stays_within_lookahead(server, cache_name):
+    requests_cache.uninstall_cache()
+    urls = [server + "/page/{0}".format(number) for number in range(10)]
+    with url_loading.PageFetcher(urls, max_workers=2, rate=0, lookahead=3) as fetcher:
+        time.sleep(0.2)
+        assert len(StandInHandler.requests) <= 3
+        for consumed, url in enumerate(urls, 1):
+            assert fetcher.get(url) == page_for("/page/{0}".format(consumed - 1))
+            assert len(fetcher.futures) <= 3
+            time.sleep(0.05)
+            assert len(StandInHandler.requests) <= consumed + 3
+    assert len(StandInHandler.requests) == 10
+
+
+def test_rate_limiter_spaces_requests_per_host():
+    limiter = url_loading.HostRateLimiter(10)
+    start = time.monotonic()
+    times = []
+    for _ in range(4):
+        limiter.wait("http://one.example/page")
+        times.append(time.monotonic() - start)
+    limiter.wait("http://two.example/page")
+    limiter.wait("http://one.example:8080/page")
+    other_hosts = time.monotonic() - start - times[-1]
+    assert all(later - earlier >= 0.09 for earlier, later in zip(times, times[1:]))
+    assert other_hosts < 0.05, "Other hosts shouldn't wait on one.example's slots"
+
+
+def test_fetcher_rate_limits_requests_to_server(server, cache_name):
+    requests_cache.uninstall_cache()
+    urls = [server + "/page/{0}".format(number) for number in range(4)]
+    with url_loading.PageFetcher(urls, max_workers=4, rate=5) as fetcher:
+        for url in urls:
+            fetcher.get(url)
+    # Requests leave on their slots, 0.2 s apart, but can reach the server a little early or late
+    times = sorted(at for _, at in StandInHandler.requests)
+    assert times[-1] - times[0] >= 0.55
+    assert all(later - earlier >= 0.1 for earlier, later in zip(times, times[1:]))
+
+
+def test_retries_are_rate_limited(server, cache_name):
+    requests_cache.uninstall_cache()
+    configure_session(retries=3, backoff=0)
+    StandInHandler.busy = 2
+    limiter = url_loading.HostRateLimiter(4)
+    assert simple_get(server + "/flaky", url_loading.make_session(limiter)) == PAGE
+    times = [at for _, at in StandInHandler.requests]
+    assert len(times) == 3
+    assert all(later - earlier >= 0.2 for earlier, later in zip(times, times[1:])), \
+        "Each retry should wait for its slot too"
+
+
+def test_fetcher_future_fetches_unqueued_pages(server, cache_name):
+    requests_cache.uninstall_cache()
+    urls = [server + "/page/a", server + "/page/b"]
+    with url_loading.PageFetcher(urls, max_workers=2, rate=0) as fetcher:
+        assert fetcher.future(server + "/page/c").result() == page_for("/page/c")
+        assert fetcher.future(urls[1]).result() == page_for("/page/b")
+        assert fetcher.get(urls[0]) == page_for("/page/a")
+    assert sorted(path for path, _ in StandInHandler.requests) == ["/page/a", "/page/b", "/page/c"]
@@ -0,0 +1,118 @@
+import re
+
+from bs4 import BeautifulSoup
+
+import graps
+from graps import ShowType, Worker, extract_worker_id_name, get_match_text, parse_page, parse_worker_list, \
+    validate_worker
+from tests import corpus
+
+graps.args = corpus.graps_args()
+
+
+def legacy_validate_worker(worker_name, bs_html):
+    """
+    The original validate_worker. Its result variable is overwritten by the last MatchResults tag, so it accepts every
+    name on a card with at least one match.
+    """
+    result = False
+    divs = bs_html.find("div", {"class": "Matches"})
+    for div in divs:
+        result = div.find("div", {"class": "MatchResults"})
+        if re.search(worker_name + "(( \\(([c\\)]|[w\\/]))|( [^(])|$|\\))", result.text.strip()):
+            result = True
+    return result
+
+
+def legacy_parse_worker_list(html):
+    """
+    The original implementation, which re-soups each comma separated fragment of the All Workers div.
+    """
+    all_workers = html.find("div", {"class": "Comments Font9"})
+    worker_list = (u''.join(str(item) for item in all_workers)).split(",")
+    ret = []
+    for worker in worker_list:
+        worker_id = None
+        worker_name = None
+        worker_soup = BeautifulSoup(worker, 'html.parser')
+        profile_link = worker_soup.find('a')
+        if profile_link is not None:
+            worker_id, worker_name = extract_worker_id_name(profile_link)
+        else:
+            plain_text_name = worker.strip()
+            if legacy_validate_worker(plain_text_name, html):
+                worker_id = plain_text_name
+                worker_name = plain_text_name
+
+        if worker_id is not None:
+            ret.append(Worker(worker_id, worker_name))
+
+    return ret
+
+
+def test_fixture_pages_present():
+    assert corpus.PAGES, "No fixture pages found in tests/pages"
+
+
+def test_parse_worker_list_parity():
+    for path in corpus.PAGES:
+        html = corpus.load_page(path)
+        # The only intended difference is that plain text names are now actually validated
+        match_text = get_match_text(html)
+        expected = [worker for worker in legacy_parse_worker_list(html)
+                    if isinstance(worker.id, int) or validate_worker(worker.name, match_text)]
+        assert parse_worker_list(html) == expected, path
+
+
+def test_parse_worker_list_linked_and_plain():
+    html = corpus.load_page("normal.html")
+    workers = parse_worker_list(html)
+    assert Worker(16, "WALTER") in workers
+    assert Worker("Hektor Invictus", "Hektor Invictus") in workers
+    assert all(worker.name != "Jim Smallman" for worker in workers), "Non-wrestler links should be skipped"
+
+
+def test_parse_worker_list_tag_team_without_profile():
+    html = corpus.load_page("tag_team_without_profile.html")
+    names = [worker.name for worker in parse_worker_list(html)]
+    assert "The Knucklelockers" not in names, "Tag team names without a profile should be rejected"
+    assert "The NIC" not in names, "Tag team names without a profile should be rejected"
+    assert "El Motho" not in names, "One off names should be rejected"
+    assert "Darrell Allen" in names
+    assert "Kid Lykos II" in names
+
+
+def test_parse_worker_list_plain_text_before_match_time():
+    html = corpus.load_page("partial.html")
+    names = [worker.name for worker in parse_worker_list(html)]
+    assert "Kenji Plain" in names, "Kenji Plain is only listed last in a result, before the match time"
+
+
+def test_comma_inside_link_text():
+    html = BeautifulSoup('<div class="Matches"><div class="Match"><div class="MatchResults">x</div></div></div>'
+                         '<div class="Comments Font9"><a href="?id=2&amp;nr=5">Smith, John</a>, '
+                         '<a href="?id=2&amp;nr=6">Jane Doe</a></div>', 'html.parser')
+    assert parse_worker_list(html) == [Worker(5, "Smith, John"), Worker(6, "Jane Doe")]
+
+
+def test_targeted_parse_parity():
+    for path in corpus.PAGES:
+        raw_html = corpus.read_page(path)
+        url = "https://www.cagematch.net/?id=1&nr=1"
+        results = []
+        for parse_mode in ['full', 'targeted']:
+            graps.args.parse_mode = parse_mode
+            results.append(parse_page(raw_html, url, ShowType.PARTIAL, [1]))
+        graps.args.parse_mode = 'targeted'
+        assert results[0] == results[1], path
+
+
+if __name__ == "__main__":
+    test_fixture_pages_present()
+    test_parse_worker_list_parity()
+    test_parse_worker_list_linked_and_plain()
+    test_parse_worker_list_tag_team_without_profile()
+    test_parse_worker_list_plain_text_before_match_time()
+    test_comma_inside_link_text()
+    test_targeted_parse_parity()
+    print("Everything passed")
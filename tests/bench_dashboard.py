@@ -0,0 +1,131 @@
+"""
+Time dashboard page loads under concurrent clients. The app is served on a local threaded server, and each client
+repeatedly makes the requests a page load makes: the dashboard body, then the first page of each table and the
+heatmap, which the page asks for once the body is in. It's run with the queries and figures memoized, as they are
+now, and with every one rebuilt on each request, as they used to be.
+
+Run with e.g.
+    python -m tests.bench_dashboard
+    python -m tests.bench_dashboard --clients 1 8 32 --loads 20 --database thedatabase.sqlite3
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+import app
+import queries
+from test_offline import ingest_offline
+
+TABLE_INPUTS = [('page_current', 0), ('page_size', 10), ('sort_by', []), ('filter_query', '')]
+
+
+def callback(session, base, outputs, inputs, state):
+    """
+    Make a Dash callback request, as the browser would.
+    """
+    if isinstance(outputs, list):
+        output = '..' + '...'.join('{id}.{property}'.format(**o) for o in outputs) + '..'
+    else:
+        output = '{id}.{property}'.format(**outputs)
+    response = session.post(base + '/_dash-update-component',
+                            json={'output': output, 'outputs': outputs, 'inputs': inputs, 'state': state,
+                                  'changedPropIds': []})
+    response.raise_for_status()
+    return len(response.content)
+
+
+def page_load(session, base, user):
+    """
+    The requests of one page load, returning the number of bytes received.
+    """
+    path = [{'id': 'url', 'property': 'pathname', 'value': '/' + user}]
+    received = callback(session, base, {'id': 'dashboard', 'property': 'children'}, path, [])
+    for table in ['top-wrestlers', 'top-promotions']:
+        received += callback(session, base, [{'id': table, 'property': 'data'},
+                                             {'id': table, 'property': 'page_count'}],
+                             [{'id': table, 'property': prop, 'value': value} for prop, value in TABLE_INPUTS], path)
+    received += callback(session, base, {'id': 'shows-heatmap', 'property': 'figure'},
+                         [{'id': 'shows-heatmap-promotion', 'property': 'value', 'value': None},
+                          {'id': 'shows-heatmap-worker', 'property': 'value', 'value': None}], path)
+    return received
+
+
+def run_clients(base, user, clients, loads):
+    """
+    Have `clients` clients each make `loads` page loads at once.
+    :return: the latency of every page load, the total bytes received, and the wall time (latencies, received, wall)
+    """
+    def client(_):
+        session = requests.Session()
+        timings = []
+        received = 0
+        for _ in range(loads):
+            start = time.perf_counter()
+            received += page_load(session, base, user)
+            timings.append(time.perf_counter() - start)
+        return timings, received
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(client, range(clients)))
+    wall = time.perf_counter() - start
+    return [timing for timings, _ in results for timing in timings], sum(received for _, received in results), wall
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def rebuild(key, compute):
+    """
+    Stands in for DataStore.memoize, running every query and building every figure each time it's asked for.
+    """
+    with app.store.lock:
+        app.store.data_version()
+        return compute()
+
+
+def main(args):
+    database = args.database
+    if database is None:
+        database = os.path.join(tempfile.mkdtemp(), 'thedatabase.sqlite3')
+        ingest_offline(path=database).close()
+    app.store = queries.DataStore(database)
+    memoize = app.store.memoize
+
+    server = make_server('127.0.0.1', 0, app.app.server, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = 'http://127.0.0.1:{0}'.format(server.server_port)
+
+    print("{0} page loads per client, times in ms".format(args.loads))
+    print("{0:>12} {1:>8} {2:>8} {3:>8} {4:>8} {5:>10} {6:>10}".format(
+        "mode", "clients", "mean", "p50", "p95", "loads/s", "KiB/load"))
+    for mode in ['rebuilt', 'memoized']:
+        app.store.memoize = memoize if mode == 'memoized' else rebuild
+        run_clients(base, args.user, 1, 1)
+        for clients in args.clients:
+            latencies, received, wall = run_clients(base, args.user, clients, args.loads)
+            print("{0:>12} {1:>8} {2:>8.1f} {3:>8.1f} {4:>8.1f} {5:>10.1f} {6:>10.1f}".format(
+                mode, clients, sum(latencies) / len(latencies) * 1000, percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.95) * 1000, len(latencies) / wall, received / len(latencies) / 1024))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark dashboard page loads under concurrent clients')
+    parser.add_argument("-c", "--clients", dest="clients", nargs="+", type=int, default=[1, 4, 16],
+                        help="numbers of concurrent clients to run with")
+    parser.add_argument("-n", "--loads", dest="loads", type=int, default=10,
+                        help="number of page loads each client makes")
+    parser.add_argument("-d", "--database", dest="database", default=None,
+                        help="database to serve, the offline test corpus is ingested into a new one if not given")
+    parser.add_argument("-u", "--user", dest="user", default=queries.DEFAULT_USER,
+                        help="the user whose dashboard is loaded")
+    main(parser.parse_args())
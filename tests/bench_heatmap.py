@@ -0,0 +1,89 @@
+"""
+Time building an annotated heatmap's annotations, with the cell by cell loop _annotated_heatmap used to have and with
+the vectorized one it has now, on grids of random show counts with some empty (None) cells, like the dashboard's.
+The annotations are checked to be the same both ways.
+
+Run with e.g.
+    python -m tests.bench_heatmap
+    python -m tests.bench_heatmap --grids 100x12 1000x365 --runs 5
+"""
+import argparse
+import random
+import time
+
+from plotly.graph_objs import graph_objs
+
+import _annotated_heatmap
+
+
+def legacy_annotations(heatmap):
+    """
+    The annotations as they used to be made, a graph_objs.layout.Annotation at a time, checking each cell for None.
+    """
+    min_text_color, max_text_color = heatmap.get_text_color()
+    z_values = [v for row in heatmap.z for v in row if v is not None]
+    z_mid = (max(z_values) + min(z_values)) / 2
+    annotations = []
+    for n, row in enumerate(heatmap.z):
+        for m, val in enumerate(row):
+            font_color = min_text_color if (val is None or val < z_mid) else max_text_color
+            annotations.append(
+                graph_objs.layout.Annotation(
+                    text=str(heatmap.annotation_text[n][m]) if val is not None else "",
+                    x=heatmap.x[m],
+                    y=heatmap.y[n],
+                    xref="x1",
+                    yref="y1",
+                    font=dict(color=font_color),
+                    showarrow=False,
+                )
+            )
+    return annotations
+
+
+def random_grid(rows, columns, empty=0.3, seed=0):
+    """
+    A grid of show counts, with about `empty` of the cells None.
+    """
+    generator = random.Random(seed)
+    return [[None if generator.random() < empty else generator.randint(1, 20) for _ in range(columns)]
+            for _ in range(rows)]
+
+
+def best_time(function, runs):
+    """
+    The best of `runs` timings of function(), and its result from the last run.
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(args):
+    print("Best of {0} runs, times in ms".format(args.runs))
+    print("{0:>10} {1:>8} {2:>12} {3:>12} {4:>8}".format("grid", "cells", "legacy", "vectorized", "speedup"))
+    for grid in args.grids:
+        rows, columns = (int(size) for size in grid.split('x'))
+        z = random_grid(rows, columns)
+        x = ['column {0}'.format(column) for column in range(columns)]
+        y = list(range(2000 - rows, 2000))
+        heatmap = _annotated_heatmap._AnnotatedHeatmap(z, x, y, None, 'Viridis', [], False)
+
+        legacy, legacy_result = best_time(lambda: legacy_annotations(heatmap), args.runs)
+        vectorized, result = best_time(heatmap.make_annotations, args.runs)
+        assert [annotation.to_plotly_json() for annotation in legacy_result] == result, \
+            "The annotations differ on a {0} grid".format(grid)
+        print("{0:>10} {1:>8} {2:>12.1f} {3:>12.1f} {4:>7.1f}x".format(
+            grid, rows * columns, legacy * 1000, vectorized * 1000, legacy / vectorized))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark annotated heatmap annotations')
+    parser.add_argument("-g", "--grids", dest="grids", nargs="+", default=['100x12', '1000x365'],
+                        help="grid sizes to time, as rows x columns")
+    parser.add_argument("-n", "--runs", dest="runs", type=int, default=3,
+                        help="number of times to time each, the best is reported")
+    main(parser.parse_args())
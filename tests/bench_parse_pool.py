@@ -0,0 +1,97 @@
+"""
+Time a fully cached re-ingest of a few thousand shows, parsing in the main process and on ParsePools of a few sizes.
+The pages are synthetic cards served from memory, as they would be from the HTTP cache, with no parse cache, so the
+run is all parsing and writing. Throughput should go up with the number of processes, up to the number of cores.
+With --latency, each page instead takes that long to arrive, downloaded a few at a time by a PageFetcher as in a real
+ingest, and the pool parses pages as they arrive. There the fetch is the bottleneck, and the pool should do little
+better than parsing in the main process.
+
+Run with e.g.
+    python -m tests.bench_parse_pool
+    python -m tests.bench_parse_pool --shows 5000 --processes 1 2 4 8 --matches 20
+    python -m tests.bench_parse_pool --shows 500 --latency 0.05 --jobs 4
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+import graps
+from tests import corpus
+from tests.synthetic_pages import synthetic_show_page
+
+
+def ingest(entries, pages, processes, latency=0, jobs=1):
+    """
+    Run the show entries through parse_workers into a fresh in-memory database, parsing on `processes` processes.
+    With a `latency`, pages are fetched `jobs` at a time by a PageFetcher, each taking `latency` seconds to arrive.
+    :return: the wall time in seconds, and the number of appearances stored
+    """
+    urls = [page for entry in entries for page in graps.get_pages(entry)]
+    fetcher = None
+    fetch = pages.get
+    if latency:
+        def slow_fetch(url):
+            time.sleep(latency)
+            return pages.get(url)
+        fetcher = corpus.CorpusFetcher([url for url, _, _ in urls], slow_fetch, max_workers=jobs, rate=0)
+        fetch = fetcher.get
+    graps.conn = sqlite3.connect(':memory:')
+    graps.c = graps.conn.cursor()
+    graps.writer = graps.BatchWriter(graps.conn, 50)
+    graps.create_tables()
+    start = time.perf_counter()
+    try:
+        if processes > 1:
+            with graps.ParsePool(urls, pages.get, processes, fetcher=fetcher) as pool:
+                for entry in entries:
+                    graps.parse_workers(entry, pool.fetch, parse=pool.parse)
+        else:
+            for entry in entries:
+                graps.parse_workers(entry, fetch)
+        graps.writer.flush()
+        elapsed = time.perf_counter() - start
+    finally:
+        graps.writer = None
+        if fetcher is not None:
+            fetcher.close()
+    return elapsed, graps.conn.execute('SELECT count(*) FROM appearances').fetchone()[0]
+
+
+def main(args):
+    graps.args = corpus.graps_args()
+    pages = {}
+    for number in range(args.shows):
+        # A handful of distinct cards, under different show IDs
+        page = synthetic_show_page(args.matches, 4, seed=number % 10)
+        pages[corpus.corpus_url(800000 + number)] = page.encode('utf-8')
+    entries = list(pages)
+
+    print("{0} shows of {1} matches, {2} cores".format(args.shows, args.matches, os.cpu_count()))
+    if args.latency:
+        print("Pages take {0} s each to arrive, {1} at a time".format(args.latency, args.jobs))
+    print("{0:>10} {1:>10} {2:>10} {3:>10}".format("processes", "seconds", "shows/s", "speedup"))
+    baseline = None
+    expected = None
+    for processes in args.processes:
+        elapsed, appearances = ingest(entries, pages, processes, args.latency, args.jobs)
+        assert expected is None or appearances == expected, "The ingest on {0} processes differs".format(processes)
+        expected = appearances
+        baseline = baseline or elapsed
+        print("{0:>10} {1:>10.2f} {2:>10.0f} {3:>9.1f}x".format(processes, elapsed, args.shows / elapsed,
+                                                               baseline / elapsed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark parsing pages on a process pool')
+    parser.add_argument("-s", "--shows", dest="shows", type=int, default=2000,
+                        help="number of shows to ingest")
+    parser.add_argument("-m", "--matches", dest="matches", type=int, default=10,
+                        help="number of matches on each synthetic card")
+    parser.add_argument("-p", "--processes", dest="processes", nargs="+", type=int, default=[1, 2, 4],
+                        help="numbers of parse processes to run with, 1 parses in the main process")
+    parser.add_argument("-l", "--latency", dest="latency", type=float, default=0,
+                        help="seconds each page takes to arrive, 0 serves them straight from memory")
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=4,
+                        help="number of pages fetched at once when there's a latency")
+    main(parser.parse_args())
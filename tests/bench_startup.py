@@ -0,0 +1,88 @@
+"""
+Time how long the dashboard takes to start: importing app.py, and then serving the first page load (the page, its
+layout, and the user's dashboard). Each run is a fresh Python process, against the offline test corpus, so nothing is
+left over from the last run. It's run without a snapshot, so the first page load runs the queries and builds the
+figures, and with one from snapshot.py.
+
+Run with e.g.
+    python -m tests.bench_startup
+    python -m tests.bench_startup --runs 10
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import snapshot
+from test_offline import ingest_offline
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in the new process, in the directory with the database. urllib is used rather than requests, to keep the
+# client's own imports out of the timings.
+STARTUP_SCRIPT = '''
+import time
+start = time.perf_counter()
+import json, sys, threading, urllib.request
+sys.path.insert(0, {root!r})
+import app
+imported = time.perf_counter()
+from werkzeug.serving import make_server
+server = make_server('127.0.0.1', 0, app.app.server, threaded=True)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+base = 'http://127.0.0.1:{{0}}'.format(server.server_port)
+urllib.request.urlopen(base + '/').read()
+urllib.request.urlopen(base + '/_dash-layout').read()
+body = {{'output': 'dashboard.children', 'outputs': {{'id': 'dashboard', 'property': 'children'}},
+         'inputs': [{{'id': 'url', 'property': 'pathname', 'value': '/'}}], 'state': [], 'changedPropIds': []}}
+request = urllib.request.Request(base + '/_dash-update-component', data=json.dumps(body).encode('utf-8'),
+                                 headers={{'Content-Type': 'application/json'}})
+urllib.request.urlopen(request).read()
+served = time.perf_counter()
+server.shutdown()
+print(json.dumps({{'import': imported - start, 'first_request': served - imported,
+                  'modules': sorted(name for name in ['pandas', 'numpy', 'plotly.figure_factory'] if name in sys.modules)}}))
+'''
+
+
+def start_dashboard(directory):
+    """
+    Start the dashboard in a new process, and serve it its first page load.
+    :return: the process wall time, and the import and first request times and heavy modules loaded, as timed in it
+    """
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-W', 'ignore', '-c', STARTUP_SCRIPT.format(root=ROOT_DIR)],
+                            cwd=directory, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    wall = time.perf_counter() - start
+    return wall, json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main(args):
+    directory = tempfile.mkdtemp()
+    try:
+        ingest_offline(path=os.path.join(directory, 'thedatabase.sqlite3')).close()
+        print("Median of {0} runs, times in ms".format(args.runs))
+        print("{0:>10} {1:>8} {2:>14} {3:>8}  {4}".format("start", "import", "first request", "total", "loaded"))
+        for mode in ['live', 'snapshot']:
+            if mode == 'snapshot':
+                snapshot.write_snapshot(os.path.join(directory, 'thedatabase.sqlite3'), 'default',
+                                        os.path.join(directory, snapshot.SNAPSHOT_DIR))
+            runs = [start_dashboard(directory) for _ in range(args.runs)]
+            print("{0:>10} {1:>8.0f} {2:>14.0f} {3:>8.0f}  {4}".format(
+                mode, statistics.median(timings['import'] for _, timings in runs) * 1000,
+                statistics.median(timings['first_request'] for _, timings in runs) * 1000,
+                statistics.median(wall for wall, _ in runs) * 1000, ', '.join(runs[-1][1]['modules']) or '-'))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark dashboard start up')
+    parser.add_argument("-n", "--runs", dest="runs", type=int, default=5,
+                        help="number of times to start the dashboard in each mode, the median is reported")
+    main(parser.parse_args())
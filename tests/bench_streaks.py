@@ -0,0 +1,98 @@
+"""
+Time the streak calculation on synthetic monthly show histories, decades long, against the original iterrows loop.
+
+Run with e.g.
+    python -m tests.bench_streaks
+    python -m tests.bench_streaks --years 10 100 1000 --gap-chance 0.1
+"""
+import argparse
+import random
+import time
+
+import pandas
+
+from streaks import find_streaks, latest_and_longest
+
+
+def synthetic_months(years, gap_chance=0.2, seed=0):
+    """
+    Months from 1900 onwards with at least one show, skipping each month with probability `gap_chance`, as the
+    show_year and show_month str columns the dashboard query returns.
+    """
+    rng = random.Random(seed)
+    rows = [("{0:04d}".format(1900 + year), "{0:02d}".format(month))
+            for year in range(years) for month in range(1, 13) if rng.random() >= gap_chance]
+    return pandas.DataFrame(rows, columns=['show_year', 'show_month'])
+
+
+def legacy_streak_continues(last_row, current_row):
+    ly = int(last_row['show_year'])
+    lm = int(last_row['show_month'])
+    ry = int(current_row['show_year'])
+    rm = int(current_row['show_month'])
+    return (lm == rm - 1) or (lm == 12 and rm == 1 and ly == ry - 1)
+
+
+def legacy_streaks(streaks_df):
+    """
+    The original loop from app.py, returning the latest and longest (start row, end row, count).
+    """
+    last = None
+    streak_start = None
+    streak_count = 1
+    longest_streak = None
+    for index, row in streaks_df.iterrows():
+        if streak_start is None:
+            streak_start = row
+        else:
+            if legacy_streak_continues(last, row):
+                streak_count = streak_count + 1
+            else:
+                if longest_streak is None or streak_count >= longest_streak[2]:
+                    longest_streak = (streak_start, last, streak_count)
+                streak_start = row
+                streak_count = 1
+        last = row
+    latest_streak = (streak_start, last, streak_count)
+    if longest_streak is None or latest_streak[2] >= longest_streak[2]:
+        longest_streak = latest_streak
+    return latest_streak, longest_streak
+
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(args):
+    print("Best of {0} runs, times in ms".format(args.repeat))
+    print("{0:>8} {1:>8} {2:>12} {3:>12} {4:>8}".format("years", "months", "iterrows", "vectorized", "speedup"))
+    for years in args.years:
+        streaks_df = synthetic_months(years, args.gap_chance)
+
+        def vectorized():
+            return latest_and_longest(find_streaks(streaks_df['show_year'], streaks_df['show_month']))
+        latest, longest = vectorized()
+        legacy_latest, legacy_longest = legacy_streaks(streaks_df)
+        assert longest.count == legacy_longest[2] and latest.count == legacy_latest[2]
+
+        legacy = best_time(lambda: legacy_streaks(streaks_df), args.repeat)
+        new = best_time(vectorized, args.repeat)
+        print("{0:>8} {1:>8} {2:>12.2f} {3:>12.2f} {4:>7.0f}x".format(years, len(streaks_df), legacy * 1000,
+                                                                     new * 1000, legacy / new))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the streak calculation on synthetic show histories')
+    parser.add_argument("-y", "--years", dest="years", nargs="+", type=int, default=[10, 50, 200],
+                        help="lengths of the synthetic histories in years")
+    parser.add_argument("-g", "--gap-chance", dest="gap_chance", type=float, default=0.2,
+                        help="chance of a month having no shows")
+    parser.add_argument("-n", "--repeat", dest="repeat", type=int, default=5,
+                        help="number of runs of each, the fastest is reported")
+    main(parser.parse_args())
@@ -0,0 +1,150 @@
+"""
+Time the dashboard's worker queries against a database with the old TEXT worker IDs (schema version 1), then migrate
+it to INTEGER worker keys (version 2) and time them again. The database is synthetic: a few users, each with thousands
+of shows and a card of wrestlers on each, some of them plain text names rather than Cagematch profiles. The queries are
+run unmemoized, and the database size is compared after a VACUUM.
+
+Run with e.g.
+    python -m tests.bench_worker_keys
+    python -m tests.bench_worker_keys --users 4 --shows 10000 --workers 50000 --repeat 5
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import graps
+from queries import DataStore
+from tests import corpus
+
+# The tables whose worker_id changed, as they were in schema version 1
+V1_TABLES = {
+    'workers': 'CREATE TABLE "workers" ("worker_id" TEXT PRIMARY KEY, "name" TEXT)',
+    'appearances': '''CREATE TABLE "appearances" ("user_id" TEXT NOT NULL, "worker_id" TEXT, "show_id" TEXT,
+                      UNIQUE("user_id", "worker_id", "show_id"))''',
+    'worker_appearances': '''CREATE TABLE "worker_appearances" ("user_id" TEXT NOT NULL, "worker_id" TEXT,
+                             "appearances" INTEGER, PRIMARY KEY ("user_id", "worker_id"))''',
+}
+
+
+def build_v1_database(path, users, shows, workers, card, seed=0):
+    """
+    Write a version 1 database of synthetic shows. One worker in seven is a plain text name.
+    """
+    rng = random.Random(seed)
+    worker_ids = [str(100000 + number) if number % 7 else "Plain Text Wrestler {0}".format(number)
+                  for number in range(workers)]
+    conn = sqlite3.connect(path)
+    with conn:
+        for table, create in graps.CREATE_TABLES.items():
+            conn.execute(V1_TABLES.get(table, create))
+        for index in graps.CREATE_INDEXES:
+            conn.execute(index)
+        conn.executemany('INSERT INTO promotions VALUES (?,?)', [(number, "Promotion {0}".format(number))
+                                                                for number in range(100)])
+        conn.executemany('INSERT INTO workers VALUES (?,?)', [(worker_id, "Wrestler {0}".format(worker_id))
+                                                             for worker_id in worker_ids])
+        for user in range(users):
+            user_id = "user{0}".format(user)
+            conn.executemany('INSERT INTO shows VALUES (?,?,?,?,?,?,?,?)',
+                             [(user_id, str(number), "Show {0}".format(number), "Arena",
+                               "{0}-{1:02d}-{2:02d}".format(1990 + number % 30, number % 12 + 1, number % 28 + 1),
+                               rng.randrange(100), corpus.corpus_url(number), 0) for number in range(shows)])
+            conn.executemany('INSERT OR IGNORE INTO appearances VALUES (?,?,?)',
+                             [(user_id, rng.choice(worker_ids), str(number))
+                              for number in range(shows) for _ in range(card)])
+        for statement in graps.REBUILD_ROLLUPS:
+            conn.execute(statement)
+        conn.execute('PRAGMA user_version = 1')
+    conn.close()
+
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def time_queries(path, user, repeat):
+    """
+    Time the dashboard's queries that join or filter on worker_id, plus the rebuild of the worker_appearances rollup.
+    :return: a dict of query name to best time in seconds
+    """
+    store = DataStore(path)
+    store.data_version()
+    worker = store.scalar('SELECT worker_id FROM worker_appearances WHERE user_id = ? ORDER BY appearances DESC '
+                          'LIMIT 1', (user,))
+    queries = {
+        'worker_count': lambda: DataStore.worker_count.__wrapped__(store, user),
+        'appearances_df': lambda: DataStore.appearances_df.__wrapped__(store, user),
+        'workers_df': lambda: DataStore.workers_df.__wrapped__(store, user),
+        'top-wrestlers page': lambda: DataStore.table_page.__wrapped__(store, user, 'top-wrestlers', 5, 10,
+                                                                       (('name', 'asc'),), ''),
+        'top-wrestlers filter': lambda: DataStore.table_count.__wrapped__(store, user, 'top-wrestlers',
+                                                                          '{name} contains "1"'),
+        'worker heatmap': lambda: DataStore.shows_heatmap_df.__wrapped__(store, user, None, worker),
+        'rollup rebuild': lambda: store.conn.execute('''SELECT user_id, worker_id, count(*) FROM appearances
+                                                        GROUP BY user_id, worker_id''').fetchall(),
+    }
+    return {name: best_time(query, repeat) for name, query in queries.items()}
+
+
+def vacuumed_size(path):
+    conn = sqlite3.connect(path)
+    conn.execute('VACUUM')
+    conn.close()
+    return os.path.getsize(path)
+
+
+def main(args):
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'thedatabase.sqlite3')
+        build_v1_database(path, args.users, args.shows, args.workers, args.card)
+        size_before = vacuumed_size(path)
+        before = time_queries(path, 'user0', args.repeat)
+
+        graps.args = corpus.graps_args()
+        graps.conn = sqlite3.connect(path)
+        graps.c = graps.conn.cursor()
+        start = time.perf_counter()
+        graps.create_tables()
+        migration = time.perf_counter() - start
+        graps.conn.close()
+        size_after = vacuumed_size(path)
+        after = time_queries(path, 'user0', args.repeat)
+
+        appearances = args.users * args.shows * args.card
+        print("{0} users, {1} shows each, about {2} appearances, {3} workers".format(
+            args.users, args.shows, appearances, args.workers))
+        print("Best of {0} runs, times in ms".format(args.repeat))
+        print("{0:>22} {1:>12} {2:>12} {3:>8}".format("query", "TEXT keys", "INTEGER keys", "speedup"))
+        for name in before:
+            print("{0:>22} {1:>12.2f} {2:>12.2f} {3:>7.1f}x".format(name, before[name] * 1000, after[name] * 1000,
+                                                                     before[name] / after[name]))
+        print("Migration took {0:.2f} s, database {1:.1f} MiB before and {2:.1f} MiB after".format(
+            migration, size_before / 1024 / 1024, size_after / 1024 / 1024))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the worker queries with TEXT and INTEGER worker keys')
+    parser.add_argument("-u", "--users", dest="users", type=int, default=4,
+                        help="number of users")
+    parser.add_argument("-s", "--shows", dest="shows", type=int, default=5000,
+                        help="number of shows each user has")
+    parser.add_argument("-w", "--workers", dest="workers", type=int, default=20000,
+                        help="number of distinct workers")
+    parser.add_argument("-c", "--card", dest="card", type=int, default=25,
+                        help="number of workers on each show")
+    parser.add_argument("-n", "--repeat", dest="repeat", type=int, default=3,
+                        help="number of runs of each query, the fastest is reported")
+    main(parser.parse_args())
@@ -0,0 +1,94 @@
+"""
+Time the parser on synthetic show pages of a few sizes, with no network access, so parser regressions show up as
+numbers. Times parse_show_info, parse_worker_list and filter_excluded on a page that has already been through
+BeautifulSoup, and the full parse_workers path (soup, parse, filter and store in an in-memory database).
+
+Run with e.g.
+    python -m tests.benchmark
+    python -m tests.benchmark --sizes 10 100 500 --repeat 5 --parse-mode full
+"""
+import argparse
+import sqlite3
+import time
+
+import graps
+from graps import ShowType
+from tests import corpus
+from tests.synthetic_pages import synthetic_show_page
+
+URL = corpus.corpus_url("990001")
+
+
+def best_time(function, repeat):
+    """
+    Run a function `repeat` times, and return the fastest run in seconds.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_parse_workers(raw_html, repeat):
+    """
+    Time parse_workers for a partial show entry of the page, storing into a fresh in-memory database each run.
+    """
+    entry = {'partial': {'url': URL, 'exclude': [1]}}
+
+    def run():
+        graps.conn = sqlite3.connect(':memory:')
+        graps.c = graps.conn.cursor()
+        graps.writer = graps.BatchWriter(graps.conn, 1)
+        graps.create_tables()
+        graps.parse_workers(entry, lambda url: raw_html)
+        graps.writer.flush()
+    try:
+        return best_time(run, repeat)
+    finally:
+        graps.writer = None
+
+
+def bench_size(matches, workers_per_match, repeat, parse_mode):
+    """
+    Time each stage of the parser on a synthetic page with the given number of matches.
+    :return: a dict of stage name to the best time in seconds, and the page size in bytes
+    """
+    raw_html = synthetic_show_page(matches, workers_per_match).encode('utf-8')
+    html = graps.make_soup(raw_html, parse_mode)
+    workers = graps.parse_worker_list(html)
+    exclude = list(range(1, matches + 1, 2))
+    times = {
+        'make_soup': best_time(lambda: graps.make_soup(raw_html, parse_mode), repeat),
+        'parse_show_info': best_time(lambda: graps.parse_show_info(html, URL, ShowType.PARTIAL), repeat),
+        'parse_worker_list': best_time(lambda: graps.parse_worker_list(html), repeat),
+        'filter_excluded': best_time(lambda: graps.filter_excluded(workers, exclude, html), repeat),
+        'parse_workers': bench_parse_workers(raw_html, repeat),
+    }
+    return times, len(raw_html)
+
+
+def main(args):
+    graps.args = corpus.graps_args(parse_mode=args.parse_mode)
+    stages = ['make_soup', 'parse_show_info', 'parse_worker_list', 'filter_excluded', 'parse_workers']
+    print("Best of {0} runs, {1} parse mode, times in ms".format(args.repeat, args.parse_mode))
+    print("{0:>8} {1:>8} ".format("matches", "KB") + " ".join("{0:>17}".format(stage) for stage in stages))
+    for matches in args.sizes:
+        times, size = bench_size(matches, args.workers_per_match, args.repeat, args.parse_mode)
+        print("{0:>8} {1:>8.0f} ".format(matches, size / 1024) +
+              " ".join("{0:>17.2f}".format(times[stage] * 1000) for stage in stages))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the show page parser on synthetic pages')
+    parser.add_argument("-s", "--sizes", dest="sizes", nargs="+", type=int, default=[10, 50, 200],
+                        help="numbers of matches on the synthetic cards")
+    parser.add_argument("-w", "--workers-per-match", dest="workers_per_match", type=int, default=4,
+                        help="number of wrestlers in each match")
+    parser.add_argument("-n", "--repeat", dest="repeat", type=int, default=3,
+                        help="number of runs of each stage, the fastest is reported")
+    parser.add_argument("--parse-mode", dest="parse_mode", choices=['targeted', 'full'], default='targeted',
+                        help="how pages are passed through BeautifulSoup")
+    main(parser.parse_args())
@@ -0,0 +1,89 @@
+"""
+The offline corpus of saved show pages in tests/pages, and a fetch function that serves them in place of simple_get,
+so the parser can be run end to end with no network access.
+"""
+import argparse
+import glob
+import os
+from urllib.parse import parse_qs, urlparse
+
+import yaml
+from bs4 import BeautifulSoup
+
+from url_loading import PageFetcher
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGES_DIR = os.path.join(TESTS_DIR, "pages")
+OFFLINE_SHOWS = os.path.join(TESTS_DIR, "test_offline.yaml")
+# Benchmark sized pages live in pages/bench, so they're kept out of the exhaustive parity tests
+PAGES = sorted(glob.glob(os.path.join(PAGES_DIR, "*.html")))
+
+# The Cagematch show ID each page is served under, the URLs in test_offline.yaml use these
+CORPUS = {
+    "900001": "normal.html",
+    "900002": "tag_team_without_profile.html",
+    "900003": "partial.html",
+    "900004": "merge_show_1.html",
+    "900005": "merge_show_2.html",
+    "900006": "bench/huge_card.html",
+}
+
+
+def corpus_url(show_id):
+    return "https://www.cagematch.net/?id=1&nr={0}".format(show_id)
+
+
+def read_page(name):
+    """
+    Return the raw content of a saved page, by its path relative to tests/pages, or its full path.
+    """
+    with open(os.path.join(PAGES_DIR, name), 'rb') as page:
+        return page.read()
+
+
+def load_page(name):
+    """
+    Return a saved page passed through BeautifulSoup, as the full page parse would.
+    """
+    return BeautifulSoup(read_page(name), 'html.parser')
+
+
+def fetch(url):
+    """
+    Return the saved page for a corpus URL, or None for anything else, like simple_get would for a failed request.
+    """
+    show_id = parse_qs(urlparse(url).query).get('nr', [None])[0]
+    if show_id not in CORPUS:
+        return None
+    return read_page(CORPUS[show_id])
+
+
+class CorpusFetcher(PageFetcher):
+    """
+    A PageFetcher that serves pages with `fetch`, the corpus by default, on its threads rather than from the network.
+    """
+
+    def __init__(self, urls, fetch_page=None, **kwargs):
+        self.fetch_page = fetch_page or fetch
+        super(CorpusFetcher, self).__init__(urls, **kwargs)
+
+    def fetch(self, url):
+        return self.fetch_page(url)
+
+
+def load_offline_shows():
+    """
+    Load the show entries in test_offline.yaml, which cover every page in the corpus.
+    """
+    with open(OFFLINE_SHOWS, 'r') as yamlfile:
+        return yaml.safe_load(yamlfile)
+
+
+def graps_args(**overrides):
+    """
+    The command line options graps reads from its module level `args`, with their defaults.
+    """
+    options = dict(user='default', verbose=False, dntranslate=False, parse_mode='targeted', parse_stats=False,
+                   parse_memory=False)
+    options.update(overrides)
+    return argparse.Namespace(**options)
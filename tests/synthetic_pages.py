@@ -0,0 +1,133 @@
+"""
+Build Cagematch style show pages offline, with the same structure as the real thing: the InformationBoxTable, the
+Matches list, and the All Workers ('Comments Font9') list, wrapped in some page furniture.
+Used to make the pages in tests/pages, and synthetic cards of any size for the benchmarks.
+
+Write a synthetic page to a file with e.g.
+    python -m tests.synthetic_pages --matches 200 --workers-per-match 4 -o big_card.html
+"""
+import argparse
+import random
+
+
+def link(nr, name, content_type=2):
+    """
+    A profile link, as it appears on Cagematch. content_type is the ?id= value, 2 for wrestlers.
+    """
+    return '<a href="?id={0}&amp;nr={1}&amp;name={2}">{3}</a>'.format(content_type, nr, name.replace(' ', '+'), name)
+
+
+def show_page(show_name, date_str, promotion, arena, matches, all_workers, comments=1):
+    """
+    Build the HTML for a show page.
+    :param show_name: the 'Name of the event' text
+    :param date_str: the date, formatted dd.mm.yyyy
+    :param promotion: the promotion link
+    :param arena: the arena link
+    :param matches: a list of (match type, match result HTML) pairs, in card order
+    :param all_workers: a list of worker links or plain text names, for the All Workers list
+    :param comments: the number of user comments to pad the page with
+    :return: the page str
+    """
+    info = ''.join('<div class="InformationBoxRow"><div class="InformationBoxTitle">{0}</div>'
+                   '<div class="InformationBoxContents">{1}</div></div>'.format(title, contents)
+                   for title, contents in [('Name of the event:', show_name),
+                                           ('Date:', '<a href="?id=1&amp;view=results&amp;dateFrom={0}">{0}</a>'
+                                            .format(date_str)),
+                                           ('Promotion:', promotion),
+                                           ('Type:', 'Event'),
+                                           ('Location:', 'London, England, United Kingdom'),
+                                           ('Arena:', arena),
+                                           ('Broadcast type:', 'Live event')])
+    # No whitespace between the Match divs, the parser iterates over the children of the Matches div
+    match_divs = ''.join('<div class="Match"><div class="MatchType">{0}</div><div class="MatchResults">{1}</div>'
+                         '<div class="MatchRecommendedLine"></div></div>'.format(match_type, result)
+                         for match_type, result in matches)
+    comment_divs = ''.join('<div class="Comment"><div class="CommentHeader">Fan {0}, 22.04.2019</div>'
+                           '<div class="CommentContents">Great show, <a href="?id=2&amp;nr=16">WALTER</a> was the '
+                           'highlight.</div></div>'.format(i) for i in range(comments))
+    return '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{0} &laquo; Events Database &laquo; CAGEMATCH - The Internet Wrestling Database</title>
+<link rel="stylesheet" href="/2.0/css/main.css">
+<script src="/2.0/js/main.js"></script>
+</head>
+<body>
+<div id="TopMenu"><ul><li><a href="?id=0">Home</a></li><li><a href="?id=1">Events</a></li><li><a href="?id=2">Wrestlers</a></li><li><a href="?id=8">Promotions</a></li></ul></div>
+<div class="LayoutContent">
+<h1 class="TextHeader">{0}</h1>
+<div class="TextHeaderCover"></div>
+<div class="InformationBoxTable">{1}</div>
+<div class="Caption">Results</div>
+<div class="Matches">{2}</div>
+<div class="Caption">All workers</div>
+<div class="Comments Font9">{3}</div>
+<div class="Caption">Comments</div>
+<div class="CommentBox">{4}</div>
+</div>
+<div id="Footer">&copy; cagematch.net</div>
+</body>
+</html>
+'''.format(show_name, info, match_divs, ', '.join(all_workers), comment_divs)
+
+
+def synthetic_show_page(matches=10, workers_per_match=2, roster=None, plain_text_every=7, comments=20, seed=0):
+    """
+    Build a show page with a generated card. Each match has `workers_per_match` wrestlers drawn from a roster, so the
+    same wrestler can appear in more than one match, and every `plain_text_every`th wrestler has no profile link.
+    :param matches: the number of matches on the card
+    :param workers_per_match: the number of wrestlers in each match
+    :param roster: the number of distinct wrestlers to draw from, defaults to enough for everyone to wrestle once
+    :param plain_text_every: how often a wrestler is plain text rather than a profile link, 0 for never
+    :param comments: the number of user comments to pad the page with
+    :param seed: seed for the random card, so pages can be reproduced
+    :return: the page str
+    """
+    rng = random.Random(seed)
+    roster = roster or matches * workers_per_match
+
+    def worker(i):
+        name = "Synthetic Wrestler {0}".format(i)
+        if plain_text_every and i % plain_text_every == plain_text_every - 1:
+            return name
+        return link(100000 + i, name)
+
+    card = []
+    on_card = set()
+    for match in range(matches):
+        if roster >= matches * workers_per_match:
+            wrestlers = list(range(match * workers_per_match, (match + 1) * workers_per_match))
+        else:
+            wrestlers = rng.sample(range(roster), workers_per_match)
+        on_card.update(wrestlers)
+        half = max(1, workers_per_match // 2)
+        winners = ' &amp; '.join(worker(i) for i in wrestlers[:half])
+        losers = ' &amp; '.join(worker(i) for i in wrestlers[half:])
+        result = "{0} defeat {1} ({2}:{3:02d})".format(winners, losers, rng.randint(2, 30), rng.randint(0, 59))
+        card.append(("Match", result))
+    return show_page("Synthetic Show - {0} matches".format(matches), "01.01.2019",
+                     link(1, "Synthetic Promotion", 8), link(1, "Synthetic Arena", 36),
+                     card, [worker(i) for i in sorted(on_card)], comments)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic Cagematch show page')
+    parser.add_argument("-m", "--matches", type=int, default=10, help="number of matches on the card")
+    parser.add_argument("-w", "--workers-per-match", type=int, default=2, help="number of wrestlers in each match")
+    parser.add_argument("-r", "--roster", type=int, default=None, help="number of distinct wrestlers to draw from")
+    parser.add_argument("-p", "--plain-text-every", type=int, default=7,
+                        help="make every nth wrestler plain text, 0 for never")
+    parser.add_argument("-c", "--comments", type=int, default=20, help="number of user comments to pad the page with")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="random seed")
+    parser.add_argument("-o", "--output", metavar="FILE", help="file to write, defaults to stdout")
+    args = parser.parse_args()
+
+    page = synthetic_show_page(args.matches, args.workers_per_match, args.roster, args.plain_text_every,
+                               args.comments, args.seed)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(page)
+    else:
+        print(page)
@@ -3,39 +3,321 @@ Some URL loading methods I jacked from the web while reading up on how to start.
 No cops allowed
 MDK
 """
-from requests import get
-from requests.exceptions import RequestException
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import closing
+from datetime import timedelta
+from urllib.parse import urlparse
+import argparse
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
 import requests_cache
+from urllib3.util.retry import Retry
+
+from metrics import ingest_metrics
+
+CACHE_NAME = 'cagematch_cache'
+
+# How long a cached page is served before it's revalidated with the site, for pages that don't match a URL class below
+DEFAULT_EXPIRY = timedelta(days=7)
+
+# The port a URL without one is fetched on, by scheme
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Responses that are worth trying again, after a backoff or the wait the site asks for in Retry-After
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+SHOW_PAGES = re.compile(r'cagematch\.net/\?id=1&nr=')
+
+# How long cached pages are served before they're revalidated, by URL class. The first matching pattern is used.
+# Results for shows that have happened rarely change, and a revalidation only costs a 304 if they haven't.
+URL_EXPIRY = {
+    SHOW_PAGES: timedelta(days=30),
+    re.compile(r'cagematch\.net/'): timedelta(days=1),
+}
+
+# Settings for the sessions made by make_session, see configure_session
+session_settings = {'pool_size': 10, 'retries': 3, 'backoff': 1.0}
+
+# The pooled session simple_get uses when it isn't given one
+shared_session = None
+shared_session_lock = threading.Lock()
+
+# The URLs that could not be fetched, and why
+failed_urls = {}
+
+
+def host_key(url):
+    """
+    The host and port `url` is fetched from, which requests are rate limited by.
+    """
+    parsed = urlparse(url)
+    return parsed.hostname, parsed.port or DEFAULT_PORTS.get(parsed.scheme)
+
+
+class HostRateLimiter(object):
+    """
+    Spaces out requests to the same host, so that at most `rate` requests per second are started against any one
+    host, however many threads are fetching.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, url):
+        """
+        Block until a request to the host of `url` is allowed to start.
+        """
+        self.wait_for_host(host_key(url))
+
+    def wait_for_host(self, host):
+        """
+        Block until a request to `host`, a (host, port) pair as host_key returns, is allowed to start.
+        """
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RateLimitedRetry(Retry):
+    """
+    Retry that waits on a HostRateLimiter before each retry, after any backoff or Retry-After wait. urllib3 retries
+    inside HTTPAdapter.send, so without this only the first attempt at a request would be rate limited.
+    """
+
+    def __init__(self, *args, limiter=None, host=None, **kwargs):
+        self.limiter = limiter
+        self.host = host
+        super(RateLimitedRetry, self).__init__(*args, **kwargs)
+
+    def new(self, **kw):
+        retry = super(RateLimitedRetry, self).new(**kw)
+        retry.limiter = self.limiter
+        retry.host = self.host
+        return retry
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        retry = super(RateLimitedRetry, self).increment(method, url, response, error, _pool, _stacktrace)
+        if _pool is not None:
+            retry.host = (_pool.host, _pool.port)
+        return retry
+
+    def sleep(self, response=None):
+        super(RateLimitedRetry, self).sleep(response)
+        if self.limiter is not None and self.host is not None:
+            self.limiter.wait_for_host(self.host)
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    Transport adapter that waits on a HostRateLimiter before each request goes out on the wire, and, through its
+    RateLimitedRetry, before each retry of it.
+    Responses served by requests_cache never reach the adapter, so cached pages are not throttled.
+    """
+
+    def __init__(self, limiter=None, **kwargs):
+        self.limiter = limiter
+        super(RateLimitedAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if self.limiter is not None:
+            self.limiter.wait(request.url)
+        return super(RateLimitedAdapter, self).send(request, **kwargs)
+
+
+def configure_session(pool_size=10, retries=3, backoff=1.0):
+    """
+    Set up the connection pool and retries for the sessions made from now on, and replace the shared session.
+    :param pool_size: the number of connections kept open to each host
+    :param retries: how many times a request is retried after a connection error or a RETRY_STATUSES response
+    :param backoff: the backoff factor, retries wait backoff * 2 ** (retry - 1) seconds unless the site sends a
+    Retry-After header
+    """
+    global shared_session
+    session_settings.update(pool_size=pool_size, retries=retries, backoff=backoff)
+    with shared_session_lock:
+        if shared_session is not None:
+            shared_session.close()
+        shared_session = None
 
 
-def simple_get(url):
+def make_session(limiter=None):
+    """
+    Make a session with a pooled, retrying adapter mounted, which waits on `limiter` before each request if given.
+    The session is cached if the request cache is installed.
+    """
+    retry = RateLimitedRetry(total=session_settings['retries'], backoff_factor=session_settings['backoff'],
+                             status_forcelist=RETRY_STATUSES, respect_retry_after_header=True, raise_on_status=False,
+                             limiter=limiter)
+    adapter = RateLimitedAdapter(limiter, pool_connections=session_settings['pool_size'],
+                                 pool_maxsize=session_settings['pool_size'], max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_shared_session():
+    """
+    The session simple_get uses when it isn't given one, created on first use, so connections are kept alive between
+    calls.
+    """
+    global shared_session
+    with shared_session_lock:
+        if shared_session is None:
+            shared_session = make_session()
+        return shared_session
+
+
+def simple_get(url, session=None):
     """
     Attempts to get the content at `url` by making an HTTP GET request.
     If the content-type of response is some kind of HTML/XML, return the
-    text content, otherwise return None.
+    text content, otherwise return None, and record why in failed_urls.
+    The request is made on `session` if given, or the shared pooled session, so connections are reused. Connection
+    errors and RETRY_STATUSES responses are retried with backoff first, see configure_session.
     """
     try:
-        with closing(get(url, stream=True)) as resp:
-            print("URL: {0} / Used Cache: {1}".format(url, resp.from_cache))
-            if is_good_response(resp):
-                return resp.content
-            else:
-                return None
+        return get_content(session or get_shared_session(), url)
 
     except RequestException as e:
         log_error('Error during requests to {0} : {1}'.format(url, str(e)))
+        failed_urls[url] = str(e)
+        ingest_metrics.count('fetch_failures')
         return None
 
 
+def get_content(session, url):
+    with ingest_metrics.timed('fetch'), closing(session.get(url, stream=True)) as resp:
+        from_cache = getattr(resp, 'from_cache', False)
+        revalidated = getattr(resp, 'revalidated', False)
+        print("URL: {0} / Used Cache: {1}{2}".format(url, from_cache, " (revalidated)" if revalidated else ""))
+        ingest_metrics.count('http_cache_hits' if from_cache else 'http_cache_misses')
+        if revalidated:
+            ingest_metrics.count('http_revalidated')
+        if is_good_response(resp):
+            failed_urls.pop(url, None)
+            if not from_cache:
+                ingest_metrics.count('bytes_downloaded', len(resp.content))
+            return resp.content
+        else:
+            failed_urls[url] = "HTTP {0} {1}".format(resp.status_code, resp.headers.get('Content-Type'))
+            ingest_metrics.count('fetch_failures')
+            return None
+
+
+class PageFetcher(object):
+    """
+    Fetches a list of URLs on a thread pool, in the order given, while callers consume the pages one at a time.
+    `get` blocks until the requested page has arrived, so pages can be processed in their original order while the
+    next few are still downloading. Only `lookahead` pages are fetched ahead of the one being consumed, and each page
+    is let go once it has been handed over, so memory doesn't grow with the length of the list.
+    Each worker thread keeps its own session, with the rate limiter mounted, so connections are reused.
+    """
+
+    def __init__(self, urls, max_workers=4, rate=1.0, lookahead=None):
+        self.limiter = HostRateLimiter(rate)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.lookahead = lookahead or max_workers * 4
+        self.local = threading.local()
+        self.sessions = []
+        self.sessions_lock = threading.Lock()
+        self.pending = deque()
+        queued = set()
+        for url in urls:
+            if url not in queued:
+                queued.add(url)
+                self.pending.append(url)
+        self.futures = {}
+        self.fill()
+
+    def session(self):
+        """
+        The calling thread's session, created on first use.
+        """
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = make_session(self.limiter)
+            self.local.session = session
+            with self.sessions_lock:
+                self.sessions.append(session)
+        return session
+
+    def fetch(self, url):
+        return simple_get(url, self.session())
+
+    def fill(self):
+        """
+        Queue pages from the list until `lookahead` are in flight or waiting to be consumed.
+        """
+        while self.pending and len(self.futures) < self.lookahead:
+            url = self.pending.popleft()
+            self.futures[url] = self.executor.submit(self.fetch, url)
+
+    def future(self, url):
+        """
+        Return a Future for the content at `url`, without waiting for it to arrive. URLs that aren't queued, or that
+        have already been consumed, are sent to the pool now.
+        """
+        future = self.futures.pop(url, None)
+        if future is None:
+            if url in self.pending:
+                self.pending.remove(url)
+            future = self.executor.submit(self.fetch, url)
+        self.fill()
+        return future
+
+    def get(self, url):
+        """
+        Return the content at `url`, as simple_get would. URLs that aren't queued, or that have already been consumed,
+        are fetched on demand.
+        """
+        future = self.futures.pop(url, None)
+        if future is None:
+            if url in self.pending:
+                self.pending.remove(url)
+            self.fill()
+            return self.fetch(url)
+        self.fill()
+        return future.result()
+
+    def close(self):
+        self.pending.clear()
+        for future in self.futures.values():
+            future.cancel()
+        self.executor.shutdown(wait=True)
+        self.futures = {}
+        for session in self.sessions:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 def is_good_response(resp):
     """
     Returns True if the response seems to be HTML, False otherwise.
     """
-    content_type = resp.headers['Content-Type'].lower()
+    content_type = resp.headers.get('Content-Type')
     return (resp.status_code == 200
             and content_type is not None
-            and content_type.find('html') > -1)
+            and content_type.lower().find('html') > -1)
 
 
 def log_error(e):
@@ -47,4 +329,70 @@ def log_error(e):
     print(e)
 
 
-requests_cache.install_cache(cache_name='cagematch_cache', backend='sqlite')
+def configure_cache(cache_name=CACHE_NAME, expire_after=DEFAULT_EXPIRY, urls_expire_after=None):
+    """
+    Install the request cache, so every request made through requests is served from the cache where possible.
+    Once a cached page expires, it's revalidated with the site using its ETag or Last-Modified date, so an unchanged
+    page costs a 304 rather than a full download. If the site can't be reached, the expired copy is used.
+    :param cache_name: the path of the cache database, without the .sqlite extension
+    :param expire_after: how long pages are cached for, as a timedelta or seconds, -1 for never expiring
+    :param urls_expire_after: how long pages are cached for by URL pattern, defaults to URL_EXPIRY
+    """
+    requests_cache.install_cache(cache_name=cache_name, backend='sqlite', expire_after=expire_after,
+                                 urls_expire_after=URL_EXPIRY if urls_expire_after is None else urls_expire_after,
+                                 stale_if_error=True)
+    configure_session(**session_settings)
+
+
+def print_failed_urls():
+    """
+    Print the URLs that could not be fetched, and why.
+    """
+    if failed_urls:
+        print("{0} pages could not be fetched:".format(len(failed_urls)))
+        for url, reason in failed_urls.items():
+            print("  {0}: {1}".format(url, reason))
+
+
+def prune_cache(vacuum=False):
+    """
+    Delete the expired pages from the installed cache. Pruned pages have to be downloaded in full next time, rather
+    than revalidated.
+    :param vacuum: whether to compact the cache database afterwards
+    :return: the number of pages left in the cache
+    """
+    cache = requests_cache.get_cache()
+    # requests-cache 1.1, the last to support Python 3.7, always compacts after deleting, and 1.2 only if asked to
+    cache.delete(expired=True)
+    if vacuum:
+        compact_cache()
+    return len(cache.responses)
+
+
+def compact_cache():
+    """
+    Reclaim the space left behind by deleted and replaced pages in the cache database.
+    """
+    requests_cache.get_cache().responses.vacuum()
+
+
+configure_cache()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Maintain the request cache')
+    parser.add_argument("--prune", dest="prune",
+                        help="delete expired pages from the cache",
+                        action="store_true")
+    parser.add_argument("--vacuum", dest="vacuum",
+                        help="compact the cache database",
+                        action="store_true")
+    args = parser.parse_args()
+
+    before = len(requests_cache.get_cache().responses)
+    if args.prune:
+        print("Pruned {0} of {1} cached pages".format(before - prune_cache(args.vacuum), before))
+    elif args.vacuum:
+        compact_cache()
+    if args.vacuum:
+        print("Compacted {0}.sqlite".format(CACHE_NAME))